@@ -0,0 +1,62 @@
+"""
+Cost of saving one changed key with each database storage backend.
+Run from the repo root: python -m benchmarks.db_backends
+"""
+
+# ©️ Dan Gazizullin, 2021-2023
+# This file is a part of Hikka Userbot
+# 🌐 https://github.com/hikariatama/Hikka
+# You can redistribute it and/or modify it under the terms of the GNU AGPLv3
+# 🔑 https://www.gnu.org/licenses/agpl-3.0.html
+
+import tempfile
+import time
+from pathlib import Path
+
+import ujson
+
+from legacy._db_backends import JournalBackend, JSONBackend, SQLiteBackend
+
+OWNERS = 200
+KEYS = 50
+SAVES = 200
+
+
+def _blobs() -> dict:
+    return {
+        f"owner{owner}": {
+            f"key{key}": ujson.dumps({"value": "x" * 64, "items": list(range(10))})
+            for key in range(KEYS)
+        }
+        for owner in range(OWNERS)
+    }
+
+
+def _measure(backend_class, path: Path) -> float:
+    backend = backend_class(path, 1)
+    blobs = _blobs()
+    backend.write(backend.prepare([], blobs, True))
+
+    start = time.perf_counter()
+    for i in range(SAVES):
+        value = ujson.dumps(i)
+        blobs["owner0"]["key0"] = value
+        backend.write(backend.prepare([("owner0", "key0", value)], blobs, False))
+
+    elapsed = (time.perf_counter() - start) / SAVES
+    assert backend.load()["owner0"]["key0"] == SAVES - 1
+    backend.close()
+    return elapsed
+
+
+def main():
+    print(f"{OWNERS} owners, {KEYS} keys each, one key changed per save")
+    for backend_class in (JSONBackend, JournalBackend, SQLiteBackend):
+        with tempfile.TemporaryDirectory() as path:
+            elapsed = _measure(backend_class, Path(path))
+
+        print(f"{backend_class.name}: {elapsed * 1e3:.2f} ms per save")
+
+
+if __name__ == "__main__":
+    main()
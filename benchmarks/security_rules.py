@@ -0,0 +1,71 @@
+"""
+Targeted security rules lookup with 10k rules.
+Run from the repo root: python -m benchmarks.security_rules
+"""
+
+# ©️ Dan Gazizullin, 2021-2023
+# This file is a part of Hikka Userbot
+# 🌐 https://github.com/hikariatama/Hikka
+# You can redistribute it and/or modify it under the terms of the GNU AGPLv3
+# 🔑 https://www.gnu.org/licenses/agpl-3.0.html
+
+import time
+import timeit
+import types
+
+from legacy.security import SecurityManager
+
+RULES = 10000
+COMMANDS = 50
+MISSING_USER = 10**9
+
+
+def _manager() -> SecurityManager:
+    manager = SecurityManager.__new__(SecurityManager)
+    manager.version = 0
+    manager._sgroups = {}
+    manager._tsec_chat = []
+    manager._tsec_user = [
+        {
+            "target": i,
+            "rule_type": "command",
+            "rule": f"cmd{i % COMMANDS}",
+            "expires": 0 if i % 2 else int(time.time()) + 3600,
+        }
+        for i in range(RULES)
+    ]
+    manager._client = types.SimpleNamespace(loader=types.SimpleNamespace(commands={}))
+    manager._rebuild_rules()
+    return manager
+
+
+def _scan(manager: SecurityManager, user_id: int, command: str) -> bool:
+    """Lookup, which was used before rules were indexed"""
+    return any(
+        info["target"] == user_id
+        and info["rule_type"] == "command"
+        and info["rule"] == command
+        for info in manager._tsec_user.copy()
+    )
+
+
+def _measure(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number
+
+
+def main():
+    manager = _manager()
+    assert manager.check_tsec(1, "cmd1") and _scan(manager, 1, "cmd1")
+    assert not manager.check_tsec(1, "cmd2") and not _scan(manager, 1, "cmd2")
+
+    indexed = _measure(lambda: manager.check_tsec(MISSING_USER, "cmd1"), 10000)
+    scan = _measure(lambda: _scan(manager, MISSING_USER, "cmd1"), 100)
+    rebuild = _measure(manager._rebuild_rules, 20)
+    print(f"{RULES} user rules")
+    print(f"check_tsec miss, indexed: {indexed * 1e6:.2f} us")
+    print(f"check_tsec miss, scan: {scan * 1e6:.2f} us")
+    print(f"rebuild: {rebuild * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Caches bytecode of modules, which are loaded from source strings"""
+
+# ©️ Dan Gazizullin, 2021-2023
+# This file is a part of Hikka Userbot
+# 🌐 https://github.com/hikariatama/Hikka
+# You can redistribute it and/or modify it under the terms of the GNU AGPLv3
+# 🔑 https://www.gnu.org/licenses/agpl-3.0.html
+
+import contextlib
+import hashlib
+import importlib.util
+import logging
+import marshal
+import os
+import sys
+import types
+import typing
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MAX_CACHE_SIZE = 1024 * 1024 * 64  # 64 MB
+# Part of the limit, which is left, when the cache is evicted
+EVICT_RATIO = 0.75
+
+# Approximate size of cache directory. It's counted once and then updated on
+# every store, so the directory is scanned again only when it's over the limit
+_cache_size: typing.Optional[int] = None
+
+
+def _cache_dir() -> Path:
+    from . import main
+
+    return main.BASE_PATH / "bytecode_cache"
+
+
+def _cache_key(source: bytes, origin: str) -> str:
+    digest = hashlib.sha256(importlib.util.MAGIC_NUMBER)
+    digest.update(sys.version.encode())
+    digest.update(b"\0")
+    digest.update(origin.encode())
+    digest.update(b"\0")
+    digest.update(source)
+    return digest.hexdigest()
+
+
+def _evict(cache_dir: Path) -> int:
+    """
+    Remove least recently used files, if cache is over the limit
+    :return: Size of the remaining files
+    """
+    files = []
+    total = 0
+    for file in cache_dir.glob("*.pyc"):
+        with contextlib.suppress(OSError):
+            stat = file.stat()
+            files.append((stat.st_mtime, stat.st_size, file))
+            total += stat.st_size
+
+    if total <= MAX_CACHE_SIZE:
+        return total
+
+    # Least recently used files go first, because they are touched on hit.
+    # Some space is freed in advance, so the next stores don't evict again
+    for _, size, file in sorted(files):
+        with contextlib.suppress(OSError):
+            file.unlink()
+            total -= size
+
+        if total <= MAX_CACHE_SIZE * EVICT_RATIO:
+            break
+
+    return total
+
+
+def _store(path: Path, code: types.CodeType):
+    global _cache_size
+
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = marshal.dumps(code)
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        if _cache_size is not None:
+            _cache_size += len(data)
+
+        if _cache_size is None or _cache_size > MAX_CACHE_SIZE:
+            _cache_size = _evict(path.parent)
+    except Exception:
+        logger.debug("Can't save bytecode cache %s", path, exc_info=True)
+        with contextlib.suppress(OSError):
+            tmp.unlink()
+
+
+def compile_cached(source: bytes, origin: str) -> types.CodeType:
+    """
+    Compile module source, reusing bytecode, saved on previous runs
+    :param source: Module source
+    :param origin: Module origin, which is used as code filename
+    :return: Code object
+    """
+    path = _cache_dir() / f"{_cache_key(source, origin)}.pyc"
+    try:
+        code = marshal.loads(path.read_bytes())
+    except FileNotFoundError:
+        pass
+    except Exception:
+        logger.debug("Dropping broken bytecode cache %s", path, exc_info=True)
+        with contextlib.suppress(OSError):
+            path.unlink()
+    else:
+        if isinstance(code, types.CodeType):
+            with contextlib.suppress(OSError):
+                os.utime(path)
+
+            return code
+
+    code = compile(source, origin, "exec", dont_inherit=True)
+    _store(path, code)
+    return code
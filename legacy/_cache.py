@@ -0,0 +1,155 @@
+"""Bounded cache with TTL and LRU eviction, used for Telegram entities"""
+
+# ©️ Dan Gazizullin, 2021-2023
+# This file is a part of Hikka Userbot
+# 🌐 https://github.com/hikariatama/Hikka
+# You can redistribute it and/or modify it under the terms of the GNU AGPLv3
+# 🔑 https://www.gnu.org/licenses/agpl-3.0.html
+
+import collections
+import time
+import typing
+
+
+class NegativeRecord:
+    """Remembers failed lookup, so it's not repeated until the record expires"""
+
+    __slots__ = ("exception",)
+
+    def __init__(self, exception: Exception):
+        self.exception = exception
+
+    def __repr__(self) -> str:
+        return f"NegativeRecord({self.exception!r})"
+
+
+class BoundedCache:
+    """
+    Cache, which holds at most `maxsize` keys. Least recently used keys are
+    evicted first, keys with expired TTL are dropped on access
+    """
+
+    def __init__(self, maxsize: int, negative_ttl: float = 0):
+        """
+        :param maxsize: Maximum number of keys
+        :param negative_ttl: For how long failed lookups are remembered.
+            If it's `0`, they are not cached
+        """
+        self.maxsize = maxsize
+        self.negative_ttl = negative_ttl
+        # key -> (time of saving, time of expiration or 0, value)
+        self._data: typing.OrderedDict[
+            typing.Hashable,
+            typing.Tuple[float, float, typing.Any],
+        ] = collections.OrderedDict()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(
+        self,
+        key: typing.Hashable,
+        max_age: typing.Optional[float] = None,
+        default: typing.Any = None,
+    ) -> typing.Any:
+        """
+        Get value from cache
+        :param key: Key to look up
+        :param max_age: If set, records older than this amount of seconds are ignored
+        :param default: Value to return if key is missing or expired
+        :return: Cached value or `NegativeRecord` for failed lookup
+        """
+        try:
+            ts, expires, value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        now = time.time()
+        if expires and expires <= now:
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        if max_age and ts + max_age <= now:
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        if isinstance(value, NegativeRecord):
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+
+        return value
+
+    def set(
+        self,
+        key: typing.Hashable,
+        value: typing.Any,
+        ttl: typing.Optional[float] = None,
+    ):
+        """
+        Save value to cache
+        :param key: Key to save value under
+        :param value: Value to save
+        :param ttl: Time to live in seconds. If not set, record doesn't expire
+        """
+        now = time.time()
+        self._data[key] = (now, now + ttl if ttl else 0, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def set_negative(
+        self,
+        key: typing.Hashable,
+        exception: Exception,
+        ttl: typing.Optional[float] = None,
+    ):
+        """
+        Remember failed lookup, if negative caching is enabled
+        :param key: Key, which failed to resolve
+        :param exception: Exception, which will be raised on next lookups
+        :param ttl: For how long to remember it. Defaults to `negative_ttl`
+        """
+        if ttl := self.negative_ttl if ttl is None else ttl:
+            self.set(key, NegativeRecord(exception), ttl)
+
+    def pop(self, key: typing.Hashable, default: typing.Any = None) -> typing.Any:
+        try:
+            return self._data.pop(key)[2]
+        except KeyError:
+            return default
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> typing.Dict[str, int]:
+        """Get hit, miss and eviction counters and current size"""
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def __contains__(self, key: typing.Hashable) -> bool:
+        if key not in self._data:
+            return False
+
+        expires = self._data[key][1]
+        return not expires or expires > time.time()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __repr__(self) -> str:
+        return f"BoundedCache({len(self._data)}/{self.maxsize})"
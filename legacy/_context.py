@@ -0,0 +1,105 @@
+"""Context variables, which attribute the current work to a client"""
+
+# ©️ Dan Gazizullin, 2021-2023
+# This file is a part of Hikka Userbot
+# 🌐 https://github.com/hikariatama/Hikka
+# You can redistribute it and/or modify it under the terms of the GNU AGPLv3
+# 🔑 https://www.gnu.org/licenses/agpl-3.0.html
+
+import contextlib
+import contextvars
+import functools
+import inspect
+import typing
+
+# Will be used to determine, which client caused logging messages.
+# Tasks inherit the value from the context they were created in
+client_id_logging_tag: contextvars.ContextVar[typing.Optional[int]] = (
+    contextvars.ContextVar("legacy_client_id_logging_tag", default=None)
+)
+
+
+@contextlib.contextmanager
+def logging_tag(client_id: typing.Optional[int]) -> typing.Iterator[None]:
+    """
+    Attribute everything inside the block (including tasks, created there)
+    to the client with `client_id`. If it's `None`, current tag is kept
+    """
+    if client_id is None:
+        yield
+        return
+
+    token = client_id_logging_tag.set(client_id)
+    try:
+        yield
+    finally:
+        client_id_logging_tag.reset(token)
+
+
+def get_logging_tag() -> typing.Optional[int]:
+    """Get ID of the client, which is responsible for the current context"""
+    return client_id_logging_tag.get()
+
+
+def tag_client(
+    get_client_id: typing.Callable[[typing.Any], int],
+) -> typing.Callable[[typing.Callable], typing.Callable]:
+    """
+    Decorator, which wraps method call in `logging_tag`
+    :param get_client_id: Callable, which receives `self` and returns client ID.
+        If it raises `AttributeError`, current tag is kept
+    """
+
+    def _get(self) -> typing.Optional[int]:
+        try:
+            return get_client_id(self)
+        except AttributeError:
+            return None
+
+    def decorator(func: typing.Callable) -> typing.Callable:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def wrapper(self, *args, **kwargs):
+                with logging_tag(_get(self)):
+                    return await func(self, *args, **kwargs)
+
+        else:
+
+            @functools.wraps(func)
+            def wrapper(self, *args, **kwargs):
+                with logging_tag(_get(self)):
+                    return func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# Will be used to determine, which module caused the current work
+# (e.g. RPC request). Set by dispatcher, loader and loops
+current_module: contextvars.ContextVar[typing.Optional[typing.Any]] = (
+    contextvars.ContextVar("legacy_current_module", default=None)
+)
+
+
+@contextlib.contextmanager
+def module_context(module: typing.Optional[typing.Any]) -> typing.Iterator[None]:
+    """
+    Attribute everything inside the block (including tasks, created there)
+    to the `module`. If it's `None`, current module is kept
+    """
+    if module is None:
+        yield
+        return
+
+    token = current_module.set(module)
+    try:
+        yield
+    finally:
+        current_module.reset(token)
+
+
+def get_current_module() -> typing.Optional[typing.Any]:
+    """Get module, which is responsible for the current context"""
+    return current_module.get()
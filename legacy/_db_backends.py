@@ -0,0 +1,440 @@
+"""Storage backends, which persist `Database` contents on disk"""
+
+# ©️ Dan Gazizullin, 2021-2023
+# This file is a part of Hikka Userbot
+# 🌐 https://github.com/hikariatama/Hikka
+# You can redistribute it and/or modify it under the terms of the GNU AGPLv3
+# 🔑 https://www.gnu.org/licenses/agpl-3.0.html
+
+import contextlib
+import logging
+import os
+import sqlite3
+import typing
+from pathlib import Path
+
+import ujson
+
+logger = logging.getLogger(__name__)
+
+# (owner, key, serialized value)
+# `key` is `None` if the whole owner was removed
+# `value` is `None` if the key was removed
+Change = typing.Tuple[str, typing.Optional[str], typing.Optional[str]]
+Blobs = typing.Dict[str, typing.Dict[str, str]]
+
+JOURNAL_MIN_COMPACT_SIZE = 1024 * 1024  # 1 MB
+
+
+def _atomic_write(path: Path, data: str):
+    tmp = path.with_name(f"{path.name}.tmp")
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp, path)
+    except Exception:
+        with contextlib.suppress(Exception):
+            tmp.unlink()
+
+        raise
+
+
+def _render_owner(keys: typing.Dict[str, str]) -> str:
+    if not keys:
+        return "{}"
+
+    return (
+        "{\n"
+        + ",\n".join(
+            f"        {ujson.dumps(key)}: {blob}" for key, blob in keys.items()
+        )
+        + "\n    }"
+    )
+
+
+def _render_document(owners: typing.Iterable[typing.Tuple[str, str]]) -> str:
+    return (
+        "{\n"
+        + ",\n".join(f"    {ujson.dumps(owner)}: {doc}" for owner, doc in owners)
+        + "\n}"
+    )
+
+
+class StorageBackend:
+    """
+    Base class for database storage backends.
+    `prepare` is called on the event loop and must be cheap, `write`
+    is called in the database writer thread in the same order
+    """
+
+    name: str = ""
+
+    def __init__(self, base_path: Path, tg_id: int):
+        self._base_path = base_path
+        self._tg_id = tg_id
+
+    def exists(self) -> bool:
+        """Whether the backend has any data stored"""
+        raise NotImplementedError
+
+    def files(self) -> typing.List[Path]:
+        """Files, where the backend stores data"""
+        raise NotImplementedError
+
+    def mtime(self) -> float:
+        """Time of the last write or `0` if nothing is stored"""
+        return max(
+            (path.stat().st_mtime for path in self.files() if path.exists()),
+            default=0,
+        )
+
+    def retire(self, target: "StorageBackend"):
+        """
+        Rename files of the backend to `*.migrated`, so they are not picked
+        up again. Files, which are shared with `target`, are kept
+        """
+        self.close()
+        keep = set(target.files())
+        for path in self.files():
+            if path.exists() and path not in keep:
+                os.replace(path, path.with_name(f"{path.name}.migrated"))
+
+    def load(self) -> dict:
+        """Read the whole database"""
+        raise NotImplementedError
+
+    def prepare(
+        self,
+        changes: typing.List[Change],
+        blobs: Blobs,
+        full: bool,
+    ) -> typing.Any:
+        """
+        Make an immutable payload for `write`
+        :param changes: Changes since the last call
+        :param blobs: Serialized values of the whole database
+        :param full: If `True`, the storage must be rewritten from `blobs`
+        """
+        raise NotImplementedError
+
+    def write(self, payload: typing.Any):
+        """Persist payload, made by `prepare`. Raises on failure"""
+        raise NotImplementedError
+
+    def close(self):
+        """Release backend resources"""
+
+
+class JSONBackend(StorageBackend):
+    """Stores the whole database in `config-<id>.json`, rewriting it on save"""
+
+    name = "json"
+
+    def __init__(self, base_path: Path, tg_id: int):
+        super().__init__(base_path, tg_id)
+        self._file = base_path / f"config-{tg_id}.json"
+        self._owner_docs: typing.Dict[str, str] = {}
+
+    def exists(self) -> bool:
+        return self._file.exists()
+
+    def files(self) -> typing.List[Path]:
+        return [self._file]
+
+    def load(self) -> dict:
+        return ujson.loads(self._file.read_text())
+
+    def prepare(
+        self,
+        changes: typing.List[Change],
+        blobs: Blobs,
+        full: bool,
+    ) -> typing.List[typing.Tuple[str, str]]:
+        if full:
+            self._owner_docs = {
+                owner: _render_owner(keys) for owner, keys in blobs.items()
+            }
+        else:
+            for owner in {change[0] for change in changes}:
+                if owner in blobs:
+                    self._owner_docs[owner] = _render_owner(blobs[owner])
+                else:
+                    self._owner_docs.pop(owner, None)
+
+        return list(self._owner_docs.items())
+
+    def write(self, payload: typing.List[typing.Tuple[str, str]]):
+        _atomic_write(self._file, _render_document(payload))
+
+
+class JournalBackend(StorageBackend):
+    """
+    Appends changes to `config-<id>.journal` and periodically compacts
+    them into `config-<id>.json` snapshot
+    """
+
+    name = "journal"
+
+    def __init__(self, base_path: Path, tg_id: int):
+        super().__init__(base_path, tg_id)
+        self._snapshot = base_path / f"config-{tg_id}.json"
+        self._journal = base_path / f"config-{tg_id}.journal"
+        self._snapshot_size = 0
+        self._journal_size = 0
+
+    def exists(self) -> bool:
+        return self._snapshot.exists() or self._journal.exists()
+
+    def files(self) -> typing.List[Path]:
+        return [self._snapshot, self._journal]
+
+    def mtime(self) -> float:
+        snapshot = self._snapshot.stat().st_mtime if self._snapshot.exists() else 0
+        if not self._journal.exists() or not self._journal.stat().st_size:
+            return snapshot
+
+        # Snapshot is shared with json backend. Journal is emptied on
+        # compaction, so its entries are newer than the snapshot, even
+        # if both were written within the same timestamp tick
+        return max(self._journal.stat().st_mtime, snapshot + 0.001)
+
+    def load(self) -> dict:
+        db = {}
+        with contextlib.suppress(FileNotFoundError):
+            db = ujson.loads(self._snapshot.read_text())
+            self._snapshot_size = self._snapshot.stat().st_size
+
+        with contextlib.suppress(FileNotFoundError):
+            with open(self._journal, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        owner, key, *value = ujson.loads(line)
+                    except ValueError:
+                        # Most likely the last line was not written
+                        # completely because of a crash
+                        logger.warning("Skipping broken journal entry")
+                        continue
+
+                    if key is None:
+                        db.pop(owner, None)
+                    elif not value:
+                        db.get(owner, {}).pop(key, None)
+                    else:
+                        db.setdefault(owner, {})[key] = value[0]
+
+            self._journal_size = self._journal.stat().st_size
+
+        return db
+
+    def prepare(
+        self,
+        changes: typing.List[Change],
+        blobs: Blobs,
+        full: bool,
+    ) -> typing.Tuple[bool, str]:
+        lines = "".join(
+            (
+                f"[{ujson.dumps(owner)},null]\n"
+                if key is None
+                else (
+                    f"[{ujson.dumps(owner)},{ujson.dumps(key)}]\n"
+                    if value is None
+                    else f"[{ujson.dumps(owner)},{ujson.dumps(key)},{value}]\n"
+                )
+            )
+            for owner, key, value in changes
+        )
+
+        if full or self._journal_size + len(lines) > max(
+            self._snapshot_size,
+            JOURNAL_MIN_COMPACT_SIZE,
+        ):
+            document = _render_document(
+                (owner, _render_owner(keys)) for owner, keys in blobs.items()
+            )
+            self._snapshot_size = len(document)
+            self._journal_size = 0
+            return True, document
+
+        self._journal_size += len(lines)
+        return False, lines
+
+    def write(self, payload: typing.Tuple[bool, str]):
+        compact, data = payload
+        if compact:
+            _atomic_write(self._snapshot, data)
+            # Replaying the old journal over the new snapshot is harmless,
+            # so a crash between these two steps doesn't lose anything
+            _atomic_write(self._journal, "")
+            return
+
+        with open(self._journal, "a", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class SQLiteBackend(StorageBackend):
+    """Stores one row per owner/key in `config-<id>.db`"""
+
+    name = "sqlite"
+
+    def __init__(self, base_path: Path, tg_id: int):
+        super().__init__(base_path, tg_id)
+        self._file = base_path / f"config-{tg_id}.db"
+        self._conn: typing.Optional[sqlite3.Connection] = None
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        if not self._conn:
+            self._conn = sqlite3.connect(self._file, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=FULL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS db (owner TEXT NOT NULL, key TEXT NOT"
+                " NULL, value TEXT NOT NULL, PRIMARY KEY (owner, key))"
+            )
+            self._conn.commit()
+
+        return self._conn
+
+    def exists(self) -> bool:
+        return self._file.exists()
+
+    def files(self) -> typing.List[Path]:
+        # WAL is merged into the database, when the last connection is closed
+        return [
+            self._file,
+            self._file.with_name(f"{self._file.name}-wal"),
+            self._file.with_name(f"{self._file.name}-shm"),
+        ]
+
+    def mtime(self) -> float:
+        # Shared memory file is touched by reads too
+        return max(
+            (path.stat().st_mtime for path in self.files()[:2] if path.exists()),
+            default=0,
+        )
+
+    def load(self) -> dict:
+        db = {}
+        for owner, key, value in self._connection.execute(
+            "SELECT owner, key, value FROM db"
+        ):
+            db.setdefault(owner, {})[key] = ujson.loads(value)
+
+        return db
+
+    def prepare(
+        self,
+        changes: typing.List[Change],
+        blobs: Blobs,
+        full: bool,
+    ) -> typing.Tuple[bool, typing.List[Change]]:
+        if full:
+            return True, [
+                (owner, key, value)
+                for owner, keys in blobs.items()
+                for key, value in keys.items()
+            ]
+
+        return False, changes
+
+    def write(self, payload: typing.Tuple[bool, typing.List[Change]]):
+        full, changes = payload
+        with self._connection as conn:
+            if full:
+                conn.execute("DELETE FROM db")
+
+            for owner, key, value in changes:
+                if key is None:
+                    conn.execute("DELETE FROM db WHERE owner = ?", (owner,))
+                elif value is None:
+                    conn.execute(
+                        "DELETE FROM db WHERE owner = ? AND key = ?",
+                        (owner, key),
+                    )
+                else:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO db (owner, key, value) VALUES"
+                        " (?, ?, ?)",
+                        (owner, key, value),
+                    )
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+
+BACKENDS: typing.Dict[str, typing.Type[StorageBackend]] = {
+    backend.name: backend for backend in (JSONBackend, JournalBackend, SQLiteBackend)
+}
+
+
+def get_backend(name: str, base_path: Path, tg_id: int) -> StorageBackend:
+    """
+    Get storage backend by its name from `config.json`
+    :param name: Backend name, `json` is used if it's unknown
+    :param base_path: Data root
+    :param tg_id: Telegram ID of the database owner
+    :return: Backend instance
+    """
+    if name and name not in BACKENDS:
+        logger.warning("Unknown database backend %s, falling back to json", name)
+
+    return BACKENDS.get(name, JSONBackend)(base_path, tg_id)
+
+
+def migrate(backend: StorageBackend) -> typing.Optional[dict]:
+    """
+    Move data to `backend` from the other one, which has newer data stored.
+    If there are several, the most recently written one is used. Files of the
+    source backend are renamed to `*.migrated` once the data is saved
+    :param backend: Selected backend
+    :return: Database contents or `None` if there is nothing to migrate
+    """
+    current = backend.mtime()
+    sources = []
+    for other in BACKENDS.values():
+        if other is type(backend):
+            continue
+
+        other = other(backend._base_path, backend._tg_id)
+        if (mtime := other.mtime()) > current:
+            sources.append((mtime, other))
+
+    for _, other in sorted(sources, key=lambda source: source[0], reverse=True):
+        try:
+            db = other.load()
+        except Exception:
+            logger.exception("Can't migrate database from %s", other.name)
+            continue
+        finally:
+            other.close()
+
+        logger.info("Migrating database from %s to %s", other.name, backend.name)
+        try:
+            backend.write(
+                backend.prepare(
+                    [],
+                    {
+                        owner: {
+                            str(key): ujson.dumps(value) for key, value in keys.items()
+                        }
+                        for owner, keys in db.items()
+                    },
+                    True,
+                )
+            )
+            other.retire(backend)
+        except Exception:
+            # Source is kept, so migration will be retried on next start
+            logger.exception("Can't save migrated database to %s", backend.name)
+
+        return db
+
+    return None
@@ -11,6 +11,26 @@ import os
 import random
 import signal
 import sys
+import typing
+
+_shutdown_hooks: typing.List[typing.Callable[[], None]] = []
+
+
+def on_shutdown(func: typing.Callable[[], None]):
+    """
+    Register a callback, which must be called before the process is killed
+    or replaced by `restart`. Regular `atexit` handlers are not executed
+    in this case, because the process is terminated by signal or `execl`
+    """
+    _shutdown_hooks.append(func)
+
+
+def run_shutdown_hooks():
+    while _shutdown_hooks:
+        try:
+            _shutdown_hooks.pop()()
+        except Exception:
+            logging.exception("Shutdown hook failed")
 
 
 async def fw_protect():
@@ -29,6 +49,8 @@ def get_startup_callback() -> callable:
 
 def die():
     """Platform-dependent way to kill the current process group"""
+    run_shutdown_hooks()
+
     if "DOCKER" in os.environ:
         sys.exit(0)
     else:
@@ -11,9 +11,11 @@ import contextlib
 import hashlib
 import logging
 import os
+import time
 import typing
 
 import requests
+import ujson
 
 from . import utils
 from .tl_cache import CustomTelegramClient
@@ -23,38 +25,148 @@ logger = logging.getLogger(__name__)
 
 MAX_FILESIZE = 1024 * 1024 * 5  # 5 MB
 MAX_TOTALSIZE = 1024 * 1024 * 100  # 100 MB
+# Maximum number of modules, which are downloaded simultaneously
+FETCH_CONCURRENCY = 8
+REQUEST_TIMEOUT = 30
+INDEX_FILE = "index.json"
+# Delay of index save after access times of modules change, in seconds
+INDEX_SAVE_DELAY = 10
 
 
 class LocalStorage:
     """Saves modules to disk and fetches them if remote storage is not available."""
 
-    def __init__(self):
-        self._path = os.path.join(os.path.expanduser("~"), ".legacy", "modules_cache")
+    _shared: typing.Dict[str, "LocalStorage"] = {}
+
+    def __init__(self, path: typing.Optional[str] = None):
+        """
+        :param path: Cache directory. Use `get` to share one instance per directory
+        """
+        self._path = path or os.path.join(
+            os.path.expanduser("~"),
+            ".legacy",
+            "modules_cache",
+        )
         self._ensure_dirs()
+        self._index_path = os.path.join(self._path, INDEX_FILE)
+        # file name -> {"size", "atime", "etag", "last_modified"}
+        self._index: typing.Dict[str, typing.Dict[str, typing.Any]] = self._load_index()
+        self._total_size = sum(entry["size"] for entry in self._index.values())
+        self._save_handle: typing.Optional[asyncio.TimerHandle] = None
 
-    @property
-    def _total_size(self) -> int:
-        return sum(os.path.getsize(f.path) for f in os.scandir(self._path))
+    @classmethod
+    def get(cls, path: typing.Optional[str] = None) -> "LocalStorage":
+        """
+        Get storage of the directory, shared by all clients of this process
+        :param path: Cache directory
+        """
+        if path not in cls._shared:
+            cls._shared[path] = cls(path)
+
+        return cls._shared[path]
 
     def _ensure_dirs(self):
         """Ensures that the local storage directory exists."""
         if not os.path.isdir(self._path):
             os.makedirs(self._path)
 
+    def _load_index(self) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        index = {}
+        with contextlib.suppress(FileNotFoundError, ValueError):
+            with open(self._index_path, "r") as f:
+                index = ujson.load(f)
+
+        # Files, saved before the index was introduced, or by another
+        # process, are picked up, and entries of removed files are dropped
+        files = {
+            entry.name: entry.stat()
+            for entry in os.scandir(self._path)
+            if entry.is_file() and entry.name.endswith(".py")
+        }
+        index = {name: entry for name, entry in index.items() if name in files}
+        for name, stat in files.items():
+            if name not in index or index[name].get("size") != stat.st_size:
+                index[name] = {"size": stat.st_size, "atime": stat.st_mtime}
+
+        return index
+
+    def _save_index(self):
+        if self._save_handle:
+            self._save_handle.cancel()
+            self._save_handle = None
+
+        # Entries, which were added by another process, are kept
+        with contextlib.suppress(FileNotFoundError, ValueError):
+            with open(self._index_path, "r") as f:
+                for name, entry in ujson.load(f).items():
+                    if name not in self._index and os.path.isfile(
+                        os.path.join(self._path, name)
+                    ):
+                        self._index[name] = entry
+                        self._total_size += entry.get("size", 0)
+
+        tmp = f"{self._index_path}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                ujson.dump(self._index, f)
+
+            os.replace(tmp, self._index_path)
+        except OSError:
+            logger.debug("Can't save local storage index", exc_info=True)
+
+    def _schedule_save(self):
+        """Save index later, so frequent access time updates are written once"""
+        if self._save_handle:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._save_index()
+            return
+
+        self._save_handle = loop.call_later(INDEX_SAVE_DELAY, self._save_index)
+
+    def _get_name(self, repo: str, module_name: str) -> str:
+        return hashlib.sha256(f"{repo}_{module_name}".encode()).hexdigest() + ".py"
+
     def _get_path(self, repo: str, module_name: str) -> str:
-        return os.path.join(
-            self._path,
-            hashlib.sha256(f"{repo}_{module_name}".encode()).hexdigest() + ".py",
-        )
+        return os.path.join(self._path, self._get_name(repo, module_name))
+
+    def _evict(self, size: int):
+        """Removes least recently used modules, until `size` bytes fit"""
+        for name, entry in sorted(
+            self._index.items(),
+            key=lambda item: item[1]["atime"],
+        ):
+            if self._total_size + size <= MAX_TOTALSIZE:
+                break
+
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self._path, name))
+
+            del self._index[name]
+            self._total_size -= entry["size"]
+            logger.debug("Evicted %s from local cache.", name)
 
-    def save(self, repo: str, module_name: str, module_code: str):
+    def save(
+        self,
+        repo: str,
+        module_name: str,
+        module_code: str,
+        etag: typing.Optional[str] = None,
+        last_modified: typing.Optional[str] = None,
+    ):
         """
         Saves module to disk.
         :param repo: Repository name.
         :param module_name: Module name.
         :param module_code: Module source code.
+        :param etag: `ETag` header of the response, if any.
+        :param last_modified: `Last-Modified` header of the response, if any.
         """
-        size = len(module_code)
+        data = module_code.encode("utf-8")
+        size = len(data)
         if size > MAX_FILESIZE:
             logger.warning(
                 "Module %s from %s is too large (%s bytes) to save to local cache.",
@@ -64,16 +176,26 @@ class LocalStorage:
             )
             return
 
-        if self._total_size + size > MAX_TOTALSIZE:
-            logger.warning(
-                "Local storage is full, cannot save module %s from %s.",
-                module_name,
-                repo,
-            )
-            return
+        name = self._get_name(repo, module_name)
+        if name in self._index:
+            self._total_size -= self._index.pop(name)["size"]
+
+        self._evict(size)
+
+        path = os.path.join(self._path, name)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
 
-        with open(self._get_path(repo, module_name), "w") as f:
-            f.write(module_code)
+        os.replace(f"{path}.tmp", path)
+
+        self._index[name] = {
+            "size": size,
+            "atime": time.time(),
+            "etag": etag,
+            "last_modified": last_modified,
+        }
+        self._total_size += size
+        self._save_index()
 
         logger.debug("Saved module %s from %s to local cache.", module_name, repo)
 
@@ -84,29 +206,102 @@ class LocalStorage:
         :param module_name: Module name.
         :return: Module source code or None.
         """
-        path = self._get_path(repo, module_name)
-        if os.path.isfile(path):
-            with open(path, "r") as f:
-                return f.read()
+        name = self._get_name(repo, module_name)
+        if name not in self._index:
+            return None
 
-        return None
+        try:
+            with open(os.path.join(self._path, name), "r", encoding="utf-8") as f:
+                module = f.read()
+        except FileNotFoundError:
+            self._total_size -= self._index.pop(name)["size"]
+            self._schedule_save()
+            return None
+
+        self._index[name]["atime"] = time.time()
+        self._schedule_save()
+        return module
+
+    def get_validators(self, repo: str, module_name: str) -> typing.Dict[str, str]:
+        """
+        Gets headers for conditional request of the cached module.
+        :param repo: Repository name.
+        :param module_name: Module name.
+        :return: `If-None-Match` and `If-Modified-Since` headers, if known.
+        """
+        entry = self._index.get(self._get_name(repo, module_name), {})
+        return {
+            header: entry[key]
+            for header, key in (
+                ("If-None-Match", "etag"),
+                ("If-Modified-Since", "last_modified"),
+            )
+            if entry.get(key)
+        }
 
 
 class RemoteStorage:
-    def __init__(self, client: CustomTelegramClient):
-        self._local_storage = LocalStorage()
+    def __init__(self, client: CustomTelegramClient, offline: bool = False):
+        """
+        :param client: Client, which the modules are fetched for
+        :param offline: If `True`, modules are served from local storage only
+        """
+        self._local_storage = LocalStorage.get()
         self._client = client
+        self.offline = offline
+        # Connections are reused between requests, so simultaneous downloads
+        # from the same host don't open a new connection each time
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=FETCH_CONCURRENCY,
+            pool_maxsize=FETCH_CONCURRENCY,
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._headers = None
+
+    @property
+    def headers(self) -> typing.Dict[str, str]:
+        if self._headers is None:
+            self._headers = {
+                "User-Agent": "Legacy Userbot",
+                "X-Legacy-Version": __version__,
+                "X-Legacy-Commit-SHA": utils.get_git_hash(),
+                "X-Legacy-User": str(self._client.tg_id),
+            }
+
+        return self._headers
 
     async def preload(self, urls: typing.List[str]):
         """Preloads modules from remote storage."""
         logger.debug("Preloading modules from remote storage.")
-        for url in urls:
-            logger.debug("Preloading module %s", url)
+        await self.fetch_many(urls)
+
+    async def fetch_many(
+        self,
+        urls: typing.Iterable[str],
+        auth: typing.Optional[str] = None,
+        limit: int = FETCH_CONCURRENCY,
+    ) -> typing.Dict[str, typing.Union[str, Exception]]:
+        """
+        Fetches modules simultaneously, at most `limit` at a time.
+        :param urls: URLs to the modules.
+        :param auth: Optional authentication string in the format "username:password".
+        :param limit: Maximum number of simultaneous downloads.
+        :return: Mapping of URL to module source code or exception, raised by `fetch`.
+        """
+        semaphore = asyncio.Semaphore(limit)
 
-            with contextlib.suppress(Exception):
-                await self.fetch(url)
+        async def _fetch(url: str) -> typing.Union[str, Exception]:
+            async with semaphore:
+                logger.debug("Fetching module %s", url)
+                try:
+                    return await self.fetch(url, auth)
+                except Exception as e:
+                    return e
 
-            await asyncio.sleep(5)
+        urls = list(dict.fromkeys(urls))
+        return dict(zip(urls, await asyncio.gather(*map(_fetch, urls))))
 
     @staticmethod
     def _parse_url(url: str) -> typing.Tuple[str, str, str]:
@@ -139,19 +334,23 @@ class RemoteStorage:
         :return: Module source code.
         """
         url, repo, module_name = self._parse_url(url)
+        if self.offline:
+            if (module := self._local_storage.fetch(repo, module_name)) is None:
+                raise requests.exceptions.HTTPError(
+                    f"Module {url} is not cached and remote storage is offline"
+                )
+
+            return module
+
+        validators = self._local_storage.get_validators(repo, module_name)
         try:
-            r = await utils.run_sync(
-                requests.get,
-                url,
-                auth=(tuple(auth.split(":", 1)) if auth else None),
-                headers={
-                    "User-Agent": "Legacy Userbot",
-                    "X-Legacy-Version": __version__,
-                    "X-Legacy-Commit-SHA": utils.get_git_hash(),
-                    "X-Legacy-User": str(self._client.tg_id),
-                },
-            )
-            r.raise_for_status()
+            r = await self._get(url, auth, validators)
+            if r.status_code == 304:
+                if (module := self._local_storage.fetch(repo, module_name)) is not None:
+                    logger.debug("Module %s is not modified, using local storage.", url)
+                    return module
+
+                r = await self._get(url, auth)
         except Exception:
             logger.debug(
                 "Can't load module from remote storage. Trying local storage.",
@@ -163,6 +362,28 @@ class RemoteStorage:
 
             raise
 
-        self._local_storage.save(repo, module_name, r.text)
+        self._local_storage.save(
+            repo,
+            module_name,
+            r.text,
+            etag=r.headers.get("ETag"),
+            last_modified=r.headers.get("Last-Modified"),
+        )
 
         return r.text
+
+    async def _get(
+        self,
+        url: str,
+        auth: typing.Optional[str] = None,
+        headers: typing.Optional[typing.Dict[str, str]] = None,
+    ) -> requests.Response:
+        r = await utils.run_sync(
+            self._session.get,
+            url,
+            auth=(tuple(auth.split(":", 1)) if auth else None),
+            headers={**self.headers, **(headers or {})},
+            timeout=REQUEST_TIMEOUT,
+        )
+        r.raise_for_status()
+        return r
@@ -0,0 +1,166 @@
+"""Fixed-size storage of compact log records"""
+
+# ©️ Dan Gazizullin, 2021-2023
+# This file is a part of Hikka Userbot
+# 🌐 https://github.com/hikariatama/Hikka
+# You can redistribute it and/or modify it under the terms of the GNU AGPLv3
+# 🔑 https://www.gnu.org/licenses/agpl-3.0.html
+
+import collections
+import heapq
+import logging
+import sys
+import typing
+
+
+class CompactRecord(typing.NamedTuple):
+    """Log record without the fields, which are not needed to format it later"""
+
+    seq: int
+    levelno: int
+    created: float
+    name: int
+    msg: str
+    args: typing.Any
+    client_id: typing.Optional[int]
+    exc_text: typing.Optional[str]
+    stack_info: typing.Optional[str]
+
+
+class LogRing:
+    """
+    Ring buffer, which keeps last `capacity` records. Records are indexed
+    by level and by client, so filtering doesn't touch unrelated ones
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(capacity, 1)
+        self._slots: typing.List[typing.Optional[CompactRecord]] = [
+            None
+        ] * self.capacity
+        # Sequence number of the next record
+        self._seq = 0
+        # Sequence number of the first record after the last `clear`
+        self._start = 0
+        self._names: typing.Dict[str, int] = {}
+        self._name_list: typing.List[str] = []
+        # Sequence numbers in ascending order. The oldest record is always
+        # the first one in its deques, so overwriting it is O(1)
+        self._by_level: typing.Dict[int, typing.Deque[int]] = {}
+        self._by_client: typing.Dict[typing.Optional[int], typing.Deque[int]] = {}
+
+    def append(
+        self,
+        record: logging.LogRecord,
+        client_id: typing.Optional[int] = None,
+        exc_text: typing.Optional[str] = None,
+    ):
+        """
+        Save record
+        :param record: Record to save
+        :param client_id: ID of the client, which caused the record
+        :param exc_text: Formatted exception of the record, if any
+        """
+        if (name := self._names.get(record.name)) is None:
+            name = self._names[record.name] = len(self._name_list)
+            self._name_list.append(record.name)
+
+        seq = self._seq
+        index = seq % self.capacity
+        if (old := self._slots[index]) is not None:
+            self._unindex(self._by_level, old.levelno)
+            self._unindex(self._by_client, old.client_id)
+
+        client_id = client_id or None
+        self._slots[index] = CompactRecord(
+            seq=seq,
+            levelno=record.levelno,
+            created=record.created,
+            name=name,
+            msg=(
+                sys.intern(record.msg)
+                if isinstance(record.msg, str)
+                else str(record.msg)
+            ),
+            args=record.args,
+            client_id=client_id,
+            exc_text=exc_text,
+            stack_info=record.stack_info,
+        )
+        self._seq += 1
+        self._by_level.setdefault(record.levelno, collections.deque()).append(seq)
+        self._by_client.setdefault(client_id, collections.deque()).append(seq)
+
+    @staticmethod
+    def _unindex(index: typing.Dict[typing.Any, typing.Deque[int]], key: typing.Any):
+        seqs = index[key]
+        seqs.popleft()
+        if not seqs:
+            del index[key]
+
+    def select(
+        self,
+        level: int = 0,
+        client_id: typing.Optional[int] = None,
+        *,
+        all_clients: bool = False,
+    ) -> typing.List[CompactRecord]:
+        """
+        Get records in chronological order
+        :param level: Minimum level of records
+        :param client_id: Return records of this client and the ones, which
+            are not attributed to any client
+        :param all_clients: Return records of all clients
+        :return: Matching records
+        """
+        levels = [seqs for lvl, seqs in self._by_level.items() if lvl >= level]
+        clients = (
+            list(self._by_client.values())
+            if all_clients
+            else [
+                seqs
+                for key, seqs in self._by_client.items()
+                if key is None or key == client_id
+            ]
+        )
+
+        # Walk the smaller index and check the other condition on each record
+        by_level = sum(map(len, levels)) <= sum(map(len, clients))
+        records = []
+        for seq in heapq.merge(*map(list, levels if by_level else clients)):
+            record = self._slots[seq % self.capacity]
+            if by_level:
+                if not all_clients and record.client_id not in {None, client_id}:
+                    continue
+            elif record.levelno < level:
+                continue
+
+            records.append(record)
+
+        return records
+
+    def to_log_record(self, record: CompactRecord) -> logging.LogRecord:
+        """Restore `logging.LogRecord`, which can be passed to formatters"""
+        return logging.makeLogRecord(
+            {
+                "name": self._name_list[record.name],
+                "msg": record.msg,
+                "args": record.args,
+                "levelno": record.levelno,
+                "levelname": logging.getLevelName(record.levelno),
+                "created": record.created,
+                "msecs": (record.created - int(record.created)) * 1000,
+                "exc_text": record.exc_text,
+                "stack_info": record.stack_info,
+                "legacy_caller": record.client_id,
+            }
+        )
+
+    def clear(self):
+        self._start = self._seq
+        self._slots = [None] * self.capacity
+        self._by_level.clear()
+        self._by_client.clear()
+
+    def __len__(self) -> int:
+        return min(self._seq - self._start, self.capacity)
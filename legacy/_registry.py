@@ -0,0 +1,111 @@
+"""Registry of handlers, which modules provide"""
+
+# ©️ Dan Gazizullin, 2021-2023
+# This file is a part of Hikka Userbot
+# 🌐 https://github.com/hikariatama/Hikka
+# You can redistribute it and/or modify it under the terms of the GNU AGPLv3
+# 🔑 https://www.gnu.org/licenses/agpl-3.0.html
+
+import types
+import typing
+
+PARTS = ("commands", "inline_handlers", "callback_handlers", "watchers")
+
+
+class HandlerSnapshot(typing.NamedTuple):
+    """Immutable view of all registered handlers"""
+
+    version: int
+    commands: typing.Mapping[str, typing.Callable]
+    inline_handlers: typing.Mapping[str, typing.Callable]
+    callback_handlers: typing.Mapping[str, typing.Callable]
+    watchers: typing.Tuple[typing.Callable, ...]
+
+
+class HandlerRegistry:
+    """
+    Stores handlers of each module separately and publishes merged snapshot
+    on every change. If modules provide handlers with the same name, the one
+    from the most recently updated module wins
+    """
+
+    def __init__(self):
+        self._modules: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+        self.snapshot = HandlerSnapshot(
+            version=0,
+            commands=types.MappingProxyType({}),
+            inline_handlers=types.MappingProxyType({}),
+            callback_handlers=types.MappingProxyType({}),
+            watchers=(),
+        )
+
+    def get(self, module: str, part: str) -> typing.Any:
+        """
+        Get handlers of module
+        :param module: Module class name
+        :param part: One of `PARTS`
+        :return: Handlers or `None`, if module has none registered
+        """
+        return self._modules.get(module, {}).get(part)
+
+    def update(self, module: str, **parts) -> typing.Set[str]:
+        """
+        Replace handlers of module
+        :param module: Module class name
+        :param parts: New handlers, keyed by one of `PARTS`. Mappings for all
+            parts, except `watchers`, which is a sequence
+        :return: Names of changed parts
+        """
+        handlers = self._modules.pop(module, {})
+        handlers.update(parts)
+        # Module is moved to the end, so its handlers take precedence
+        self._modules[module] = handlers
+        self._publish(set(parts))
+        return set(parts)
+
+    def discard(self, module: str, *parts: str) -> typing.Set[str]:
+        """
+        Remove handlers of module
+        :param module: Module class name
+        :param parts: Parts to remove. If not passed, all of them are removed
+        :return: Names of changed parts
+        """
+        if module not in self._modules:
+            return set()
+
+        handlers = self._modules[module]
+        changed = {part for part in (parts or PARTS) if part in handlers}
+        for part in changed:
+            del handlers[part]
+
+        if not handlers:
+            del self._modules[module]
+
+        if changed:
+            self._publish(changed)
+
+        return changed
+
+    def _publish(self, changed: typing.Set[str]):
+        merged = {}
+        for part in changed:
+            if part == "watchers":
+                merged[part] = tuple(
+                    watcher
+                    for handlers in self._modules.values()
+                    for watcher in handlers.get(part, ())
+                )
+            else:
+                merged[part] = types.MappingProxyType(
+                    {
+                        name: handler
+                        for handlers in self._modules.values()
+                        for name, handler in handlers.get(part, {}).items()
+                    }
+                )
+
+        # Snapshot is replaced as a whole, so readers never see it half-updated
+        self.snapshot = self.snapshot._replace(
+            version=self.snapshot.version + 1,
+            **merged,
+        )
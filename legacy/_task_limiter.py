@@ -0,0 +1,184 @@
+"""Limits the amount of concurrently running handler tasks"""
+
+# ©️ Dan Gazizullin, 2021-2023
+# This file is a part of Hikka Userbot
+# 🌐 https://github.com/hikariatama/Hikka
+# You can redistribute it and/or modify it under the terms of the GNU AGPLv3
+# 🔑 https://www.gnu.org/licenses/agpl-3.0.html
+
+import asyncio
+import collections
+import itertools
+import logging
+import typing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GLOBAL_LIMIT = 256
+DEFAULT_MODULE_LIMIT = 32
+DEFAULT_QUEUE_SIZE = 256
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+POLICIES = {DROP_OLDEST, DROP_NEWEST}
+
+Factory = typing.Callable[[], typing.Awaitable]
+
+
+class _ModuleState:
+    __slots__ = ("running", "dropped", "pending")
+
+    def __init__(self):
+        self.running = 0
+        self.dropped = 0
+        # Coroutines are created only when the task is started,
+        # so dropped jobs don't leave never-awaited coroutines
+        self.pending: typing.OrderedDict[typing.Hashable, Factory] = (
+            collections.OrderedDict()
+        )
+
+
+class TaskLimiter:
+    """
+    Runs handler tasks with global and per-module concurrency limits.
+    Jobs over the limit wait in a bounded per-module queue. Jobs with the same
+    `key` are coalesced there, so only the latest one runs. Priority jobs
+    (e.g. commands) are started immediately and don't take slots of other jobs
+    """
+
+    def __init__(
+        self,
+        global_limit: int = DEFAULT_GLOBAL_LIMIT,
+        module_limit: int = DEFAULT_MODULE_LIMIT,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        policy: str = DROP_OLDEST,
+    ):
+        """
+        :param global_limit: Maximum number of running tasks
+        :param module_limit: Maximum number of running tasks of one module
+        :param queue_size: Maximum number of waiting tasks of one module
+        :param policy: What to drop, when the queue is full:
+            `drop_oldest` or `drop_newest`
+        """
+        self.global_limit = max(global_limit, 1)
+        self.module_limit = max(module_limit, 1)
+        self.queue_size = max(queue_size, 0)
+        self.policy = policy if policy in POLICIES else DROP_OLDEST
+        self._running = 0
+        self._modules: typing.Dict[str, _ModuleState] = collections.defaultdict(
+            _ModuleState
+        )
+        self._waiting: typing.OrderedDict[str, None] = collections.OrderedDict()
+        self._ids = itertools.count()
+
+    def submit(
+        self,
+        module: str,
+        factory: Factory,
+        key: typing.Optional[typing.Hashable] = None,
+        *,
+        priority: bool = False,
+    ) -> bool:
+        """
+        Run or enqueue the job
+        :param module: Name of the module, the job is attributed to
+        :param factory: Callable, which returns a coroutine to run
+        :param key: If set, waiting job with the same key is replaced
+        :param priority: If set, the job ignores all limits and is started
+            immediately, so it's never dropped or queued behind other jobs
+        :return: `False` if the job was dropped
+        """
+        state = self._modules[module]
+        if priority:
+            self._start(module, state, factory, priority=True)
+            return True
+
+        if (
+            not state.pending
+            and self._running < self.global_limit
+            and state.running < self.module_limit
+        ):
+            self._start(module, state, factory)
+            return True
+
+        if key is not None and key in state.pending:
+            state.pending[key] = factory
+            state.pending.move_to_end(key)
+            state.dropped += 1
+            return True
+
+        if len(state.pending) >= self.queue_size:
+            state.dropped += 1
+            if self.policy == DROP_NEWEST or not state.pending:
+                logger.debug("Dropping task of %s, queue is full", module)
+                return False
+
+            state.pending.popitem(last=False)
+            logger.debug("Dropping oldest task of %s, queue is full", module)
+
+        state.pending[next(self._ids) if key is None else key] = factory
+        self._waiting[module] = None
+        return True
+
+    def _start(
+        self,
+        module: str,
+        state: _ModuleState,
+        factory: Factory,
+        priority: bool = False,
+    ):
+        # Priority jobs are not counted, so they can't exhaust limits of other jobs
+        if not priority:
+            self._running += 1
+            state.running += 1
+
+        try:
+            task = asyncio.ensure_future(factory())
+        except Exception:
+            if not priority:
+                self._running -= 1
+                state.running -= 1
+
+            raise
+
+        if not priority:
+            task.add_done_callback(lambda _: self._done(state))
+
+    def _done(self, state: _ModuleState):
+        self._running -= 1
+        state.running -= 1
+        self._pump()
+
+    def _pump(self):
+        for module in list(self._waiting):
+            if self._running >= self.global_limit:
+                return
+
+            state = self._modules[module]
+            while (
+                state.pending
+                and state.running < self.module_limit
+                and self._running < self.global_limit
+            ):
+                _, factory = state.pending.popitem(last=False)
+                self._start(module, state, factory)
+
+            if not state.pending:
+                del self._waiting[module]
+            else:
+                # Let other modules take free slots first next time
+                self._waiting.move_to_end(module)
+
+    def stats(self) -> typing.Dict[str, typing.Dict[str, int]]:
+        """
+        Get task counters
+        :return: Mapping of module name to `queued`, `running` and `dropped` counters
+        """
+        return {
+            module: {
+                "queued": len(state.pending),
+                "running": state.running,
+                "dropped": state.dropped,
+            }
+            for module, state in self._modules.items()
+        }
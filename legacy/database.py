@@ -6,16 +6,21 @@
 
 import asyncio
 import collections
+import threading
 import ujson
 import logging
 import time
+import types
 
 import typing
+from concurrent.futures import ThreadPoolExecutor
 
 from legacytl.errors.rpcerrorlist import ChannelsTooMuchError
 from legacytl.tl.types import Message, User
 
 from . import main, utils
+from ._db_backends import Change, StorageBackend, get_backend, migrate
+from ._internal import on_shutdown
 from .pointers import (
     BaseSerializingMiddlewareDict,
     BaseSerializingMiddlewareList,
@@ -39,6 +44,17 @@ __all__ = [
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_FLUSH_INTERVAL = 1.0
+REVISIONS_LIMIT = 15
+
+
+class Revision(typing.NamedTuple):
+    """Immutable snapshot of serialized database values"""
+
+    id: int
+    time: float
+    owners: typing.Mapping[str, typing.Mapping[str, str]]
+
 
 class NoAssetsChannel(Exception):
     """Raised when trying to read/store asset with no asset channel present"""
@@ -49,19 +65,43 @@ class Database(dict):
         super().__init__()
         self._client: CustomTelegramClient = client
         self._next_revision_call: int = 0
-        self._revisions: typing.List[dict] = []
+        self._revisions: typing.List[Revision] = []
+        self._revision_id: int = 0
+        # Owners, whose serialized maps are shared with revisions
+        self._frozen: typing.Set[str] = set()
         self._assets: int = None
         self._me: User = None
         self._saving_task: asyncio.Future = None
+        self._backend: typing.Optional[StorageBackend] = None
+        # owner -> modified keys, `None` if the whole owner must be rewritten
+        self._dirty: typing.Dict[str, typing.Optional[typing.Set[str]]] = {}
+        # owner -> key -> serialized value, as it is stored in backend
+        self._blobs: typing.Dict[str, typing.Dict[str, str]] = {}
+        self._full_write: bool = True
+        # Bumped on every modification, so that consumers can cache
+        # values, derived from database, and rebuild them only on change
+        self._owner_versions: typing.Dict[str, int] = collections.defaultdict(int)
+        self._global_version: int = 0
+        self._write_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="legacy-db")
+        self._flush_interval: float = DEFAULT_FLUSH_INTERVAL
 
     def __repr__(self):
         return object.__repr__(self)
 
     async def init(self):
         """Asynchronous initialization unit"""
-        self._db_file = main.BASE_PATH / f"config-{self._client.tg_id}.json"
+        self._backend = get_backend(
+            main.get_config_key("db_backend"),
+            main.BASE_PATH,
+            self._client.tg_id,
+        )
+        self._flush_interval = self._get_flush_interval()
         self.read()
 
+        on_shutdown(self.flush)
+        utils.atexit(self.flush)
+
         try:
             self._assets, _ = await utils.asset_channel(
                 self._client,
@@ -80,20 +120,54 @@ class Database(dict):
                 "You can solve this by leaving some channels/groups"
             )
 
+    @staticmethod
+    def _get_flush_interval() -> float:
+        if (interval := main.get_config_key("db_flush_interval")) is False:
+            return DEFAULT_FLUSH_INTERVAL
+
+        try:
+            return max(float(interval), 0.0)
+        except (TypeError, ValueError):
+            return DEFAULT_FLUSH_INTERVAL
+
     def read(self):
         """Read database and stores it in self"""
         try:
-            self.update(**ujson.loads(self._db_file.read_text()))
+            if (db := migrate(self._backend)) is not None:
+                self.update(**db)
+            elif self._backend.exists():
+                self.update(**self._backend.load())
+            else:
+                logger.debug("Database file not found, creating new one...")
         except ValueError:
             logger.warning("Database read failed! Creating new one...")
-        except FileNotFoundError:
-            logger.debug("Database file not found, creating new one...")
 
-    def process_db_autofix(self, db: dict) -> bool:
-        if not utils.is_serializable(db):
-            return False
+        self._blobs.clear()
+        self._frozen.clear()
+        self._mark_dirty()
+        self._full_write = True
 
-        for key, value in db.copy().items():
+    def process_db_autofix(
+        self,
+        db: dict,
+        keys: typing.Optional[typing.Iterable[str]] = None,
+    ) -> bool:
+        """
+        Drop the parts of `db` which can't be stored
+        :param db: Database (or its copy) to check
+        :param keys: If passed, only these owners will be checked
+        :return: `False` if database can't be fixed
+        """
+        if keys is None:
+            subtrees = db.copy()
+            if not utils.is_serializable(subtrees):
+                return False
+        else:
+            # Serializability of modified subtrees is checked during
+            # their serialization, so there is no need to dump them twice
+            subtrees = {key: db[key] for key in keys if key in db}
+
+        for key, value in subtrees.items():
             if not isinstance(key, (str, int)):
                 logger.warning(
                     "DbAutoFix: Dropped key %s, because it is not string or int",
@@ -127,38 +201,298 @@ class Database(dict):
 
         return True
 
-    def save(self) -> bool:
-        """Save database"""
-        if not self.process_db_autofix(self):
+    def _mark_dirty(
+        self,
+        owner: typing.Optional[str] = None,
+        key: typing.Optional[str] = None,
+    ):
+        if owner is None:
+            self._global_version += 1
+            for owner in [*self, *self._blobs]:
+                self._dirty[owner] = None
+            return
+
+        self._owner_versions[owner] += 1
+        if key is None:
+            self._dirty[owner] = None
+        elif (keys := self._dirty.setdefault(owner, set())) is not None:
+            keys.add(key)
+
+    def version(self, owner: str) -> typing.Tuple[int, int]:
+        """
+        Get the version of `owner`, which changes on every save of its keys
+        :param owner: Owner to check
+        :return: Opaque value, which can be compared for equality
+        """
+        return self._global_version, self._owner_versions.get(owner, 0)
+
+    def save(
+        self,
+        owner: typing.Optional[str] = None,
+        key: typing.Optional[str] = None,
+    ) -> bool:
+        """
+        Schedule database save. Writes are coalesced and flushed
+        to disk in background after `db_flush_interval` seconds
+        :param owner: Owner, which was modified. If not passed, the whole
+            database is considered modified
+        :param key: Key of `owner`, which was modified. If not passed,
+            the whole owner is considered modified
+        :return: `True` if save was scheduled
+        """
+        self._mark_dirty(owner, key)
+
+        if not self._backend:
+            return True
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return self.flush()
+
+        if not self._flush_interval:
+            return self.flush()
+
+        if not self._saving_task or self._saving_task.done():
+            self._saving_task = asyncio.ensure_future(self._flush_later())
+
+        return True
+
+    async def _flush_later(self):
+        while True:
+            await asyncio.sleep(self._flush_interval)
+
+            if (payload := self._prepare_flush()) is None:
+                return
+
+            await asyncio.get_running_loop().run_in_executor(
+                self._writer,
+                self._write,
+                payload,
+            )
+
+            if not self._dirty:
+                return
+
+    def flush(self) -> bool:
+        """
+        Write pending changes to disk immediately, blocking the caller
+        :return: `True` on success, otherwise `False`
+        """
+        if not self._backend:
+            return True
+
+        if self._saving_task and not self._saving_task.done():
+            self._saving_task.cancel()
+
+        if (payload := self._prepare_flush()) is None:
+            return not self._dirty
+
+        try:
+            # Writes must reach the backend in the same order they were prepared
+            return self._writer.submit(self._write, payload).result()
+        except RuntimeError:
+            # Executor is already shut down on interpreter exit
+            return self._write(payload)
+
+    def _writable_blobs(self, owner: str) -> typing.Dict[str, str]:
+        """
+        Get serialized values of `owner`, which can be modified in place.
+        Maps, referenced by revisions, are copied on the first write
+        """
+        blobs = self._blobs.get(owner)
+        if blobs is None or owner in self._frozen:
+            self._blobs[owner] = blobs = dict(blobs or {})
+            self._frozen.discard(owner)
+
+        return blobs
+
+    def _serialize_owner(
+        self,
+        owner: str,
+        keys: typing.Optional[typing.Set[str]],
+    ) -> typing.Dict[str, typing.Optional[str]]:
+        value = self[owner]
+        blobs = self._blobs.get(owner, {})
+        if keys is None:
+            keys = list(value)
+            present = set(map(str, keys))
+            keys += [key for key in blobs if key not in present]
+
+        updates = {}
+        for key in keys:
+            if key in value:
+                updates[str(key)] = ujson.dumps(value[key])
+            elif str(key) in blobs:
+                updates[str(key)] = None
+
+        return updates
+
+    def _serialize(self, dirty: dict) -> typing.List[Change]:
+        changes = []
+        for owner, keys in dirty.items():
+            if owner not in self:
+                if self._blobs.pop(owner, None) is not None:
+                    self._frozen.discard(owner)
+                    changes.append((owner, None, None))
+
+                continue
+
             try:
-                rev = self._revisions.pop()
-                while not self.process_db_autofix(rev):
-                    rev = self._revisions.pop()
-            except IndexError:
-                raise RuntimeError(
-                    "Can't find revision to restore broken database from "
-                    "database is most likely broken and will lead to problems, "
-                    "so its save is forbidden."
+                updates = self._serialize_owner(owner, keys)
+            except (TypeError, ValueError, OverflowError):
+                # Serialized values are immutable, so the last saved
+                # state of the owner is always a valid one
+                logger.error(
+                    "Owner %s of database is not serializable, rolling it back to"
+                    " the last saved state",
+                    owner,
                 )
+                super().__setitem__(owner, self._deserialize(self._blobs.get(owner)))
+                updates = {}
 
-            self.clear()
-            self.update(**rev)
+            if not updates and owner in self._blobs:
+                continue
 
-            raise RuntimeError(
-                "Rewriting database to the last revision because new one destructed it"
+            blobs = self._writable_blobs(owner)
+            for key, blob in updates.items():
+                if blob is None:
+                    del blobs[key]
+                else:
+                    blobs[key] = blob
+
+                changes.append((owner, key, blob))
+
+        return changes
+
+    @staticmethod
+    def _deserialize(
+        blobs: typing.Optional[typing.Mapping[str, str]],
+    ) -> typing.Dict[str, JSONSerializable]:
+        return {key: ujson.loads(blob) for key, blob in (blobs or {}).items()}
+
+    def _take_revision(self):
+        self._revision_id += 1
+        self._revisions.append(
+            Revision(
+                self._revision_id,
+                time.time(),
+                types.MappingProxyType(dict(self._blobs)),
             )
+        )
+        # Now every owner map is shared with the revision
+        self._frozen = set(self._blobs)
+
+        while len(self._revisions) > REVISIONS_LIMIT:
+            self._revisions.pop(0)
+
+    def _prepare_flush(self) -> typing.Any:
+        """
+        Validate and serialize modified keys on the event loop,
+        so that background thread only deals with immutable payload
+        :return: Backend payload or `None` if there is nothing to write
+        """
+        if not self._dirty and not self._full_write:
+            return None
+
+        dirty, self._dirty = self._dirty, {}
 
-        if self._next_revision_call < time.time():
-            self._revisions += [dict(self)]
+        self.process_db_autofix(self, dirty)
+        changes = self._serialize(dirty)
+
+        if changes and self._next_revision_call < time.time():
+            self._take_revision()
             self._next_revision_call = time.time() + 3
 
-        while len(self._revisions) > 15:
-            self._revisions.pop()
+        full, self._full_write = self._full_write, False
+        return self._backend.prepare(changes, self._blobs, full)
+
+    def _get_revision(self, revision_id: int) -> Revision:
         try:
-            self._db_file.write_text(ujson.dumps(self, indent=4))
-        except Exception:
-            logger.exception("Database save failed!")
-            return False
+            return next(rev for rev in self._revisions if rev.id == revision_id)
+        except StopIteration:
+            raise KeyError(f"Revision {revision_id} not found") from None
+
+    def list_revisions(
+        self,
+        owner: typing.Optional[str] = None,
+    ) -> typing.List[typing.Tuple[int, float]]:
+        """
+        List available revisions of database, newest first
+        :param owner: If passed, only revisions, where `owner` was changed,
+            are returned
+        :return: List of (revision_id, timestamp)
+        """
+        result = []
+        previous = None
+        for rev in self._revisions:
+            # Unchanged owners are shared between revisions, so identity
+            # check is enough to find out whether the owner was modified
+            if owner is None or rev.owners.get(owner) is not previous:
+                result.append((rev.id, rev.time))
+
+            if owner is not None:
+                previous = rev.owners.get(owner)
+
+        return result[::-1]
+
+    def get_revision(
+        self, revision_id: int, owner: str
+    ) -> typing.Dict[str, JSONSerializable]:
+        """
+        Get the state of `owner` at the specified revision
+        :param revision_id: Revision ID from `list_revisions`
+        :param owner: Owner to get
+        :return: Copy of owner's values
+        """
+        return self._deserialize(self._get_revision(revision_id).owners.get(owner))
+
+    def diff_revision(self, revision_id: int, owner: str) -> typing.Dict[str, dict]:
+        """
+        Compare the state of `owner` at the specified revision with the current one
+        :param revision_id: Revision ID from `list_revisions`
+        :param owner: Owner to compare
+        :return: Dictionary with `added`, `removed` and `changed` keys.
+            `changed` maps key to (old value, new value)
+        """
+        old = self.get_revision(revision_id, owner)
+        new = {str(key): value for key, value in super().get(owner, {}).items()}
+        return {
+            "added": {key: new[key] for key in new.keys() - old.keys()},
+            "removed": {key: old[key] for key in old.keys() - new.keys()},
+            "changed": {
+                key: (old[key], new[key])
+                for key in old.keys() & new.keys()
+                if old[key] != new[key]
+            },
+        }
+
+    def rollback(self, revision_id: int, owner: typing.Optional[str] = None) -> bool:
+        """
+        Roll back database to the specified revision
+        :param revision_id: Revision ID from `list_revisions`
+        :param owner: If passed, only this owner is rolled back
+        :return: `True` if save was scheduled
+        """
+        revision = self._get_revision(revision_id)
+        for name in [owner] if owner is not None else [*self, *revision.owners]:
+            if name in revision.owners:
+                super().__setitem__(name, self._deserialize(revision.owners[name]))
+            else:
+                self.pop(name, None)
+
+        return self.save(owner)
+
+    def _write(self, payload: typing.Any) -> bool:
+        with self._write_lock:
+            try:
+                self._backend.write(payload)
+            except Exception:
+                logger.exception("Database save failed!")
+                # Incremental backends can't recover from lost change set,
+                # so the next flush must rewrite the whole storage
+                self._full_write = True
+                return False
 
         return True
 
@@ -229,7 +563,7 @@ class Database(dict):
             )
 
         super().setdefault(owner, {})[key] = value
-        return self.save()
+        return self.save(owner, key)
 
     def pointer(
         self,
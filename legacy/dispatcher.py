@@ -22,21 +22,28 @@
 # You can redistribute it and/or modify it under the terms of the GNU AGPLv3
 # 🔑 https://www.gnu.org/licenses/agpl-3.0.html
 
-import asyncio
 import contextlib
-import copy
+import functools
 import inspect
 import logging
 import re
 import sys
 import traceback
 import typing
+import weakref
 
 from legacytl import events
 from legacytl.errors import FloodWaitError, RPCError
 from legacytl.tl.types import Message
 
 from . import main, security, utils
+from ._context import module_context, tag_client
+from ._task_limiter import (
+    DEFAULT_GLOBAL_LIMIT,
+    DEFAULT_MODULE_LIMIT,
+    DEFAULT_QUEUE_SIZE,
+    TaskLimiter,
+)
 from .database import Database
 from .loader import Modules
 from .tl_cache import CustomTelegramClient
@@ -46,6 +53,7 @@ logger = logging.getLogger(__name__)
 # Keys for layout switch
 ru_keys = 'ёйцукенгшщзхъфывапролджэячсмитьбю.Ё"№;%:?ЙЦУКЕНГШЩЗХЪФЫВАПРОЛДЖЭ/ЯЧСМИТЬБЮ,'
 en_keys = "`qwertyuiop[]asdfghjkl;'zxcvbnm,./~@#$%^&QWERTYUIOP{}ASDFGHJKL:\"|ZXCVBNM<>?"
+LAYOUT_CHANGE = str.maketrans(ru_keys + en_keys, en_keys + ru_keys)
 ALL_TAGS = [
     "no_commands",
     "only_commands",
@@ -91,6 +99,185 @@ ALL_TAGS = [
     "aliases",
 ]
 
+# Tags, which depend only on the message itself. Each one gets a bit in
+# message features mask, so a watcher can be checked with a single `&`
+STATIC_TAGS: typing.Dict[str, typing.Callable[[Message, str], typing.Any]] = {
+    "out": lambda m, mime: getattr(m, "out", True),
+    "in": lambda m, mime: not getattr(m, "out", True),
+    "only_messages": lambda m, mime: isinstance(m, Message),
+    "editable": lambda m, mime: (
+        not getattr(m, "out", False)
+        and not getattr(m, "fwd_from", False)
+        and not getattr(m, "sticker", False)
+        and not getattr(m, "via_bot_id", False)
+    ),
+    "no_media": lambda m, mime: (
+        not isinstance(m, Message) or not getattr(m, "media", False)
+    ),
+    "only_media": lambda m, mime: (
+        isinstance(m, Message) and getattr(m, "media", False)
+    ),
+    "only_photos": lambda m, mime: mime.startswith("image/"),
+    "only_videos": lambda m, mime: mime.startswith("video/"),
+    "only_audios": lambda m, mime: mime.startswith("audio/"),
+    "only_stickers": lambda m, mime: getattr(m, "sticker", False),
+    "only_docs": lambda m, mime: getattr(m, "document", False),
+    "only_inline": lambda m, mime: getattr(m, "via_bot_id", False),
+    "only_channels": lambda m, mime: (
+        getattr(m, "is_channel", False) and not getattr(m, "is_group", False)
+    ),
+    "no_channels": lambda m, mime: not getattr(m, "is_channel", False),
+    "no_groups": lambda m, mime: (
+        not getattr(m, "is_group", False)
+        or getattr(m, "is_private", False)
+        or getattr(m, "is_channel", False)
+    ),
+    "only_groups": lambda m, mime: (
+        getattr(m, "is_group", False)
+        or not getattr(m, "is_private", False)
+        and not getattr(m, "is_channel", False)
+    ),
+    "no_pm": lambda m, mime: not getattr(m, "is_private", False),
+    "only_pm": lambda m, mime: getattr(m, "is_private", False),
+    "no_inline": lambda m, mime: not getattr(m, "via_bot_id", False),
+    "no_stickers": lambda m, mime: not getattr(m, "sticker", False),
+    "no_docs": lambda m, mime: not getattr(m, "document", False),
+    "no_audios": lambda m, mime: not mime.startswith("audio/"),
+    "no_videos": lambda m, mime: not mime.startswith("video/"),
+    "no_photos": lambda m, mime: not mime.startswith("image/"),
+    "no_forwards": lambda m, mime: not getattr(m, "fwd_from", False),
+    "no_reply": lambda m, mime: not getattr(m, "reply_to_msg_id", False),
+    "only_forwards": lambda m, mime: getattr(m, "fwd_from", False),
+    "only_reply": lambda m, mime: getattr(m, "reply_to_msg_id", False),
+    "mention": lambda m, mime: getattr(m, "mentioned", False),
+    "no_mention": lambda m, mime: not getattr(m, "mentioned", False),
+}
+TAG_BITS = {tag: 1 << i for i, tag in enumerate(STATIC_TAGS)}
+MIME_TAGS_MASK = sum(
+    TAG_BITS[tag]
+    for tag in (
+        "only_photos",
+        "only_videos",
+        "only_audios",
+        "no_audios",
+        "no_videos",
+        "no_photos",
+    )
+)
+
+
+def _normalize_chat_id(chat_id: typing.Union[int, str]) -> typing.Union[int, str]:
+    return chat_id if not str(chat_id).startswith("-100") else int(str(chat_id)[4:])
+
+
+# Tags, which depend on the value, the handler was tagged with.
+# Each entry makes a check for that value
+DYNAMIC_TAGS: typing.Dict[
+    str, typing.Callable[[typing.Any], typing.Callable[[typing.Any], typing.Any]]
+] = {
+    "startswith": lambda value: lambda m: (
+        isinstance(m, Message) and m.raw_text.startswith(value)
+    ),
+    "endswith": lambda value: lambda m: (
+        isinstance(m, Message) and m.raw_text.endswith(value)
+    ),
+    "contains": lambda value: lambda m: isinstance(m, Message) and value in m.raw_text,
+    "regex": lambda value: (
+        lambda m, pattern=re.compile(value): (
+            isinstance(m, Message) and pattern.search(m.raw_text)
+        )
+    ),
+    "filter": lambda value: lambda m: callable(value) and value(m),
+    "from_id": lambda value: lambda m: getattr(m, "sender_id", None) == value,
+    "chat_id": lambda value: (
+        lambda m, chat_id=_normalize_chat_id(value): utils.get_chat_id(m) == chat_id
+    ),
+}
+
+
+def message_mask(m: typing.Any, tags_mask: int) -> int:
+    """
+    Get features mask of message
+    :param m: Message or event
+    :param tags_mask: Only tags from this mask are evaluated
+    :return: Mask with bits of static tags, which message satisfies
+    """
+    mime = utils.mime_type(m) if tags_mask & MIME_TAGS_MASK else ""
+    return sum(
+        bit
+        for tag, bit in TAG_BITS.items()
+        if tags_mask & bit and STATIC_TAGS[tag](m, mime)
+    )
+
+
+class CompiledTags(typing.NamedTuple):
+    """Tags of handler, compiled once for fast checks"""
+
+    mask: int
+    checks: typing.Tuple[typing.Tuple[str, typing.Callable[[typing.Any], bool]], ...]
+    no_commands: bool
+    only_commands: bool
+
+    @classmethod
+    def compile(cls, func: callable) -> "CompiledTags":
+        return cls(
+            mask=sum(bit for tag, bit in TAG_BITS.items() if getattr(func, tag, False)),
+            checks=tuple(
+                (tag, DYNAMIC_TAGS[tag](getattr(func, tag)))
+                for tag in ALL_TAGS
+                if tag in DYNAMIC_TAGS and getattr(func, tag, False)
+            ),
+            no_commands=bool(getattr(func, "no_commands", False)),
+            only_commands=bool(getattr(func, "only_commands", False)),
+        )
+
+    def check(self, m: typing.Any, mask: int) -> typing.Optional[str]:
+        """
+        Check tags, which don't require command handling
+        :param m: Message or event
+        :param mask: Features mask of message, see `message_mask`
+        :return: The first failed tag or `None`
+        """
+        if missing := self.mask & ~mask:
+            return next(tag for tag, bit in TAG_BITS.items() if missing & bit)
+
+        return next((tag for tag, check in self.checks if not check(m)), None)
+
+
+class CompiledWatcher(typing.NamedTuple):
+    func: callable
+    modname: str
+    module: str
+    tags: CompiledTags
+    coalesce: bool
+
+
+class WatcherIndex(typing.NamedTuple):
+    """
+    Watchers, grouped by buckets, which messages can be matched against.
+    Bucket key is `(kind, id, direction)`, where `kind` is `chat`, `from`
+    or `any`, and direction is `out`, `in` or `None`
+    """
+
+    buckets: typing.Dict[tuple, typing.List[CompiledWatcher]]
+    tags_mask: int
+
+
+class RouterConfig(typing.NamedTuple):
+    """Dispatcher settings from database, compiled for fast lookups"""
+
+    prefixes: typing.Dict[str, str]
+    own_prefix: str
+    blacklist_chats: typing.FrozenSet[typing.Union[int, str]]
+    whitelist_chats: typing.FrozenSet[int]
+    whitelist_modules: typing.FrozenSet[str]
+    disabled_watchers: typing.Dict[str, typing.FrozenSet[typing.Union[int, str]]]
+    no_nickname: bool
+    nonickcmds: typing.FrozenSet[str]
+    nonickusers: typing.FrozenSet[int]
+    nonickchats: typing.FrozenSet[int]
+    grep: bool
+
 
 class CommandDispatcher:
     def __init__(
@@ -107,6 +294,7 @@ class CommandDispatcher:
         self.security = security.SecurityManager(client, db)
 
         self.check_security = self.security.check
+        self.check_security_many = self.security.check_many
         self._me = self._client.legacy_me.id
         self._cached_usernames = [
             (
@@ -121,6 +309,63 @@ class CommandDispatcher:
         )
 
         self.raw_handlers = []
+        self._router: typing.Optional[RouterConfig] = None
+        self._router_version = None
+        self._watchers: typing.Optional[WatcherIndex] = None
+        self._watchers_version = None
+        self._compiled_tags: typing.MutableMapping[callable, CompiledTags] = (
+            weakref.WeakKeyDictionary()
+        )
+        self.tasks = TaskLimiter(
+            global_limit=self._get_limit("tasks_global_limit", DEFAULT_GLOBAL_LIMIT),
+            module_limit=self._get_limit("tasks_module_limit", DEFAULT_MODULE_LIMIT),
+            queue_size=self._get_limit("tasks_queue_size", DEFAULT_QUEUE_SIZE),
+            policy=main.get_config_key("tasks_overflow_policy"),
+        )
+        # If set, only the latest queued message per chat is kept for each watcher.
+        # Otherwise, only watchers marked with `coalesce` tag opt in to it
+        self._coalesce_watchers = main.get_config_key("coalesce_watchers") is True
+
+    @staticmethod
+    def _get_limit(key: str, default: int) -> int:
+        if (limit := main.get_config_key(key)) is False:
+            return default
+
+        try:
+            return int(limit)
+        except (TypeError, ValueError):
+            return default
+
+    def _get_router(self) -> RouterConfig:
+        """Get dispatcher settings, recompiling them if database changed"""
+        if self._router_version == (version := self._db.version(main.__name__)):
+            return self._router
+
+        key = main.__name__
+        prefixes = self._db.get(key, "command_prefix", None)
+        if isinstance(prefixes, str):
+            self._db.set(key, "command_prefix", {f"{self.client.tg_id}": prefixes})
+            return self._get_router()
+
+        prefixes = prefixes or {}
+        self._router = RouterConfig(
+            prefixes=dict(prefixes),
+            own_prefix=prefixes.get(f"{self.client.tg_id}", "."),
+            blacklist_chats=frozenset(self._db.get(key, "blacklist_chats", [])),
+            whitelist_chats=frozenset(self._db.get(key, "whitelist_chats", [])),
+            whitelist_modules=frozenset(self._db.get(key, "whitelist_modules", [])),
+            disabled_watchers={
+                modname: frozenset(rules)
+                for modname, rules in self._db.get(key, "disabled_watchers", {}).items()
+            },
+            no_nickname=bool(self._db.get(key, "no_nickname", False)),
+            nonickcmds=frozenset(self._db.get(key, "nonickcmds", [])),
+            nonickusers=frozenset(self._db.get(key, "nonickusers", [])),
+            nonickchats=frozenset(self._db.get(key, "nonickchats", [])),
+            grep=bool(self._db.get(key, "grep", False)),
+        )
+        self._router_version = version
+        return self._router
 
     def _grep(
         self, pattern: str, text: str, invert: bool = False, ignore_case: bool = False
@@ -220,22 +465,13 @@ class CommandDispatcher:
         if not hasattr(event, "message") or not hasattr(event.message, "message"):
             return False
 
-        key = main.__name__
-        default = "."
-        prefix = self._db.get(key, "command_prefix", default)
-        if prefix:
-            if isinstance(prefix, str):
-                self._db.set(key, "command_prefix", {f"{self.client.tg_id}": prefix})
-        set_default_prefix = (
-            self._db.get(key, "command_prefix").get(f"{self.client.tg_id}")
-            if event.out
-            else default
-        )
-        prefix = self._db.get(key, "command_prefix", {}).get(
-            f"{event.sender_id}", set_default_prefix
+        router = self._get_router()
+        prefix = router.prefixes.get(
+            f"{event.sender_id}",
+            router.own_prefix if event.out else ".",
         )
 
-        change = str.maketrans(ru_keys + en_keys, en_keys + ru_keys)
+        change = LAYOUT_CHANGE
         message = utils.censor(event.message)
 
         if not event.message.message:
@@ -272,9 +508,9 @@ class CommandDispatcher:
         elif not event.message.message.startswith(prefix):
             return False
 
-        blacklist_chats = self._db.get(main.__name__, "blacklist_chats", [])
-        whitelist_chats = self._db.get(main.__name__, "whitelist_chats", [])
-        whitelist_modules = self._db.get(main.__name__, "whitelist_modules", [])
+        blacklist_chats = router.blacklist_chats
+        whitelist_chats = router.whitelist_chats
+        whitelist_modules = router.whitelist_modules
         chat_id = utils.get_chat_id(message)
 
         if chat_id in blacklist_chats or (
@@ -312,12 +548,11 @@ class CommandDispatcher:
             pass
         elif (
             not event.is_private
-            and not self._db.get(main.__name__, "no_nickname", False)
-            and command not in self._db.get(main.__name__, "nonickcmds", [])
-            and initiator not in self._db.get(main.__name__, "nonickusers", [])
+            and not router.no_nickname
+            and command not in router.nonickcmds
+            and initiator not in router.nonickusers
             and not self.security.check_tsec(initiator, command)
-            and utils.get_chat_id(event)
-            not in self._db.get(main.__name__, "nonickchats", [])
+            and utils.get_chat_id(event) not in router.nonickchats
         ):
             return False
 
@@ -342,13 +577,15 @@ class CommandDispatcher:
         if await self._handle_tags(event, func):
             return False
 
-        if self._db.get(main.__name__, "grep", False) and not watcher:
+        if router.grep and not watcher:
             message = self._handle_grep(message)
 
         return message, prefix, txt, func
 
     async def handle_raw(self, event: events.Raw):
         """Handle raw events."""
+        self.security.process_update(event)
+
         for handler in self.raw_handlers:
             if isinstance(event, tuple(handler.updates)):
                 try:
@@ -367,12 +604,16 @@ class CommandDispatcher:
 
         message, _, _, func = message
 
-        asyncio.ensure_future(
-            self.future_dispatcher(
+        self.tasks.submit(
+            func.__self__.__class__.__name__,
+            functools.partial(
+                self.future_dispatcher,
                 func,
                 message,
                 self.command_exc,
-            )
+            ),
+            # Explicit commands must not be dropped or wait behind watchers
+            priority=True,
         )
 
     async def command_exc(self, _, message: Message):
@@ -441,6 +682,75 @@ class CommandDispatcher:
     ) -> bool:
         return bool(await self._handle_tags_ext(event, func))
 
+    def _compile_tags(self, func: callable) -> CompiledTags:
+        try:
+            return self._compiled_tags[func]
+        except KeyError:
+            tags = self._compiled_tags[func] = CompiledTags.compile(func)
+            return tags
+        except TypeError:
+            # Handler can't be weakly referenced, so it's not cached
+            return CompiledTags.compile(func)
+
+    def _get_watchers(self) -> WatcherIndex:
+        """Get watchers index, rebuilding it if watchers list changed"""
+        if self._watchers_version == self._modules.watchers_version:
+            return self._watchers
+
+        buckets = {}
+        tags_mask = 0
+        for func in self._modules.watchers:
+            try:
+                tags = self._compile_tags(func)
+            except Exception:
+                logger.exception("Can't compile tags of watcher %s", func)
+                continue
+
+            tags_mask |= tags.mask
+            direction = (
+                "out"
+                if getattr(func, "out", False)
+                else "in" if getattr(func, "in", False) else None
+            )
+            if getattr(func, "chat_id", False):
+                key = ("chat", _normalize_chat_id(func.chat_id), direction)
+            elif getattr(func, "from_id", False):
+                key = ("from", func.from_id, direction)
+            else:
+                key = ("any", None, direction)
+
+            buckets.setdefault(key, []).append(
+                CompiledWatcher(
+                    func=func,
+                    modname=str(func.__self__.__class__.strings["name"]),
+                    module=func.__self__.__module__,
+                    tags=tags,
+                    coalesce=bool(getattr(func, "coalesce", False)),
+                )
+            )
+
+        self._watchers = WatcherIndex(buckets=buckets, tags_mask=tags_mask)
+        self._watchers_version = self._modules.watchers_version
+        return self._watchers
+
+    async def _check_tags(
+        self,
+        event: typing.Union[events.NewMessage, events.MessageDeleted],
+        tags: CompiledTags,
+        mask: typing.Optional[int] = None,
+    ) -> typing.Optional[str]:
+        m = event if isinstance(event, Message) else getattr(event, "message", event)
+        if tags.no_commands and await self._handle_command(event, watcher=True):
+            return "no_commands"
+
+        if tags.only_commands and not await self._handle_command(
+            event,
+            watcher=True,
+        ):
+            return "only_commands"
+
+        return tags.check(m, message_mask(m, tags.mask) if mask is None else mask)
+
     async def _handle_tags_ext(
         self,
         event: typing.Union[events.NewMessage, events.MessageDeleted],
@@ -452,98 +762,7 @@ class CommandDispatcher:
         :param func: The function to handle.
         :return: The reason for the tag to fail.
         """
-        m = event if isinstance(event, Message) else getattr(event, "message", event)
-
-        reverse_mapping = {
-            "out": lambda: getattr(m, "out", True),
-            "in": lambda: not getattr(m, "out", True),
-            "only_messages": lambda: isinstance(m, Message),
-            "editable": (
-                lambda: not getattr(m, "out", False)
-                and not getattr(m, "fwd_from", False)
-                and not getattr(m, "sticker", False)
-                and not getattr(m, "via_bot_id", False)
-            ),
-            "no_media": lambda: (
-                not isinstance(m, Message) or not getattr(m, "media", False)
-            ),
-            "only_media": lambda: isinstance(m, Message) and getattr(m, "media", False),
-            "only_photos": lambda: utils.mime_type(m).startswith("image/"),
-            "only_videos": lambda: utils.mime_type(m).startswith("video/"),
-            "only_audios": lambda: utils.mime_type(m).startswith("audio/"),
-            "only_stickers": lambda: getattr(m, "sticker", False),
-            "only_docs": lambda: getattr(m, "document", False),
-            "only_inline": lambda: getattr(m, "via_bot_id", False),
-            "only_channels": lambda: (
-                getattr(m, "is_channel", False) and not getattr(m, "is_group", False)
-            ),
-            "no_channels": lambda: not getattr(m, "is_channel", False),
-            "no_groups": (
-                lambda: not getattr(m, "is_group", False)
-                or getattr(m, "is_private", False)
-                or getattr(m, "is_channel", False)
-            ),
-            "only_groups": (
-                lambda: getattr(m, "is_group", False)
-                or not getattr(m, "is_private", False)
-                and not getattr(m, "is_channel", False)
-            ),
-            "no_pm": lambda: not getattr(m, "is_private", False),
-            "only_pm": lambda: getattr(m, "is_private", False),
-            "no_inline": lambda: not getattr(m, "via_bot_id", False),
-            "no_stickers": lambda: not getattr(m, "sticker", False),
-            "no_docs": lambda: not getattr(m, "document", False),
-            "no_audios": lambda: not utils.mime_type(m).startswith("audio/"),
-            "no_videos": lambda: not utils.mime_type(m).startswith("video/"),
-            "no_photos": lambda: not utils.mime_type(m).startswith("image/"),
-            "no_forwards": lambda: not getattr(m, "fwd_from", False),
-            "no_reply": lambda: not getattr(m, "reply_to_msg_id", False),
-            "only_forwards": lambda: getattr(m, "fwd_from", False),
-            "only_reply": lambda: getattr(m, "reply_to_msg_id", False),
-            "mention": lambda: getattr(m, "mentioned", False),
-            "no_mention": lambda: not getattr(m, "mentioned", False),
-            "startswith": lambda: (
-                isinstance(m, Message) and m.raw_text.startswith(func.startswith)
-            ),
-            "endswith": lambda: (
-                isinstance(m, Message) and m.raw_text.endswith(func.endswith)
-            ),
-            "contains": lambda: isinstance(m, Message) and func.contains in m.raw_text,
-            "filter": lambda: callable(func.filter) and func.filter(m),
-            "from_id": lambda: getattr(m, "sender_id", None) == func.from_id,
-            "chat_id": (
-                lambda: utils.get_chat_id(m)
-                == (
-                    func.chat_id
-                    if not str(func.chat_id).startswith("-100")
-                    else int(str(func.chat_id)[4:])
-                )
-            ),
-            "regex": lambda: (
-                isinstance(m, Message) and re.search(func.regex, m.raw_text)
-            ),
-        }
-
-        return (
-            "no_commands"
-            if getattr(func, "no_commands", False)
-            and await self._handle_command(event, watcher=True)
-            else (
-                "only_commands"
-                if getattr(func, "only_commands", False)
-                and not await self._handle_command(event, watcher=True)
-                else next(
-                    (
-                        tag
-                        for tag in ALL_TAGS
-                        if getattr(func, tag, False)
-                        and tag in reverse_mapping
-                        and not reverse_mapping[tag]()
-                    ),
-                    None,
-                )
-            )
-        )
+        return await self._check_tags(event, self._compile_tags(func))
 
     async def handle_incoming(
         self,
@@ -552,57 +771,80 @@ class CommandDispatcher:
         """Handle all incoming messages"""
         message = utils.censor(getattr(event, "message", event))
 
-        blacklist_chats = self._db.get(main.__name__, "blacklist_chats", [])
-        whitelist_chats = self._db.get(main.__name__, "whitelist_chats", [])
-        whitelist_modules = self._db.get(main.__name__, "whitelist_modules", [])
+        router = self._get_router()
         chat_id = utils.get_chat_id(message)
 
-        if (blacklist_chats and chat_id in blacklist_chats) or (
-            whitelist_chats and chat_id not in whitelist_chats
+        if (router.blacklist_chats and chat_id in router.blacklist_chats) or (
+            router.whitelist_chats and chat_id not in router.whitelist_chats
         ):
             logger.debug("Message is blacklisted")
             return
 
-        for func in self._modules.watchers:
-            bl = self._db.get(main.__name__, "disabled_watchers", {})
-            modname = str(func.__self__.__class__.strings["name"])
-
-            if (
-                modname in bl
-                and isinstance(message, Message)
-                and (
-                    ("*" in bl[modname])
-                    or (chat_id in bl[modname])
-                    or ("only_chats" in bl[modname] and message.is_private)
-                    or ("only_pm" in bl[modname] and not message.is_private)
-                )
-                or f"{str(chat_id)}.{func.__self__.__module__}" in blacklist_chats
-                or whitelist_modules
-                and f"{str(chat_id)}.{func.__self__.__module__}"
-                not in whitelist_modules
-                or await self._handle_tags(event, func)
-            ):
-                continue
+        index = self._get_watchers()
+        if not index.buckets:
+            return
 
-            # Avoid weird AttributeErrors in weird dochub modules by settings placeholder
-            # of attributes
-            for placeholder in {"text", "raw_text", "out"}:
-                try:
-                    if not hasattr(message, placeholder):
-                        setattr(message, placeholder, "")
-                except UnicodeDecodeError:
-                    pass
-
-            # Run watcher via ensure_future so in case user has a lot
-            # of watchers with long actions, they can run simultaneously
-            asyncio.ensure_future(
-                self.future_dispatcher(
-                    func,
-                    message,
-                    self.watcher_exc,
+        m = event if isinstance(event, Message) else getattr(event, "message", event)
+        mask = message_mask(m, index.tags_mask)
+        direction = "out" if getattr(m, "out", True) else "in"
+        sender_id = getattr(m, "sender_id", None)
+
+        for key in (
+            ("any", None, None),
+            ("any", None, direction),
+            ("chat", chat_id, None),
+            ("chat", chat_id, direction),
+            ("from", sender_id, None),
+            ("from", sender_id, direction),
+        ):
+            for watcher in index.buckets.get(key, ()):
+                bl = router.disabled_watchers.get(watcher.modname)
+                if (
+                    bl
+                    and isinstance(message, Message)
+                    and (
+                        ("*" in bl)
+                        or (chat_id in bl)
+                        or ("only_chats" in bl and message.is_private)
+                        or ("only_pm" in bl and not message.is_private)
+                    )
+                    or f"{str(chat_id)}.{watcher.module}" in router.blacklist_chats
+                    or router.whitelist_modules
+                    and f"{str(chat_id)}.{watcher.module}"
+                    not in router.whitelist_modules
+                    or await self._check_tags(event, watcher.tags, mask)
+                ):
+                    continue
+
+                # Avoid weird AttributeErrors in weird dochub modules by settings placeholder
+                # of attributes
+                for placeholder in {"text", "raw_text", "out"}:
+                    try:
+                        if not hasattr(message, placeholder):
+                            setattr(message, placeholder, "")
+                    except UnicodeDecodeError:
+                        pass
+
+                # Run watcher in separate task so in case user has a lot
+                # of watchers with long actions, they can run simultaneously.
+                # Under load, watchers, which opted in to coalescing,
+                # get only the latest message per chat
+                self.tasks.submit(
+                    watcher.func.__self__.__class__.__name__,
+                    functools.partial(
+                        self.future_dispatcher,
+                        watcher.func,
+                        message,
+                        self.watcher_exc,
+                    ),
+                    key=(
+                        (watcher.func, chat_id)
+                        if watcher.coalesce or self._coalesce_watchers
+                        else None
+                    ),
                 )
-            )
 
+    @tag_client(lambda self: self.client.tg_id)
     async def future_dispatcher(
         self,
         func: callable,
@@ -610,10 +852,8 @@ class CommandDispatcher:
         exception_handler: callable,
         *args,
     ):
-        # Will be used to determine, which client caused logging messages
-        # parsed via inspect.stack()
-        _legacy_client_id_logging_tag = copy.copy(self.client.tg_id)  # noqa: F841
         try:
-            await func(message)
+            with module_context(getattr(func, "__self__", None)):
+                await func(message)
         except Exception as e:
             await exception_handler(e, message, *args)
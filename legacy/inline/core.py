@@ -8,6 +8,7 @@
 
 import asyncio
 import contextlib
+import heapq
 import logging
 import time
 import typing
@@ -40,6 +41,9 @@ from .utils import Utils
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of live inline units. Least recently used ones are unloaded first
+UNITS_LIMIT = 5000
+
 
 class InlineManager(
     Utils,
@@ -76,6 +80,16 @@ class InlineManager(
 
         self._units: typing.Dict[str, dict] = {}
         self._custom_map: typing.Dict[str, callable] = {}
+        # (`_callback_data` or `_switch_query`, value) -> unit_id -> button
+        self._button_index: typing.Dict[
+            typing.Tuple[str, str],
+            typing.Dict[str, dict],
+        ] = {}
+        self._indexed_units: typing.Dict[str, typing.List[typing.Tuple[str, str]]] = {}
+        # (ttl, unit_id). Entries of removed units are skipped, once they are due
+        self._expiry: typing.List[typing.Tuple[float, str]] = []
+        self._expiry_changed = asyncio.Event()
+        self._units_limit = UNITS_LIMIT
         self.fsm: typing.Dict[str, str] = {}
         self._web_auth_tokens: typing.List[str] = []
         self._error_events: typing.Dict[str, asyncio.Event] = {}
@@ -95,13 +109,22 @@ class InlineManager(
         self.bot_username: str = None
 
     async def _cleaner(self):
-        """Cleans outdated inline units"""
+        """Unloads inline units, once their ttl expires"""
         while True:
-            for unit_id, unit in self._units.copy().items():
-                if (unit.get("ttl") or (time.time() + self._markup_ttl)) < time.time():
-                    del self._units[unit_id]
-
-            await asyncio.sleep(5)
+            now = time.time()
+            while self._expiry and self._expiry[0][0] <= now:
+                ttl, unit_id = heapq.heappop(self._expiry)
+                unit = self._units.get(unit_id)
+                # Unit could be removed or its ttl could be changed since then
+                if unit is not None and unit.get("ttl") == ttl:
+                    self._expire_unit(unit_id)
+
+            self._expiry_changed.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    self._expiry_changed.wait(),
+                    self._expiry[0][0] - now if self._expiry else None,
+                )
 
     async def register_manager(
         self,
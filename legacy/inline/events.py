@@ -24,6 +24,7 @@ from aiogram.types import Message as AiogramMessage
 from aiogram.types import PreCheckoutQuery as AiogramPreCheckoutQuery
 
 from .. import utils
+from .._context import module_context
 from .types import BotInlineCall, InlineCall, InlineQuery, InlineUnit
 
 logger = logging.getLogger(__name__)
@@ -71,10 +72,12 @@ class Events(InlineUnit):
         ):
             instance = InlineQuery(inline_query=inline_query)
 
+            handler = self._allmodules.inline_handlers[cmd]
             try:
-                if not (
-                    result := await self._allmodules.inline_handlers[cmd](instance)
-                ):
+                with module_context(getattr(handler, "__self__", None)):
+                    result = await handler(instance)
+
+                if not result:
                     return
             except Exception:
                 logger.exception("Error on running inline watcher!")
@@ -233,13 +236,14 @@ class Events(InlineUnit):
         for func in self._allmodules.callback_handlers.values():
             if await self.check_inline_security(func=func, user=call.from_user.id):
                 try:
-                    await func(
-                        (
-                            BotInlineCall
-                            if getattr(getattr(call, "message", None), "chat", None)
-                            else InlineCall
-                        )(call, self, None)
-                    )
+                    with module_context(getattr(func, "__self__", None)):
+                        await func(
+                            (
+                                BotInlineCall
+                                if getattr(getattr(call, "message", None), "chat", None)
+                                else InlineCall
+                            )(call, self, None)
+                        )
                 except Exception:
                     logger.exception("Error on running callback watcher!")
                     await call.answer(
@@ -248,66 +252,55 @@ class Events(InlineUnit):
                     )
                     continue
 
-        for unit_id, unit in self._units.copy().items():
-            for button in utils.array_sum(unit.get("buttons", [])):
-                if not isinstance(button, dict):
-                    logger.warning(
-                        "Can't process update, because of corrupted button: %s",
-                        button,
+        for unit_id, unit, button in self._find_buttons("_callback_data", call.data):
+            self._touch_unit(unit_id)
+            if (
+                button.get("disable_security", False)
+                or unit.get("disable_security", False)
+                or (unit.get("force_me", False) and call.from_user.id == self._me)
+                or not unit.get("force_me", False)
+                and (
+                    await self.check_inline_security(
+                        func=unit.get(
+                            "perms_map",
+                            lambda: self._client.dispatcher.security._default,
+                        )(),  # we call it so we can get reloaded rights in runtime
+                        user=call.from_user.id,
                     )
-                    continue
-
-                if button.get("_callback_data") == call.data:
-                    if (
-                        button.get("disable_security", False)
-                        or unit.get("disable_security", False)
-                        or (
-                            unit.get("force_me", False)
-                            and call.from_user.id == self._me
-                        )
-                        or not unit.get("force_me", False)
-                        and (
-                            await self.check_inline_security(
-                                func=unit.get(
-                                    "perms_map",
-                                    lambda: self._client.dispatcher.security._default,
-                                )(),  # we call it so we can get reloaded rights in runtime
-                                user=call.from_user.id,
-                            )
-                            if "message" in unit
-                            else False
-                        )
-                    ):
-                        pass
-                    elif call.from_user.id not in (
-                        self._client.dispatcher.security._owner
-                        + unit.get("always_allow", [])
-                        + button.get("always_allow", [])
-                    ):
-                        await call.answer(
-                            self.translator.getkey("inline.button403"), show_alert=True
-                        )
-                        return
+                    if "message" in unit
+                    else False
+                )
+            ):
+                pass
+            elif call.from_user.id not in (
+                self._client.dispatcher.security._owner
+                + unit.get("always_allow", [])
+                + button.get("always_allow", [])
+            ):
+                await call.answer(
+                    self.translator.getkey("inline.button403"), show_alert=True
+                )
+                return
 
-                    try:
-                        result = await button["callback"](
-                            (
-                                BotInlineCall
-                                if getattr(getattr(call, "message", None), "chat", None)
-                                else InlineCall
-                            )(call, self, unit_id),
-                            *button.get("args", []),
-                            **button.get("kwargs", {}),
-                        )
-                    except Exception:
-                        logger.exception("Error on running callback watcher!")
-                        await call.answer(
-                            "Произошла ошибка при обработке запроса. Больше информации в логах",
-                            show_alert=True,
-                        )
-                        return
+            try:
+                result = await button["callback"](
+                    (
+                        BotInlineCall
+                        if getattr(getattr(call, "message", None), "chat", None)
+                        else InlineCall
+                    )(call, self, unit_id),
+                    *button.get("args", []),
+                    **button.get("kwargs", {}),
+                )
+            except Exception:
+                logger.exception("Error on running callback watcher!")
+                await call.answer(
+                    "Произошла ошибка при обработке запроса. Больше информации в логах",
+                    show_alert=True,
+                )
+                return
 
-                    return result
+            return result
 
         if call.data in self._custom_map:
             if (
@@ -360,41 +353,35 @@ class Events(InlineUnit):
         if not query:
             return
 
-        for unit_id, unit in self._units.items():
+        unit = self._units.get(query)
+        if unit is not None and isinstance(unit.get("future"), Event):
+            unit["inline_message_id"] = chosen_inline_query.inline_message_id
+            unit["future"].set()
+            return
+
+        if not (parts := query.split()):
+            return
+
+        for unit_id, unit, button in self._find_buttons("_switch_query", parts[0]):
             if (
-                unit_id == query
-                and "future" in unit
-                and isinstance(unit["future"], Event)
+                "input" in button
+                and chosen_inline_query.from_user.id
+                in [self._me]
+                + self._client.dispatcher.security._owner
+                + unit.get("always_allow", [])
             ):
-                unit["inline_message_id"] = chosen_inline_query.inline_message_id
-                unit["future"].set()
-                return
+                query = query.split(maxsplit=1)[1] if len(query.split()) > 1 else ""
 
-        for unit_id, unit in self._units.copy().items():
-            for button in utils.array_sum(unit.get("buttons", [])):
-                if (
-                    "_switch_query" in button
-                    and "input" in button
-                    and button["_switch_query"] == query.split()[0]
-                    and chosen_inline_query.from_user.id
-                    in [self._me]
-                    + self._client.dispatcher.security._owner
-                    + unit.get("always_allow", [])
-                ):
-                    query = query.split(maxsplit=1)[1] if len(query.split()) > 1 else ""
-
-                    try:
-                        return await button["handler"](
-                            InlineCall(chosen_inline_query, self, unit_id),
-                            query,
-                            *button.get("args", []),
-                            **button.get("kwargs", {}),
-                        )
-                    except Exception:
-                        logger.exception(
-                            "Exception while running chosen query watcher!"
-                        )
-                        return
+                try:
+                    return await button["handler"](
+                        InlineCall(chosen_inline_query, self, unit_id),
+                        query,
+                        *button.get("args", []),
+                        **button.get("kwargs", {}),
+                    )
+                except Exception:
+                    logger.exception("Exception while running chosen query watcher!")
+                    return
 
     async def _query_help(self, inline_query: InlineQuery):
         _help = []
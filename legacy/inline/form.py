@@ -4,7 +4,6 @@
 # You can redistribute it and/or modify it under the terms of the GNU AGPLv3
 # 🔑 https://www.gnu.org/licenses/agpl-3.0.html
 
-import contextlib
 import copy
 import logging
 import os
@@ -32,6 +31,7 @@ from legacytl.extensions.html import CUSTOM_EMOJIS
 from legacytl.tl.types import Message
 
 from .. import main, utils
+from .._context import tag_client
 from ..types import LegacyReplyMarkup
 from .types import InlineMessage, InlineUnit
 
@@ -58,6 +58,7 @@ class Placeholder:
 
 
 class Form(InlineUnit):
+    @tag_client(lambda self: self._client.tg_id)
     async def form(
         self,
         text: str,
@@ -108,9 +109,6 @@ class Form(InlineUnit):
         :param silent: Whether the form must be sent silently (w/o "Opening form..." message)
         :return: If form is sent, returns :obj:`InlineMessage`, otherwise returns `False`
         """
-        with contextlib.suppress(AttributeError):
-            _legacy_client_id_logging_tag = copy.copy(self._client.tg_id)  # noqa: F841
-
         if reply_markup is None:
             reply_markup = []
 
@@ -332,6 +330,8 @@ class Form(InlineUnit):
             **({"always_allow": always_allow} if always_allow else {}),
         }
 
+        self._schedule_unit(unit_id)
+
         async def answer(msg: str):
             nonlocal message
             if isinstance(message, Message):
@@ -349,7 +349,7 @@ class Form(InlineUnit):
         except Exception:
             logger.exception("Can't send form")
 
-            del self._units[unit_id]
+            self._remove_unit(unit_id)
             await answer(
                 self.translator.getkey("inline.invoke_failed_logs").format(
                     utils.escape_html(
@@ -389,42 +389,39 @@ class Form(InlineUnit):
         except IndexError:
             return
 
-        for unit in self._units.copy().values():
-            for button in utils.array_sum(unit.get("buttons", [])):
-                if (
-                    "_switch_query" in button
-                    and "input" in button
-                    and button["_switch_query"] == query
-                    and inline_query.from_user.id
-                    in [self._me]
-                    + self._client.dispatcher.security._owner
-                    + unit.get("always_allow", [])
-                ):
-                    await inline_query.answer(
-                        [
-                            InlineQueryResultArticle(
-                                id=utils.rand(20),
-                                title=button["input"],
-                                description=(
-                                    self.translator.getkey("inline.keep_id").format(
-                                        random.choice(VERIFICATION_EMOJIES)
-                                    )
-                                ),
-                                input_message_content=InputTextMessageContent(
-                                    message_text=(
-                                        "🔄 <b>Transferring value to"
-                                        " userbot...</b>\n<i>This message will be"
-                                        " deleted automatically</i>"
-                                        if inline_query.from_user.id == self._me
-                                        else "🔄 <b>Transferring value to userbot...</b>"
-                                    ),
-                                    disable_web_page_preview=True,
+        for _, unit, button in self._find_buttons("_switch_query", query):
+            if (
+                "input" in button
+                and inline_query.from_user.id
+                in [self._me]
+                + self._client.dispatcher.security._owner
+                + unit.get("always_allow", [])
+            ):
+                await inline_query.answer(
+                    [
+                        InlineQueryResultArticle(
+                            id=utils.rand(20),
+                            title=button["input"],
+                            description=(
+                                self.translator.getkey("inline.keep_id").format(
+                                    random.choice(VERIFICATION_EMOJIES)
+                                )
+                            ),
+                            input_message_content=InputTextMessageContent(
+                                message_text=(
+                                    "🔄 <b>Transferring value to"
+                                    " userbot...</b>\n<i>This message will be"
+                                    " deleted automatically</i>"
+                                    if inline_query.from_user.id == self._me
+                                    else "🔄 <b>Transferring value to userbot...</b>"
                                 ),
-                            )
-                        ],
-                        cache_time=60,
-                    )
-                    return
+                                disable_web_page_preview=True,
+                            ),
+                        )
+                    ],
+                    cache_time=60,
+                )
+                return
 
         if (
             inline_query.query not in self._units
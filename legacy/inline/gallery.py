@@ -5,8 +5,6 @@
 # 🔑 https://www.gnu.org/licenses/agpl-3.0.html
 
 import asyncio
-import contextlib
-import copy
 import functools
 import logging
 import os
@@ -31,6 +29,7 @@ from legacytl.extensions.html import CUSTOM_EMOJIS
 from legacytl.tl.types import Message
 
 from .. import main, utils
+from .._context import tag_client
 from ..types import LegacyReplyMarkup
 from .types import InlineMessage, InlineUnit
 
@@ -51,6 +50,7 @@ class ListGalleryHelper:
 
 
 class Gallery(InlineUnit):
+    @tag_client(lambda self: self._client.tg_id)
     async def gallery(
         self,
         message: typing.Union[Message, int],
@@ -94,9 +94,6 @@ class Gallery(InlineUnit):
         :param silent: Whether the gallery must be sent silently (w/o "Opening gallery..." message)
         :return: If gallery is sent, returns :obj:`InlineMessage`, otherwise returns `False`
         """
-        with contextlib.suppress(AttributeError):
-            _legacy_client_id_logging_tag = copy.copy(self._client.tg_id)  # noqa: F841
-
         custom_buttons = self._validate_markup(custom_buttons)
 
         if not (
@@ -235,6 +232,8 @@ class Gallery(InlineUnit):
             **({"custom_buttons": custom_buttons} if custom_buttons else {}),
         }
 
+        self._schedule_unit(unit_id)
+
         self._custom_map[btn_call_data] = {
             "handler": functools.partial(
                 self._gallery_page,
@@ -287,12 +286,12 @@ class Gallery(InlineUnit):
         except Exception:
             logger.exception("Error sending inline gallery")
 
-            del self._units[unit_id]
+            self._remove_unit(unit_id)
 
             if _reattempt:
                 logger.exception("Can't send gallery")
 
-                del self._units[unit_id]
+                self._remove_unit(unit_id)
                 await answer(
                     self.translator.getkey("inline.invoke_failed_logs").format(
                         utils.escape_html(
@@ -660,45 +659,47 @@ class Gallery(InlineUnit):
         )
 
     async def _gallery_inline_handler(self, inline_query: InlineQuery):
-        for unit in self._units.copy().values():
-            if (
-                inline_query.from_user.id == self._me
-                and inline_query.query == unit["uid"]
-                and unit["type"] == "gallery"
-            ):
-                try:
-                    try:
-                        path = urlparse(unit["photo_url"]).path
-                        ext = os.path.splitext(path)[1]
-                    except Exception:
-                        ext = None
-
-                    args = {
-                        "thumb_url": "https://img.icons8.com/fluency/344/loading.png",
-                        "caption": self._get_caption(unit["uid"], index=0),
-                        "parse_mode": "HTML",
-                        "reply_markup": self._gallery_markup(unit["uid"]),
-                        "id": utils.rand(20),
-                        "title": "Processing inline gallery",
-                    }
-
-                    if unit.get("gif", False) or ext in {".gif", ".mp4"}:
-                        await inline_query.answer(
-                            [InlineQueryResultGif(gif_url=unit["photo_url"], **args)]
-                        )
-                        return
+        unit = self._units.get(inline_query.query)
+        if (
+            inline_query.from_user.id != self._me
+            or unit is None
+            or unit.get("type") != "gallery"
+        ):
+            return
 
-                    await inline_query.answer(
-                        [
-                            InlineQueryResultPhoto(
-                                photo_url=unit["photo_url"],
-                                thumbnail_url=unit["photo_url"],
-                                **args,
-                            )
-                        ],
-                        cache_time=0,
+        try:
+            try:
+                path = urlparse(unit["photo_url"]).path
+                ext = os.path.splitext(path)[1]
+            except Exception:
+                ext = None
+
+            args = {
+                "thumb_url": "https://img.icons8.com/fluency/344/loading.png",
+                "caption": self._get_caption(unit["uid"], index=0),
+                "parse_mode": "HTML",
+                "reply_markup": self._gallery_markup(unit["uid"]),
+                "id": utils.rand(20),
+                "title": "Processing inline gallery",
+            }
+
+            if unit.get("gif", False) or ext in {".gif", ".mp4"}:
+                await inline_query.answer(
+                    [InlineQueryResultGif(gif_url=unit["photo_url"], **args)]
+                )
+                return
+
+            await inline_query.answer(
+                [
+                    InlineQueryResultPhoto(
+                        photo_url=unit["photo_url"],
+                        thumbnail_url=unit["photo_url"],
+                        **args,
                     )
-                except Exception as e:
-                    if unit["uid"] in self._error_events:
-                        self._error_events[unit["uid"]].set()
-                        self._error_events[unit["uid"]] = e
+                ],
+                cache_time=0,
+            )
+        except Exception as e:
+            if unit["uid"] in self._error_events:
+                self._error_events[unit["uid"]].set()
+                self._error_events[unit["uid"]] = e
@@ -102,6 +102,9 @@ class Invoice(InlineUnit):
             "suggested_tip_amounts": suggested_tip_amounts,
             "uid": unit_id,
         }
+
+        self._schedule_unit(unit_id)
+
         if isinstance(message, Message) and message.out:
             await message.delete()
             m = await self._invoke_unit(unit_id, message)
@@ -5,8 +5,6 @@
 # 🔑 https://www.gnu.org/licenses/agpl-3.0.html
 
 import asyncio
-import contextlib
-import copy
 import functools
 import logging
 import time
@@ -26,6 +24,7 @@ from legacytl.extensions.html import CUSTOM_EMOJIS
 from legacytl.tl.types import Message
 
 from .. import main, utils
+from .._context import tag_client
 from ..types import LegacyReplyMarkup
 from .types import InlineMessage, InlineUnit
 
@@ -33,6 +32,7 @@ logger = logging.getLogger(__name__)
 
 
 class List(InlineUnit):
+    @tag_client(lambda self: self._client.tg_id)
     async def list(
         self,
         message: typing.Union[Message, int],
@@ -66,9 +66,6 @@ class List(InlineUnit):
         :param custom_buttons: Custom buttons to add above native ones
         :return: If list is sent, returns :obj:`InlineMessage`, otherwise returns `False`
         """
-        with contextlib.suppress(AttributeError):
-            _legacy_client_id_logging_tag = copy.copy(self._client.tg_id)  # noqa: F841
-
         custom_buttons = self._validate_markup(custom_buttons)
 
         if not isinstance(manual_security, bool):
@@ -161,6 +158,8 @@ class List(InlineUnit):
             **({"custom_buttons": custom_buttons} if custom_buttons else {}),
         }
 
+        self._schedule_unit(unit_id)
+
         btn_call_data = utils.rand(10)
 
         self._custom_map[btn_call_data] = {
@@ -215,7 +214,7 @@ class List(InlineUnit):
         except Exception:
             logger.exception("Can't send list")
 
-            del self._units[unit_id]
+            self._remove_unit(unit_id)
             await answer(
                 self.translator.getkey("inline.invoke_failed_logs").format(
                     utils.escape_html(
@@ -294,28 +293,30 @@ class List(InlineUnit):
         )
 
     async def _list_inline_handler(self, inline_query: InlineQuery):
-        for unit in self._units.copy().values():
-            if (
-                inline_query.from_user.id == self._me
-                and inline_query.query == unit["uid"]
-                and unit["type"] == "list"
-            ):
-                try:
-                    await inline_query.answer(
-                        [
-                            InlineQueryResultArticle(
-                                id=utils.rand(20),
-                                title="Hikka",
-                                input_message_content=InputTextMessageContent(
-                                    message_text=self.sanitise_text(unit["strings"][0]),
-                                    disable_web_page_preview=True,
-                                ),
-                                reply_markup=self._list_markup(inline_query.query),
-                            )
-                        ],
-                        cache_time=60,
+        unit = self._units.get(inline_query.query)
+        if (
+            inline_query.from_user.id != self._me
+            or unit is None
+            or unit.get("type") != "list"
+        ):
+            return
+
+        try:
+            await inline_query.answer(
+                [
+                    InlineQueryResultArticle(
+                        id=utils.rand(20),
+                        title="Hikka",
+                        input_message_content=InputTextMessageContent(
+                            message_text=self.sanitise_text(unit["strings"][0]),
+                            disable_web_page_preview=True,
+                        ),
+                        reply_markup=self._list_markup(inline_query.query),
                     )
-                except Exception as e:
-                    if unit["uid"] in self._error_events:
-                        self._error_events[unit["uid"]].set()
-                        self._error_events[unit["uid"]] = e
+                ],
+                cache_time=60,
+            )
+        except Exception as e:
+            if unit["uid"] in self._error_events:
+                self._error_events[unit["uid"]].set()
+                self._error_events[unit["uid"]] = e
@@ -7,6 +7,7 @@
 import asyncio
 import contextlib
 import functools
+import heapq
 import io
 import itertools
 import logging
@@ -44,11 +45,21 @@ class Utils(InlineUnit):
     def _generate_markup(
         self,
         markup_obj: typing.Optional[typing.Union[LegacyReplyMarkup, str]],
+        *,
+        unit_id: typing.Optional[str] = None,
     ) -> typing.Optional[InlineKeyboardMarkup]:
-        """Generate markup for form or list of `dict`s"""
+        """
+        Generate markup for form or list of `dict`s
+        :param markup_obj: Unit ID or markup
+        :param unit_id: ID of unit, which owns the markup. Its buttons will be
+            indexed, so button presses are resolved without scanning all units
+        """
         if not markup_obj:
             return None
 
+        if isinstance(markup_obj, str):
+            unit_id = markup_obj
+
         if isinstance(markup_obj, InlineKeyboardMarkup):
             return markup_obj
 
@@ -102,6 +113,9 @@ class Utils(InlineUnit):
                 if "input" in button and "_switch_query" not in button:
                     button["_switch_query"] = utils.rand(10)
 
+        if unit_id is not None and unit_id in self._units:
+            self._index_unit(unit_id, map_)
+
         for row in map_:
             line = []
             for button in row:
@@ -247,6 +261,106 @@ class Utils(InlineUnit):
 
     generate_markup = _generate_markup
 
+    def _index_unit(
+        self,
+        unit_id: str,
+        markup: typing.List[typing.List[typing.Dict[str, typing.Any]]],
+    ):
+        """Replace indexed buttons of unit with the ones from `markup`"""
+        self._unindex_unit(unit_id)
+        keys = []
+        for row in markup:
+            for button in row:
+                if not isinstance(button, dict):
+                    continue
+
+                for field in ("_callback_data", "_switch_query"):
+                    if field in button:
+                        key = (field, button[field])
+                        self._button_index.setdefault(key, {})[unit_id] = button
+                        keys.append(key)
+
+        if keys:
+            self._indexed_units[unit_id] = keys
+
+    def _unindex_unit(self, unit_id: str):
+        """Remove buttons of unit from the index"""
+        for key in self._indexed_units.pop(unit_id, ()):
+            units = self._button_index.get(key)
+            if units is None:
+                continue
+
+            units.pop(unit_id, None)
+            if not units:
+                del self._button_index[key]
+
+    def _schedule_unit(self, unit_id: str):
+        """
+        Start tracking lifetime of the newly created unit. If there are too many
+        live units, the least recently used ones are unloaded
+        """
+        if (ttl := self._units[unit_id].get("ttl")) is not None:
+            heapq.heappush(self._expiry, (ttl, unit_id))
+            if self._expiry[0] == (ttl, unit_id):
+                self._expiry_changed.set()
+
+            # Drop entries of removed units, so the heap doesn't outgrow them
+            if len(self._expiry) > 2 * len(self._units) + 64:
+                self._expiry = [
+                    (unit["ttl"], uid)
+                    for uid, unit in self._units.items()
+                    if unit.get("ttl") is not None
+                ]
+                heapq.heapify(self._expiry)
+
+        while len(self._units) > self._units_limit:
+            oldest = next(iter(self._units))
+            if oldest == unit_id:
+                break
+
+            logger.debug("Too many inline units, unloading %s", oldest)
+            self._expire_unit(oldest)
+
+    def _touch_unit(self, unit_id: str):
+        """Mark unit as recently used"""
+        if unit_id in self._units:
+            self._units[unit_id] = self._units.pop(unit_id)
+
+    def _remove_unit(self, unit_id: str) -> typing.Optional[dict]:
+        """Remove unit and its indexed buttons without calling `on_unload`"""
+        self._unindex_unit(unit_id)
+        return self._units.pop(unit_id, None)
+
+    def _expire_unit(self, unit_id: str):
+        """Remove unit and call its `on_unload`"""
+        unit = self._remove_unit(unit_id)
+        if unit is not None and callable(unit.get("on_unload")):
+            try:
+                unit["on_unload"]()
+            except Exception:
+                logger.exception("Error on unloading inline unit %s", unit_id)
+
+    def _find_buttons(
+        self,
+        field: str,
+        value: str,
+    ) -> typing.List[typing.Tuple[str, dict, dict]]:
+        """
+        Find buttons of live units by their generated data
+        :param field: `_callback_data` or `_switch_query`
+        :param value: Value of the field
+        :return: List of (unit_id, unit, button)
+        """
+        found = []
+        for unit_id, button in list(self._button_index.get((field, value), {}).items()):
+            if (unit := self._units.get(unit_id)) is None:
+                self._unindex_unit(unit_id)
+                continue
+
+            found.append((unit_id, unit, button))
+
+        return found
+
     async def _close_unit_handler(self, call: InlineCall):
         await call.delete()
 
@@ -278,6 +392,28 @@ class Utils(InlineUnit):
             inline_cmd=self._reverse_method_lookup(func),
         )
 
+    async def check_inline_security_many(
+        self,
+        *,
+        funcs: typing.Iterable[typing.Callable],
+        user: int,
+    ) -> typing.Dict[typing.Callable, bool]:
+        """Checks if user with id `user` is allowed to run each of `funcs`"""
+        names = {}
+        for name, method in itertools.chain(
+            self._allmodules.inline_handlers.items(),
+            self._allmodules.callback_handlers.items(),
+        ):
+            # First match wins, like in `_reverse_method_lookup`
+            names.setdefault(method, name)
+
+        return await self._client.dispatcher.security.check_many(
+            None,
+            funcs,
+            user_id=user,
+            inline_cmds=names,
+        )
+
     def _find_caller_sec_map(self) -> typing.Optional[typing.Callable[[], int]]:
         try:
             caller = utils.find_caller()
@@ -392,6 +528,8 @@ class Utils(InlineUnit):
             unit = self._units[unit_id]
 
             unit["buttons"] = reply_markup
+            # Buttons are indexed again, once the new markup is generated
+            self._unindex_unit(unit_id)
 
             if isinstance(force_me, bool):
                 unit["force_me"] = force_me
@@ -475,7 +613,7 @@ class Utils(InlineUnit):
                         if inline_message_id
                         else {"chat_id": chat_id, "message_id": message_id}
                     ),
-                    reply_markup=self.generate_markup(reply_markup),
+                    reply_markup=self.generate_markup(reply_markup, unit_id=unit_id),
                 )
             except Exception:
                 return False
@@ -499,7 +637,8 @@ class Utils(InlineUnit):
                     reply_markup=self.generate_markup(
                         reply_markup
                         if isinstance(reply_markup, list)
-                        else unit.get("buttons", [])
+                        else unit.get("buttons", []),
+                        unit_id=unit_id,
                     ),
                 )
             except RetryAfter as e:
@@ -521,7 +660,8 @@ class Utils(InlineUnit):
                         reply_markup=self.generate_markup(
                             reply_markup
                             if isinstance(reply_markup, list)
-                            else unit.get("buttons", [])
+                            else unit.get("buttons", []),
+                            unit_id=unit_id,
                         ),
                     )
                 except Exception:
@@ -549,7 +689,8 @@ class Utils(InlineUnit):
                 reply_markup=self.generate_markup(
                     reply_markup
                     if isinstance(reply_markup, list)
-                    else unit.get("buttons", [])
+                    else unit.get("buttons", []),
+                    unit_id=unit_id,
                 ),
             )
         except RetryAfter as e:
@@ -579,9 +720,7 @@ class Utils(InlineUnit):
             ):
                 self._units[unit_id]["on_unload"]()
 
-            if unit_id in self._units:
-                del self._units[unit_id]
-            else:
+            if self._remove_unit(unit_id) is None:
                 return False
         except Exception:
             return False
@@ -9,7 +9,6 @@
 import asyncio
 import builtins
 import contextlib
-import copy
 import importlib
 import importlib.machinery
 import importlib.util
@@ -27,6 +26,8 @@ from uuid import uuid4
 from legacytl.tl.tlobject import TLObject
 
 from . import security, utils, validators
+from ._context import module_context, tag_client
+from ._registry import HandlerRegistry, HandlerSnapshot
 from .database import Database
 from .inline.core import InlineManager
 from .translations import Strings, Translator
@@ -46,9 +47,11 @@ from .types import (
     SelfUnload,
     StopLoop,
     StringLoader,
+    clear_handlers_cache,
     get_callback_handlers,
     get_commands,
     get_inline_handlers,
+    scan_members,
 )
 
 __all__ = [
@@ -175,12 +178,8 @@ class InfiniteLoop:
     def _stop(self, *args, **kwargs):
         self._wait_for_stop.set()
 
+    @tag_client(lambda self: self.module_instance.allmodules.client.tg_id)
     def stop(self, *args, **kwargs):
-        with contextlib.suppress(AttributeError):
-            _legacy_client_id_logging_tag = copy.copy(  # noqa: F841
-                self.module_instance.allmodules.client.tg_id
-            )
-
         if self._task:
             logger.debug("Stopped loop for method %s", self.func)
             self._wait_for_stop = asyncio.Event()
@@ -192,12 +191,8 @@ class InfiniteLoop:
         logger.debug("Loop is not running")
         return asyncio.ensure_future(stop_placeholder())
 
+    @tag_client(lambda self: self.module_instance.allmodules.client.tg_id)
     def start(self, *args, **kwargs):
-        with contextlib.suppress(AttributeError):
-            _legacy_client_id_logging_tag = copy.copy(  # noqa: F841
-                self.module_instance.allmodules.client.tg_id
-            )
-
         if not self._task:
             logger.debug("Started loop for method %s", self.func)
             self._task = asyncio.ensure_future(self.actual_loop(*args, **kwargs))
@@ -226,7 +221,8 @@ class InfiniteLoop:
                 break
 
             try:
-                await self.func(self.module_instance, *args, **kwargs)
+                with module_context(self.module_instance):
+                    await self.func(self.module_instance, *args, **kwargs)
             except StopLoop:
                 break
             except Exception:
@@ -266,6 +262,19 @@ def loop(
     return wrapped
 
 
+def get_loops(instance: Module) -> typing.Dict[str, InfiniteLoop]:
+    """
+    Get infinite loops of module
+    :param instance: Module instance
+    :return: Mapping of attribute name to loop
+    """
+    return scan_members(
+        instance,
+        "loops",
+        lambda _, value: isinstance(value, InfiniteLoop),
+    )
+
+
 MODULES_NAME = "modules"
 ru_keys = 'ёйцукенгшщзхъфывапролджэячсмитьбю.Ё"№;%:?ЙЦУКЕНГШЩЗХЪФЫВАПРОЛДЖЭ/ЯЧСМИТЬБЮ,'
 en_keys = "`qwertyuiop[]asdfghjkl;'zxcvbnm,./~@#$%^&QWERTYUIOP{}ASDFGHJKL:\"|ZXCVBNM<>?"
@@ -458,6 +467,8 @@ def inline_handler(*args, **kwargs):
 def watcher(*args, **kwargs):
     """
     Decorator that marks function as watcher
+    Pass `coalesce` tag to let dispatcher skip older messages of a chat,
+    which are still waiting for the watcher under load
     """
     return _mark_method("is_watcher", *args, **kwargs)
 
@@ -498,13 +509,19 @@ class Modules:
         translator: Translator,
     ):
         self._initial_registration = True
-        self.commands = {}
-        self.inline_handlers = {}
-        self.callback_handlers = {}
+        self._registry = HandlerRegistry()
         self.aliases = {}
+        # Bumped whenever commands or aliases change
+        self.commands_version = 0
+        self._routes_version = -1
+        self._routes: typing.Dict[
+            str, typing.Tuple[typing.Optional[str], Command]
+        ] = {}
+        self._alias_index: typing.Dict[str, str] = {}
+        # Bumped whenever the list of watchers changes
+        self.watchers_version = 0
         self.modules = []  # skipcq: PTC-W0052
         self.libraries = []
-        self.watchers = []
         self._log_handlers = []
         self._core_commands = []
         self.__approve = []
@@ -513,44 +530,42 @@ class Modules:
         self._db = db
         self.db = db
         self.translator = translator
-        asyncio.ensure_future(self._junk_collector())
         self.inline = InlineManager(self.client, self._db, self)
         self.client.legacy_inline = self.inline
 
-    async def _junk_collector(self):
-        """
-        Periodically reloads commands, inline handlers, callback handlers and watchers from loaded
-        modules to prevent zombie handlers
-        """
-        while True:
-            await asyncio.sleep(30)
-            commands = {}
-            inline_handlers = {}
-            callback_handlers = {}
-            watchers = []
-            for module in self.modules:
-                commands.update(module.commands)
-                inline_handlers.update(module.inline_handlers)
-                callback_handlers.update(module.callback_handlers)
-                watchers.extend(module.legacy_watchers.values())
-
-            self.commands = commands
-            self.inline_handlers = inline_handlers
-            self.callback_handlers = callback_handlers
-            self.watchers = watchers
+    @property
+    def handlers(self) -> HandlerSnapshot:
+        """Snapshot of all registered handlers"""
+        return self._registry.snapshot
 
-            logger.debug(
-                (
-                    "Reloaded %s commands,"
-                    " %s inline handlers,"
-                    " %s callback handlers and"
-                    " %s watchers"
-                ),
-                len(self.commands),
-                len(self.inline_handlers),
-                len(self.callback_handlers),
-                len(self.watchers),
-            )
+    @property
+    def commands(self) -> typing.Mapping[str, Command]:
+        return self._registry.snapshot.commands
+
+    @property
+    def inline_handlers(self) -> typing.Mapping[str, callable]:
+        return self._registry.snapshot.inline_handlers
+
+    @property
+    def callback_handlers(self) -> typing.Mapping[str, callable]:
+        return self._registry.snapshot.callback_handlers
+
+    @property
+    def watchers(self) -> typing.Tuple[callable, ...]:
+        return self._registry.snapshot.watchers
+
+    def _update_handlers(self, module: str, **parts):
+        self._bump_versions(self._registry.update(module, **parts))
+
+    def _discard_handlers(self, module: str, *parts: str):
+        self._bump_versions(self._registry.discard(module, *parts))
+
+    def _bump_versions(self, changed: typing.Set[str]):
+        if "commands" in changed:
+            self.commands_version += 1
+
+        if "watchers" in changed:
+            self.watchers_version += 1
 
     async def register_all(
         self,
@@ -587,14 +602,12 @@ class Modules:
 
         return loaded
 
+    @tag_client(lambda self: self.client.tg_id)
     async def _register_modules(
         self,
         modules: list,
         origin: str = "<core>",
     ) -> typing.List[Module]:
-        with contextlib.suppress(AttributeError):
-            _legacy_client_id_logging_tag = copy.copy(self.client.tg_id)  # noqa: F841
-
         loaded = []
 
         for mod in modules:
@@ -619,6 +632,7 @@ class Modules:
 
         return loaded
 
+    @tag_client(lambda self: self.client.tg_id)
     async def register_module(
         self,
         spec: importlib.machinery.ModuleSpec,
@@ -627,9 +641,6 @@ class Modules:
         save_fs: bool = False,
     ) -> Module:
         """Register single module from importlib spec"""
-        with contextlib.suppress(AttributeError):
-            _legacy_client_id_logging_tag = copy.copy(self.client.tg_id)  # noqa: F841
-
         module = importlib.util.module_from_spec(spec)
         sys.modules[module_name] = module
 
@@ -675,43 +686,41 @@ class Modules:
     def add_aliases(self, aliases: dict):
         """Saves aliases and applies them to <core>/<file> modules"""
         self.aliases.update(aliases)
+        self.commands_version += 1
         for alias, cmd in aliases.items():
             self.add_alias(alias, cmd)
 
     def register_raw_handlers(self, instance: Module):
         """Register event handlers for a module"""
-        for name, handler in utils.iter_attrs(instance):
-            if getattr(handler, "is_raw_handler", False):
-                self.client.dispatcher.raw_handlers.append(handler)
-                logger.debug(
-                    "Registered raw handler %s for %s. ID: %s",
-                    name,
-                    instance.__class__.__name__,
-                    handler.id,
-                )
+        for name, handler in scan_members(
+            instance,
+            "raw_handlers",
+            lambda _, value: getattr(value, "is_raw_handler", False),
+        ).items():
+            self.client.dispatcher.raw_handlers.append(handler)
+            logger.debug(
+                "Registered raw handler %s for %s. ID: %s",
+                name,
+                instance.__class__.__name__,
+                handler.id,
+            )
 
+    @tag_client(lambda self: self.client.tg_id)
     def register_commands(self, instance: Module):
         """Register commands from instance"""
-        with contextlib.suppress(AttributeError):
-            _legacy_client_id_logging_tag = copy.copy(self.client.tg_id)  # noqa: F841
-
+        commands = {name.lower(): cmd for name, cmd in instance.commands.items()}
         if instance.__origin__.startswith("<core"):
-            self._core_commands += list(
-                map(lambda x: x.lower(), list(instance.commands))
-            )
-
-        for _command, cmd in instance.commands.items():
+            self._core_commands += list(commands)
+        else:
             # Restrict overwriting core modules' commands
-            if (
-                _command.lower() in self._core_commands
-                and not instance.__origin__.startswith("<core")
-            ):
-                with contextlib.suppress(Exception):
-                    self.modules.remove(instance)
+            for _command in commands:
+                if _command in self._core_commands:
+                    with contextlib.suppress(Exception):
+                        self.modules.remove(instance)
 
-                raise CoreOverwriteError(command=_command)
+                    raise CoreOverwriteError(command=_command)
 
-            self.commands.update({_command.lower(): cmd})
+        self._update_handlers(instance.__class__.__name__, commands=commands)
 
         for alias, cmd in self.aliases.copy().items():
             if cmd in instance.commands:
@@ -720,87 +729,60 @@ class Modules:
         self.register_inline_stuff(instance)
 
     def register_inline_stuff(self, instance: Module):
-        for name, func in instance.inline_handlers.copy().items():
-            if name.lower() in self.inline_handlers:
+        inline_handlers = {
+            name.lower(): func for name, func in instance.inline_handlers.items()
+        }
+        callback_handlers = {
+            name.lower(): func for name, func in instance.callback_handlers.items()
+        }
+
+        for handlers, registered in (
+            (inline_handlers, self.inline_handlers),
+            (callback_handlers, self.callback_handlers),
+        ):
+            for name, func in handlers.items():
                 if (
-                    hasattr(func, "__self__")
-                    and hasattr(self.inline_handlers[name], "__self__")
-                    and (
-                        func.__self__.__class__.__name__
-                        != self.inline_handlers[name].__self__.__class__.__name__
-                    )
+                    name in registered
+                    and hasattr(func, "__self__")
+                    and hasattr(registered[name], "__self__")
+                    and func.__self__.__class__.__name__
+                    != registered[name].__self__.__class__.__name__
                 ):
                     logger.debug(
-                        "Duplicate inline_handler %s of %s",
+                        "Duplicate handler %s of %s",
                         name,
                         instance.__class__.__name__,
                     )
 
-                logger.debug(
-                    "Replacing inline_handler %s for %s",
-                    self.inline_handlers[name],
-                    instance.__class__.__name__,
-                )
-
-            self.inline_handlers.update({name.lower(): func})
-
-        for name, func in instance.callback_handlers.copy().items():
-            if name.lower() in self.callback_handlers and (
-                hasattr(func, "__self__")
-                and hasattr(self.callback_handlers[name], "__self__")
-                and func.__self__.__class__.__name__
-                != self.callback_handlers[name].__self__.__class__.__name__
-            ):
-                logger.debug(
-                    "Duplicate callback_handler %s of %s",
-                    name,
-                    instance.__class__.__name__,
-                )
-
-            self.callback_handlers.update({name.lower(): func})
+        self._update_handlers(
+            instance.__class__.__name__,
+            inline_handlers=inline_handlers,
+            callback_handlers=callback_handlers,
+        )
 
     def unregister_inline_stuff(self, instance: Module, purpose: str):
-        for name, func in instance.inline_handlers.copy().items():
-            if name.lower() in self.inline_handlers and (
-                hasattr(func, "__self__")
-                and hasattr(self.inline_handlers[name], "__self__")
-                and func.__self__.__class__.__name__
-                == self.inline_handlers[name].__self__.__class__.__name__
-            ):
-                del self.inline_handlers[name.lower()]
-                logger.debug(
-                    "Unregistered inline_handler %s of %s for %s",
-                    name,
-                    instance.__class__.__name__,
-                    purpose,
-                )
+        if self._registry.get(instance.__class__.__name__, "inline_handlers") or (
+            self._registry.get(instance.__class__.__name__, "callback_handlers")
+        ):
+            logger.debug(
+                "Unregistered inline and callback handlers of %s for %s",
+                instance.__class__.__name__,
+                purpose,
+            )
 
-        for name, func in instance.callback_handlers.copy().items():
-            if name.lower() in self.callback_handlers and (
-                hasattr(func, "__self__")
-                and hasattr(self.callback_handlers[name], "__self__")
-                and func.__self__.__class__.__name__
-                == self.callback_handlers[name].__self__.__class__.__name__
-            ):
-                del self.callback_handlers[name.lower()]
-                logger.debug(
-                    "Unregistered callback_handler %s of %s for %s",
-                    name,
-                    instance.__class__.__name__,
-                    purpose,
-                )
+        self._discard_handlers(
+            instance.__class__.__name__,
+            "inline_handlers",
+            "callback_handlers",
+        )
 
+    @tag_client(lambda self: self.client.tg_id)
     def register_watchers(self, instance: Module):
         """Register watcher from instance"""
-        with contextlib.suppress(AttributeError):
-            _legacy_client_id_logging_tag = copy.copy(self.client.tg_id)  # noqa: F841
-
-        for _watcher in self.watchers:
-            if _watcher.__self__.__class__.__name__ == instance.__class__.__name__:
-                logger.debug("Removing watcher %s for update", _watcher)
-                self.watchers.remove(_watcher)
-        for _watcher in instance.legacy_watchers.values():
-            self.watchers += [_watcher]
+        self._update_handlers(
+            instance.__class__.__name__,
+            watchers=tuple(instance.legacy_watchers.values()),
+        )
 
     def lookup(
         self,
@@ -864,17 +846,50 @@ class Modules:
                 await module.on_unload()
 
                 self.modules.remove(module)
-                for _, method in utils.iter_attrs(module):
-                    if isinstance(method, InfiniteLoop):
-                        method.stop()
-                        logger.debug(
-                            "Stopped loop in module %s, method %s",
-                            module,
-                            method,
-                        )
+                # Replaced instance must not receive updates, even if the new
+                # one never reaches `send_ready_one` registration
+                self._discard_handlers(module.__class__.__name__)
+                for method in get_loops(module).values():
+                    method.stop()
+                    logger.debug(
+                        "Stopped loop in module %s, method %s",
+                        module,
+                        method,
+                    )
 
         self.modules += [instance]
 
+    def _compile_routes(self):
+        """Rebuild command lookup tables, if commands or aliases changed"""
+        if self._routes_version == self.commands_version:
+            return
+
+        alias_index = {}
+        for command_name, _command in self.commands.items():
+            aliases = getattr(_command, "aliases", None) or (
+                [_command.alias] if getattr(_command, "alias", None) else []
+            )
+            for _alias in aliases:
+                if _alias.lower() not in self._core_commands:
+                    alias_index.setdefault(_alias.lower(), command_name)
+
+        # Same priority as before: command itself, user alias, module alias
+        routes = {
+            alias: (cmd, self.commands[cmd]) for alias, cmd in alias_index.items()
+        }
+        routes.update(
+            {
+                alias: (cmd, self.commands[cmd.lower()])
+                for alias, cmd in self.aliases.items()
+                if cmd and cmd.lower() in self.commands
+            }
+        )
+        routes.update({cmd: (None, func) for cmd, func in self.commands.items()})
+
+        self._alias_index = alias_index
+        self._routes = routes
+        self._routes_version = self.commands_version
+
     def find_alias(
         self,
         alias: str,
@@ -883,24 +898,9 @@ class Modules:
         if not alias:
             return None
 
-        for command_name, _command in self.commands.items():
-            aliases = []
-            if getattr(_command, "alias", None) and not (
-                aliases := getattr(_command, "aliases", None)
-            ):
-                aliases = [_command.alias]
-            if getattr(_command, "aliases", None):
-                aliases = _command.aliases
-
-            if not aliases:
-                continue
-
-            if any(
-                alias.lower() == _alias.lower()
-                and alias.lower() not in self._core_commands
-                for _alias in aliases
-            ):
-                return command_name
+        self._compile_routes()
+        if command_name := self._alias_index.get(alias.lower()):
+            return command_name
 
         if alias in self.aliases and include_legacytl:
             return self.aliases[alias]
@@ -909,19 +909,9 @@ class Modules:
 
     def dispatch(self, _command: str) -> typing.Tuple[str, typing.Optional[str]]:
         """Dispatch command to appropriate module"""
-
-        return next(
-            (
-                (cmd, self.commands[cmd.lower()])
-                for cmd in [
-                    _command,
-                    self.aliases.get(_command.lower()),
-                    self.find_alias(_command),
-                ]
-                if cmd and cmd.lower() in self.commands
-            ),
-            (_command, None),
-        )
+        self._compile_routes()
+        cmd, func = self._routes.get(_command.lower(), (None, None))
+        return (cmd or _command, func)
 
     def send_config(self, skip_hook: bool = False):
         """Configure modules"""
@@ -965,6 +955,7 @@ class Modules:
             mod.strings = {}
 
         mod.strings = Strings(mod, self.translator)
+        mod.strings.build()
         mod.translator = self.translator
 
         try:
@@ -995,25 +986,31 @@ class Modules:
     ):
         if from_dlmod:
             try:
-                if len(inspect.signature(mod.on_dlmod).parameters) == 2:
-                    await mod.on_dlmod(self.client, self._db)
-                else:
-                    await mod.on_dlmod()
+                with module_context(mod):
+                    if len(inspect.signature(mod.on_dlmod).parameters) == 2:
+                        await mod.on_dlmod(self.client, self._db)
+                    else:
+                        await mod.on_dlmod()
             except Exception:
                 logger.info("Can't process `on_dlmod` hook", exc_info=True)
 
         try:
-            if len(inspect.signature(mod.client_ready).parameters) == 2:
-                await mod.client_ready(self.client, self._db)
-            else:
-                await mod.client_ready()
+            with module_context(mod):
+                if len(inspect.signature(mod.client_ready).parameters) == 2:
+                    await mod.client_ready(self.client, self._db)
+                else:
+                    await mod.client_ready()
         except SelfUnload as e:
             if no_self_unload:
+                self._discard_handlers(mod.__class__.__name__)
                 raise e
 
             logger.debug("Unloading %s, because it raised SelfUnload", mod)
             self.modules.remove(mod)
+            self._discard_handlers(mod.__class__.__name__)
         except SelfSuspend as e:
+            # Handlers of the previous version of this module must not stay
+            self._discard_handlers(mod.__class__.__name__)
             if no_self_unload:
                 raise e
 
@@ -1029,17 +1026,18 @@ class Modules:
                 e,
             )
             self.modules.remove(mod)
+            self._discard_handlers(mod.__class__.__name__)
             raise
 
-        for _, method in utils.iter_attrs(mod):
-            if isinstance(method, InfiniteLoop):
-                setattr(method, "module_instance", mod)
+        for method in get_loops(mod).values():
+            setattr(method, "module_instance", mod)
 
-                if method.autostart:
-                    method.start()
+            if method.autostart:
+                method.start()
 
-                logger.debug("Added module %s to method %s", mod, method)
+            logger.debug("Added module %s to method %s", mod, method)
 
+        clear_handlers_cache(mod)
         self.unregister_commands(mod, "update")
         self.unregister_raw_handlers(mod, "update")
 
@@ -1095,40 +1093,37 @@ class Modules:
         return worked
 
     def unregister_loops(self, instance: Module, purpose: str):
-        for name, method in utils.iter_attrs(instance):
-            if isinstance(method, InfiniteLoop):
-                logger.debug(
-                    "Stopping loop for %s in module %s, method %s",
-                    purpose,
-                    instance.__class__.__name__,
-                    name,
-                )
-                method.stop()
+        for name, method in get_loops(instance).items():
+            logger.debug(
+                "Stopping loop for %s in module %s, method %s",
+                purpose,
+                instance.__class__.__name__,
+                name,
+            )
+            method.stop()
 
     def unregister_commands(self, instance: Module, purpose: str):
-        for name, cmd in self.commands.copy().items():
-            if cmd.__self__.__class__.__name__ == instance.__class__.__name__:
-                logger.debug(
-                    "Removing command %s of module %s for %s",
-                    name,
-                    instance.__class__.__name__,
-                    purpose,
-                )
-                del self.commands[name]
-                for alias, _command in self.aliases.copy().items():
-                    if _command == name:
-                        del self.aliases[alias]
+        commands = self._registry.get(instance.__class__.__name__, "commands") or {}
+        for name in commands:
+            logger.debug(
+                "Removing command %s of module %s for %s",
+                name,
+                instance.__class__.__name__,
+                purpose,
+            )
+
+        self._discard_handlers(instance.__class__.__name__, "commands")
+        for alias, _command in self.aliases.copy().items():
+            if _command in commands and _command not in self.commands:
+                del self.aliases[alias]
 
     def unregister_watchers(self, instance: Module, purpose: str):
-        for _watcher in self.watchers.copy():
-            if _watcher.__self__.__class__.__name__ == instance.__class__.__name__:
-                logger.debug(
-                    "Removing watcher %s of module %s for %s",
-                    _watcher,
-                    instance.__class__.__name__,
-                    purpose,
-                )
-                self.watchers.remove(_watcher)
+        logger.debug(
+            "Removing watchers of module %s for %s",
+            instance.__class__.__name__,
+            purpose,
+        )
+        self._discard_handlers(instance.__class__.__name__, "watchers")
 
     def unregister_raw_handlers(self, instance: Module, purpose: str):
         """Unregister event handlers for a module"""
@@ -1148,10 +1143,12 @@ class Modules:
             return False
 
         self.aliases[alias.lower().strip()] = cmd
+        self.commands_version += 1
         return True
 
     def remove_alias(self, alias: str) -> bool:
         """Remove an alias"""
+        self.commands_version += 1
         return bool(self.aliases.pop(alias.strip(), None))
 
     async def log(self, *args, **kwargs):
@@ -1161,6 +1158,10 @@ class Modules:
         if not await self.translator.init():
             return False
 
+        for module in [*self.modules, *self.libraries]:
+            if isinstance(getattr(module, "strings", None), Strings):
+                module.strings.invalidate()
+
         for module in self.modules:
             try:
                 module.config_complete(reload_dynamic_translate=True)
@@ -9,6 +9,7 @@
 
 import html
 import asyncio
+import collections
 import contextlib
 import inspect
 import io
@@ -16,6 +17,7 @@ import linecache
 import logging
 import re
 import sys
+import time
 import traceback
 import typing
 from logging.handlers import RotatingFileHandler
@@ -26,6 +28,8 @@ from aiogram.exceptions import TelegramRetryAfter as RetryAfter
 from legacytl.errors.rpcbaseerrors import RPCError, ServerError
 
 from . import utils
+from ._context import get_logging_tag
+from ._log_ring import LogRing
 from .tl_cache import CustomTelegramClient
 from .types import BotInlineCall, Module
 
@@ -56,6 +60,18 @@ def getlines(filename: str, module_globals=None) -> str:
 
 linecache.getlines = getlines
 
+# Bot API allows about 20 messages per minute in one group
+TG_LOG_RATE = 20 / 60
+TG_LOG_BURST = 3
+# For how long records are accumulated after the first one, before they are sent
+TG_LOG_DELAY = 1
+# Maximum number of records, waiting to be sent. Oldest ones are dropped
+TG_LOG_QUEUE_SIZE = 1000
+# Logs, which don't fit in this amount of messages, are sent as a document
+TG_LOG_MAX_MESSAGES = 5
+# Identical exceptions within this amount of seconds are counted, not sent
+EXCEPTION_REPEAT_WINDOW = 60
+
 
 def override_text(exception: Exception) -> typing.Optional[str]:
     """Returns error-specific description if available, else `None`"""
@@ -242,6 +258,36 @@ class LegacyException:
         )
 
 
+class TokenBucket:
+    """Paces sending, so it stays within `rate` per second with bursts up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until sending is allowed"""
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def penalize(self, seconds: float):
+        """Forbid sending for `seconds`, e.g. after flood wait"""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
 class TelegramLogsHandler(logging.Handler):
     """
     Keeps 2 buffers.
@@ -254,11 +300,18 @@ class TelegramLogsHandler(logging.Handler):
 
     def __init__(self, targets: list, capacity: int):
         super().__init__(0)
-        self.buffer = []
-        self.handledbuffer = []
-        self._queue = []
+        # Records, which are not passed to targets yet, because of `lvl`
+        self.buffer: typing.Deque[logging.LogRecord] = collections.deque(
+            maxlen=capacity
+        )
+        # All recent records, including the ones in `buffer`
+        self.history = LogRing(capacity)
         self._mods = {}
-        self.tg_buff = []
+        # (record, client_id). Appending to deque is thread-safe, so `emit`
+        # never waits for the sender
+        self.tg_buff: typing.Deque[
+            typing.Tuple[typing.Union[str, LegacyException], typing.Optional[int]]
+        ] = collections.deque(maxlen=TG_LOG_QUEUE_SIZE)
         self.force_send_all = False
         self.tg_level = 20
         self.ignore_common = False
@@ -266,27 +319,83 @@ class TelegramLogsHandler(logging.Handler):
         self.capacity = capacity
         self.lvl = logging.NOTSET
         self._send_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._loop: typing.Optional[asyncio.AbstractEventLoop] = None
+        # chat_id -> bucket
+        self._buckets: typing.Dict[int, TokenBucket] = {}
+        # (client_id, message) -> [end of window, repeats count, exception]
+        self._repeats: typing.Dict[typing.Tuple[int, str], list] = {}
 
     def install_tg_log(self, mod: Module):
         if getattr(self, "_task", False):
             self._task.cancel()
 
         self._mods[mod.tg_id] = mod
+        self._loop = asyncio.get_event_loop()
 
         self._task = asyncio.ensure_future(self.queue_poller())
 
+    def _wake(self):
+        if self._loop is None or self._loop.is_closed():
+            return
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is self._loop:
+            self._wakeup.set()
+        else:
+            # Record was emitted from another thread
+            with contextlib.suppress(RuntimeError):
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+
     async def queue_poller(self):
         while True:
+            if not self.tg_buff:
+                # Wake up to report repeated exceptions, once their window ends
+                repeats = [until for until, count, _ in self._repeats.values() if count]
+                timeout = max(min(repeats) - time.monotonic(), 0) if repeats else None
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+
+            self._wakeup.clear()
+            # Let the burst accumulate, so it's sent in fewer messages
+            await asyncio.sleep(TG_LOG_DELAY)
             with contextlib.suppress(Exception):
                 await self.sender()
-            await asyncio.sleep(3)
 
     def setLevel(self, level: int):
         self.lvl = level
 
-    def dump(self):
+    def dump(self) -> typing.List[logging.LogRecord]:
         """Return a list of logging entries"""
-        return self.handledbuffer + self.buffer
+        with self.lock:
+            records = self.history.select(all_clients=True)
+
+        return [self.history.to_log_record(record) for record in records]
+
+    def iter_logs(
+        self,
+        lvl: int = 0,
+        client_id: typing.Optional[int] = None,
+        limit: typing.Optional[int] = None,
+    ) -> typing.Iterator[str]:
+        """
+        Format entries of minimum level one by one
+        :param lvl: Minimum level of entries
+        :param client_id: Include entries of this client
+        :param limit: If set, only this amount of the latest entries is returned
+        """
+        with self.lock:
+            records = self.history.select(lvl, client_id)
+
+        if limit is not None:
+            records = records[-limit:] if limit > 0 else []
+
+        for record in records:
+            yield self.targets[0].format(self.history.to_log_record(record))
 
     def dumps(
         self,
@@ -294,12 +403,26 @@ class TelegramLogsHandler(logging.Handler):
         client_id: typing.Optional[int] = None,
     ) -> typing.List[str]:
         """Return all entries of minimum level as list of strings"""
-        return [
-            self.targets[0].format(record)
-            for record in self.buffer + self.handledbuffer
-            if record.levelno >= lvl
-            and (not record.legacy_caller or client_id == record.legacy_caller)
-        ]
+        return list(self.iter_logs(lvl, client_id))
+
+    def write_logs(
+        self,
+        file: typing.TextIO,
+        lvl: int = 0,
+        client_id: typing.Optional[int] = None,
+        limit: typing.Optional[int] = None,
+    ) -> int:
+        """
+        Write entries of minimum level to file, without keeping all of them in memory
+        :param file: Text file to write to
+        :return: Number of written entries
+        """
+        count = 0
+        for count, entry in enumerate(self.iter_logs(lvl, client_id, limit), 1):
+            file.write(entry)
+            file.write("\n")
+
+        return count
 
     async def _install_pylib(self, call: BotInlineCall, bot: "aiogram.Bot", lib: str):
         if lib == "PIL":
@@ -394,116 +517,142 @@ class TelegramLogsHandler(logging.Handler):
 
     async def sender(self):
         async with self._send_lock:
-            self._queue = {
-                client_id: utils.chunks(
-                    utils.escape_html(
-                        "".join(
-                            [
-                                item[0]
-                                for item in self.tg_buff
-                                if isinstance(item[0], str)
-                                and (
-                                    not item[1]
-                                    or item[1] == client_id
-                                    or self.force_send_all
-                                )
-                            ]
+            items = []
+            while self.tg_buff:
+                items.append(self.tg_buff.popleft())
+
+            await asyncio.gather(
+                *(self._ship(client_id, items) for client_id in list(self._mods)),
+                return_exceptions=True,
+            )
+
+    async def _ship(
+        self,
+        client_id: int,
+        items: typing.List[
+            typing.Tuple[typing.Union[str, LegacyException], typing.Optional[int]]
+        ],
+    ):
+        mod = self._mods[client_id]
+        bot = mod.inline.bot
+        items = [
+            item
+            for item, caller in items
+            if not caller or caller == client_id or self.force_send_all
+        ]
+
+        now = time.monotonic()
+        for key, (until, count, exc) in list(self._repeats.items()):
+            if key[0] != client_id or until > now:
+                continue
+
+            del self._repeats[key]
+            if count:
+                await self._send(
+                    bot.send_message,
+                    mod.logchat,
+                    (
+                        f"🔁 <b>Error repeated {count} more time(s) in"
+                        f" {EXCEPTION_REPEAT_WINDOW} seconds:</b>\n<code>"
+                        + utils.escape_html(
+                            "".join(
+                                traceback.format_exception_only(*exc.sysinfo[:2])
+                            ).strip()
+                            if exc.sysinfo
+                            else exc.message
                         )
+                        + "</code>"
                     ),
-                    4096,
+                    disable_notification=True,
                 )
-                for client_id in self._mods
-            }
-            for client_id in self._mods:
-                for item in self.tg_buff:
-                    if isinstance(item[0], LegacyException) and (
-                        not item[1] or item[1] == client_id or self.force_send_all
-                    ):
-                        reply_markup_btns = [
-                            {
-                                "text": "🌙 Full traceback",
-                                "callback": self._show_full_trace,
-                                "args": (
-                                    self._mods[client_id].inline.bot,
-                                    item[0],
-                                ),
-                                "disable_security": True,
-                            },
-                        ]
-                        if "No module named" in item[0].message:
-                            match = re.search(r"'([^']+)'", item[0].message)
-                            if match:
-                                lib = match.group(1)
-                                reply_markup_btns.append(
-                                    {
-                                        "text": "⬇️ Установить",
-                                        "callback": self._install_pylib,
-                                        "args": (self._mods[client_id].inline.bot, lib),
-                                    }
-                                )
-                        await self._mods[client_id].inline.bot.send_message(
-                            self._mods[client_id].logchat,
-                            item[0].message,
-                            reply_markup=self._mods[client_id].inline.generate_markup(
-                                reply_markup_btns
-                            ),
-                        )
 
-            self.tg_buff = []
+        for item in items:
+            if not isinstance(item, LegacyException):
+                continue
 
-            for client_id in self._mods:
-                if client_id not in self._queue:
-                    continue
+            key = (client_id, item.message)
+            if key in self._repeats:
+                self._repeats[key][1] += 1
+                continue
 
-                if len(self._queue[client_id]) > 5:
-                    logfile = io.BytesIO(
-                        "".join(self._queue[client_id]).encode("utf-8")
-                    )
-                    logfile.name = "legacy-logs.txt"
-                    logfile.seek(0)
-                    await self._mods[client_id].inline.bot.send_document(
-                        self._mods[client_id].logchat,
-                        logfile,
-                        caption=(
-                            "<b>🧳 Журналы слишком велики, чтобы их можно было отправлять отдельными сообщениями.</b>"
-                        ),
+            self._repeats[key] = [now + EXCEPTION_REPEAT_WINDOW, 0, item]
+
+            reply_markup_btns = [
+                {
+                    "text": "🌙 Full traceback",
+                    "callback": self._show_full_trace,
+                    "args": (bot, item),
+                    "disable_security": True,
+                },
+            ]
+            if "No module named" in item.message:
+                match = re.search(r"'([^']+)'", item.message)
+                if match:
+                    lib = match.group(1)
+                    reply_markup_btns.append(
+                        {
+                            "text": "⬇️ Установить",
+                            "callback": self._install_pylib,
+                            "args": (bot, lib),
+                        }
                     )
 
-                    self._queue[client_id] = []
-                    continue
-
-                while self._queue[client_id]:
-                    if chunk := self._queue[client_id].pop(0):
-                        asyncio.ensure_future(
-                            self._mods[client_id].inline.bot.send_message(
-                                self._mods[client_id].logchat,
-                                f"<code>{chunk}</code>",
-                                disable_notification=True,
-                            )
-                        )
+            await self._send(
+                bot.send_message,
+                mod.logchat,
+                item.message,
+                reply_markup=mod.inline.generate_markup(reply_markup_btns),
+            )
 
-    def emit(self, record: logging.LogRecord):
-        try:
-            caller = next(
-                (
-                    frame_info.frame.f_locals["_legacy_client_id_logging_tag"]
-                    for frame_info in inspect.stack()
-                    if isinstance(
-                        getattr(getattr(frame_info, "frame", None), "f_locals", {}).get(
-                            "_legacy_client_id_logging_tag"
-                        ),
-                        int,
-                    )
+        chunks = utils.chunks(
+            utils.escape_html("".join(item for item in items if isinstance(item, str))),
+            4096,
+        )
+
+        if len(chunks) > TG_LOG_MAX_MESSAGES:
+            logfile = io.BytesIO("".join(chunks).encode("utf-8"))
+            logfile.name = "legacy-logs.txt"
+            logfile.seek(0)
+            await self._send(
+                bot.send_document,
+                mod.logchat,
+                logfile,
+                caption=(
+                    "<b>🧳 Журналы слишком велики, чтобы их можно было отправлять отдельными сообщениями.</b>"
                 ),
-                False,
             )
+            return
+
+        for chunk in chunks:
+            if chunk:
+                await self._send(
+                    bot.send_message,
+                    mod.logchat,
+                    f"<code>{chunk}</code>",
+                    disable_notification=True,
+                )
 
-            if not isinstance(caller, int):
-                caller = None
-        except Exception:
-            caller = None
+    async def _send(self, method: typing.Callable, chat_id: int, *args, **kwargs):
+        """Call Bot API method, respecting rate limits of the chat"""
+        bucket = self._buckets.setdefault(
+            chat_id,
+            TokenBucket(TG_LOG_RATE, TG_LOG_BURST),
+        )
+        for _ in range(2):
+            await bucket.acquire()
+            try:
+                return await method(chat_id, *args, **kwargs)
+            except RetryAfter as e:
+                bucket.penalize(e.retry_after)
+                for arg in args:
+                    if isinstance(arg, io.BytesIO):
+                        arg.seek(0)
+            except Exception:
+                # Errors are not logged here, because they would be sent again
+                return None
 
-        record.legacy_caller = caller
+    def emit(self, record: logging.LogRecord):
+        record.legacy_caller = caller = get_logging_tag()
 
         if record.levelno >= self.tg_level:
             if record.exc_info:
@@ -520,21 +669,17 @@ class TelegramLogsHandler(logging.Handler):
                         "https://docs.legacytl.dev/en/stable/concepts/entities.html",
                     ]
                 ):
-                    self.tg_buff += [(exc, caller)]
+                    self.tg_buff.append((exc, caller))
+                    self._wake()
             else:
-                self.tg_buff += [
-                    (
-                        _tg_formatter.format(record),
-                        caller,
-                    )
-                ]
+                self.tg_buff.append((_tg_formatter.format(record), caller))
+                self._wake()
 
-        if len(self.buffer) + len(self.handledbuffer) >= self.capacity:
-            if self.handledbuffer:
-                del self.handledbuffer[0]
-            else:
-                del self.buffer[0]
+        # Exception is formatted once and reused by targets
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _main_formatter.formatException(record.exc_info)
 
+        self.history.append(record, caller, record.exc_text)
         self.buffer.append(record)
 
         if record.levelno >= self.lvl >= 0:
@@ -545,11 +690,7 @@ class TelegramLogsHandler(logging.Handler):
                         if record.levelno >= target.level:
                             target.handle(precord)
 
-                self.handledbuffer = (
-                    self.handledbuffer[-(self.capacity - len(self.buffer)) :]
-                    + self.buffer
-                )
-                self.buffer = []
+                self.buffer.clear()
             finally:
                 self.release()
 
@@ -60,6 +60,7 @@ from legacytl.tl.functions.account import GetPasswordRequest
 from legacytl.tl.functions.auth import CheckPasswordRequest
 
 from . import database, loader, utils, version
+from ._context import client_id_logging_tag
 from ._internal import print_banner, restart
 from .dispatcher import CommandDispatcher
 from .qr import QRCode
@@ -769,6 +770,8 @@ class Legacy:
             client._tg_id = me.id
             client.tg_id = me.id
             client.legacy_me = me
+            # Everything, started by this client, inherits its logging tag
+            client_id_logging_tag.set(me.id)
             while await self.amain(first, client):
                 first = False
 
@@ -848,6 +851,7 @@ class Legacy:
         dispatcher = CommandDispatcher(modules, client, db)
         client.dispatcher = dispatcher
         modules.check_security = dispatcher.check_security
+        modules.check_security_many = dispatcher.check_security_many
 
         client.add_event_handler(
             dispatcher.handle_incoming,
@@ -5,10 +5,10 @@
 # 🔑 https://www.gnu.org/licenses/agpl-3.0.html
 
 import asyncio
+import collections
 import io
 import ujson
 import logging
-import random
 import time
 import typing
 
@@ -18,6 +18,7 @@ from legacytl.tl.types import Message
 from legacytl.utils import is_list_like
 
 from .. import loader, utils
+from .._context import get_current_module
 from ..inline.types import InlineCall
 
 logger = logging.getLogger(__name__)
@@ -57,6 +58,9 @@ def get_methods_from_group(group_obj):
     ]
 
 
+# Method families, which are rate limited
+PROTECTED_GROUPS = {"messages", "account", "channels"}
+
 CONSTRUCTORS = {}
 
 for group in GROUPS:
@@ -73,9 +77,15 @@ class APIRatelimiterMod(loader.Module):
     strings = {"name": "APILimiter"}
 
     def __init__(self):
-        self._ratelimiter: typing.List[tuple] = []
+        # (family, caller) -> (time, request name) of requests in the last `time_sample`
+        self._windows: typing.Dict[typing.Tuple[str, str], typing.Deque[tuple]] = {}
+        # (family, caller) -> time, until which its requests are delayed
+        self._blocked_until: typing.Dict[typing.Tuple[str, str], float] = {}
+        # (caller, request name) -> count since start
+        self._calls: typing.Counter[typing.Tuple[str, str]] = collections.Counter()
+        # caller -> count of delayed requests since start
+        self._delayed: typing.Counter[str] = collections.Counter()
         self._suspend_until = 0
-        self._lock = False
         self.config = loader.ModuleConfig(
             loader.ConfigValue(
                 "time_sample",
@@ -155,58 +165,9 @@ class APIRatelimiterMod(loader.Module):
             ordered: bool = False,
             flood_sleep_threshold: int = None,
         ):
-            await asyncio.sleep(random.randint(1, 5) / 100)
             req = (request,) if not is_list_like(request) else request
             for r in req:
-                if (
-                    time.perf_counter() > self._suspend_until
-                    and not self.get(
-                        "disable_protection",
-                        True,
-                    )
-                    and (
-                        r.__module__.rsplit(".", maxsplit=1)[1]
-                        in {"messages", "account", "channels"}
-                    )
-                ):
-                    request_name = type(r).__name__
-                    self._ratelimiter += [(request_name, time.perf_counter())]
-
-                    self._ratelimiter = list(
-                        filter(
-                            lambda x: time.perf_counter() - x[1]
-                            < int(self.config["time_sample"]),
-                            self._ratelimiter,
-                        )
-                    )
-
-                    if (
-                        len(self._ratelimiter) > int(self.config["threshold"])
-                        and not self._lock
-                    ):
-                        self._lock = True
-                        report = io.BytesIO(
-                            ujson.dumps(
-                                self._ratelimiter,
-                                indent=4,
-                            ).encode()
-                        )
-                        report.name = "local_fw_report.json"
-
-                        await self.inline.bot.send_document(
-                            self.tg_id,
-                            report,
-                            caption=self.inline.sanitise_text(
-                                self.strings("warning").format(
-                                    self.config["local_floodwait"],
-                                    prefix=utils.escape_html(self.get_prefix()),
-                                )
-                            ),
-                        )
-
-                        # It is intented to use time.sleep instead of asyncio.sleep
-                        time.sleep(int(self.config["local_floodwait"]))
-                        self._lock = False
+                await self._account(r)
 
             return await old_call(sender, request, ordered, flood_sleep_threshold)
 
@@ -215,6 +176,80 @@ class APIRatelimiterMod(loader.Module):
         self._client._call._legacy_overwritten = True
         logger.debug("Successfully installed ratelimiter")
 
+    async def _account(self, request: TLRequest):
+        """
+        Attribute request to the module, which made it, and delay it, if this
+        module exceeded the limit for request family. Requests of other
+        modules are not delayed
+        """
+        module = get_current_module()
+        caller = module.__class__.__name__ if module is not None else "-"
+        request_name = type(request).__name__
+        self._calls[(caller, request_name)] += 1
+
+        family = request.__module__.rsplit(".", maxsplit=1)[1]
+        if family not in PROTECTED_GROUPS or self.get("disable_protection", True):
+            return
+
+        now = time.perf_counter()
+        if now < self._suspend_until:
+            return
+
+        key = (family, caller)
+        if (blocked_until := self._blocked_until.get(key, 0)) > now:
+            self._delayed[caller] += 1
+            await asyncio.sleep(blocked_until - now)
+            now = time.perf_counter()
+
+        window = self._windows.setdefault(key, collections.deque())
+        window.append((now, request_name))
+        time_sample = int(self.config["time_sample"])
+        while now - window[0][0] >= time_sample:
+            window.popleft()
+
+        if len(window) <= int(self.config["threshold"]):
+            return
+
+        floodwait = int(self.config["local_floodwait"])
+        self._blocked_until[key] = now + floodwait
+        self._delayed[caller] += 1
+        report = list(window)
+        window.clear()
+        asyncio.ensure_future(self._send_warning(family, caller, report))
+        await asyncio.sleep(floodwait)
+
+    async def _send_warning(
+        self,
+        family: str,
+        caller: str,
+        requests: typing.List[tuple],
+    ):
+        report = io.BytesIO(
+            ujson.dumps(
+                {
+                    "family": family,
+                    "caller": caller,
+                    "requests": requests,
+                },
+                indent=4,
+            ).encode()
+        )
+        report.name = "local_fw_report.json"
+
+        try:
+            await self.inline.bot.send_document(
+                self.tg_id,
+                report,
+                caption=self.inline.sanitise_text(
+                    self.strings("warning").format(
+                        self.config["local_floodwait"],
+                        prefix=utils.escape_html(self.get_prefix()),
+                    )
+                ),
+            )
+        except Exception:
+            logger.exception("Can't send local floodwait report")
+
     async def on_unload(self):
         if hasattr(self._client, "_old_call_rewritten"):
             self._client._call = self._client._old_call_rewritten
@@ -230,6 +265,33 @@ class APIRatelimiterMod(loader.Module):
         self._suspend_until = time.perf_counter() + int(args)
         await utils.answer(message, self.strings("suspended_for").format(args))
 
+    @loader.command()
+    async def apireport(self, message: Message):
+        if not self._calls:
+            await utils.answer(message, self.strings("no_requests"))
+            return
+
+        total = collections.Counter()
+        top_request = {}
+        for (caller, request_name), count in self._calls.most_common():
+            total[caller] += count
+            top_request.setdefault(caller, request_name)
+
+        await utils.answer(
+            message,
+            self.strings("report").format(
+                "\n".join(
+                    self.strings("report_line").format(
+                        utils.escape_html(caller),
+                        count,
+                        self._delayed[caller],
+                        utils.escape_html(top_request[caller]),
+                    )
+                    for caller, count in total.most_common(10)
+                )
+            ),
+        )
+
     @loader.command()
     async def api_fw_protection(self, message: Message):
         await self.inline.form(
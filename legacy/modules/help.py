@@ -8,20 +8,26 @@ import re
 import difflib
 import inspect
 import logging
+import typing
 
 from legacytl.extensions.html import CUSTOM_EMOJIS
 from legacytl.tl.types import Message
 
-from .. import loader, utils
+from .. import loader, main, security, translations, utils
+from .._cache import BoundedCache
 
 logger = logging.getLogger(__name__)
 
+HELP_CACHE_SIZE = 256
+HELP_CACHE_TTL = 5 * 60
+
 
 @loader.tds
 class Help(loader.Module):
     strings = {"name": "Help"}
 
     def __init__(self):
+        self._help_cache = BoundedCache(HELP_CACHE_SIZE)
         self.config = loader.ModuleConfig(
             loader.ConfigValue(
                 "core_emoji",
@@ -196,10 +202,12 @@ class Help(loader.Module):
                 self.strings["lib_help"].format(name),
             )
 
+        allowed = await self.allmodules.check_security_many(
+            message,
+            module.commands.values(),
+        )
         commands = {
-            name: func
-            for name, func in module.commands.items()
-            if await self.allmodules.check_security(message, func)
+            name: func for name, func in module.commands.items() if allowed[func]
         }
 
         if hasattr(module, "inline_handlers"):
@@ -278,6 +286,30 @@ class Help(loader.Module):
 
         hidden = self.get("hide", [])
 
+        cache_key = self._get_help_cache_key(
+            message,
+            hidden,
+            force,
+            only_hidden,
+            only_core,
+        )
+        if (cached := self._help_cache.get(cache_key)) is not None:
+            await utils.answer(message, cached)
+            return
+
+        allowed = {}
+        allowed_inline = {}
+        if not force:
+            mods = [mod for mod in self.allmodules.modules if hasattr(mod, "commands")]
+            allowed = await self.allmodules.check_security_many(
+                message,
+                [func for mod in mods for func in mod.commands.values()],
+            )
+            allowed_inline = await self.inline.check_inline_security_many(
+                funcs=[func for mod in mods for func in mod.inline_handlers.values()],
+                user=message.sender_id,
+            )
+
         plain_ = []
         core_ = []
         core_hidden_ = []
@@ -316,9 +348,7 @@ class Help(loader.Module):
             first = True
 
             commands = [
-                name
-                for name, func in mod.commands.items()
-                if await self.allmodules.check_security(message, func) or force
+                name for name, func in mod.commands.items() if force or allowed[func]
             ]
 
             if self.config["show_cmds"]:
@@ -332,11 +362,7 @@ class Help(loader.Module):
             icommands = [
                 name
                 for name, func in mod.inline_handlers.items()
-                if await self.inline.check_inline_security(
-                    func=func,
-                    user=message.sender_id,
-                )
-                or force
+                if force or allowed_inline[func]
             ]
 
             if self.config["show_cmds"]:
@@ -406,17 +432,81 @@ class Help(loader.Module):
         else:
             full_list = core_ + plain_
 
-        await utils.answer(
-            message,
-            (self.config["desc_icon"] + " {}\n {}{}").format(
-                reply,
-                f"<blockquote {'expandable' if self.config['expandable'] else ''}>{''.join(full_list)}</blockquote>",
-                (
-                    ""
-                    if self.lookup("Loader").fully_loaded
-                    else f"\n\n{self.strings['partial_load']}"
-                ),
+        reply = (self.config["desc_icon"] + " {}\n {}{}").format(
+            reply,
+            f"<blockquote {'expandable' if self.config['expandable'] else ''}>{''.join(full_list)}</blockquote>",
+            (
+                ""
+                if self.lookup("Loader").fully_loaded
+                else f"\n\n{self.strings['partial_load']}"
+            ),
+        )
+        self._help_cache.set(cache_key, reply, HELP_CACHE_TTL)
+        await utils.answer(message, reply)
+
+    def _get_help_cache_key(
+        self,
+        message: Message,
+        hidden: typing.List[str],
+        *flags: bool,
+    ) -> tuple:
+        """
+        Get key, under which the rendered help is cached
+        :param message: Message, which requested help
+        :param hidden: Hidden modules
+        :param flags: Flags of help command
+        :return: Key, which changes whenever the output can change
+        """
+        manager = self._client.dispatcher.security
+        chat_id = utils.get_chat_id(message)
+        is_owner = (
+            message.sender_id in manager.owner or message.out and not message.is_channel
+        )
+        # Owner is allowed to run everything, which is not masked out,
+        # so the result doesn't depend on the chat, unless chats are filtered
+        scope = (
+            (
+                "owner",
+                any(
+                    self._db.get(main.__name__, option, [])
+                    for option in (
+                        "blacklist_chats",
+                        "whitelist_chats",
+                        "whitelist_modules",
+                    )
+                )
+                and chat_id,
+            )
+            if is_owner
+            else (message.sender_id, chat_id)
+        )
+        return (
+            scope,
+            # Language, module translations, chat lists, masks and rules
+            # are all saved to these owners
+            self._db.version(translations.__name__),
+            self._db.version(main.__name__),
+            self._db.version(security.__name__),
+            self.translator.version,
+            self.allmodules.handlers.version,
+            tuple(map(id, self.allmodules.modules)),
+            # Owner's result doesn't depend on participants and their rights
+            None if is_owner else manager.version,
+            getattr(self.inline, "bot_username", None),
+            tuple(
+                self.config[option]
+                for option in (
+                    "core_emoji",
+                    "plain_emoji",
+                    "empty_emoji",
+                    "desc_icon",
+                    "expandable",
+                    "show_cmds",
+                )
             ),
+            self.lookup("Loader").fully_loaded,
+            tuple(hidden),
+            *flags,
         )
 
     @loader.command()
@@ -814,22 +814,22 @@ class LegacySettingsMod(loader.Module):
                 result = (
                     f"Сброшено {len(self._client._legacy_entity_cache)} записей кэша"
                 )
-                self._client._legacy_entity_cache = {}
+                self._client._legacy_entity_cache.clear()
             elif method == "flush_fulluser_cache":
                 result = (
                     f"Сброшено {len(self._client._legacy_fulluser_cache)} записей кэша"
                 )
-                self._client._legacy_fulluser_cache = {}
+                self._client._legacy_fulluser_cache.clear()
             elif method == "flush_fullchannel_cache":
                 result = (
                     f"Сброшено {len(self._client._legacy_fullchannel_cache)} записей кэша"
                 )
-                self._client._legacy_fullchannel_cache = {}
+                self._client._legacy_fullchannel_cache.clear()
             elif method == "flush_perms_cache":
                 result = (
                     f"Сброшено {len(self._client._legacy_perms_cache)} записей кэша"
                 )
-                self._client._legacy_perms_cache = {}
+                self._client._legacy_perms_cache.clear()
             elif method == "flush_loader_cache":
                 result = (
                     f"Сброшено {await self.lookup('loader').flush_cache()} записей кэша"
@@ -842,9 +842,9 @@ class LegacySettingsMod(loader.Module):
                     f"Сброшено {len(self._client._legacy_fullchannel_cache)} записей кэша каналов\n"
                     f"Сброшено {count} записей кэша ссылок загрузчика"
                 )
-                self._client._legacy_entity_cache = {}
-                self._client._legacy_fulluser_cache = {}
-                self._client._legacy_fullchannel_cache = {}
+                self._client._legacy_entity_cache.clear()
+                self._client._legacy_fulluser_cache.clear()
+                self._client._legacy_fullchannel_cache.clear()
                 self._client.legacy_me = await self._client.get_me()
             elif method == "reload_core":
                 core_quantity = await self.lookup("loader").reload_core()
@@ -48,6 +48,8 @@ class LoaderMod(loader.Module):
     def __init__(self):
         self.fully_loaded = False
         self._links_cache = {}
+        # repo -> request of its links, shared by simultaneous lookups
+        self._repo_fetches: typing.Dict[str, asyncio.Future] = {}
         self._storage: RemoteStorage = None
 
         self.config = loader.ModuleConfig(
@@ -98,7 +100,10 @@ class LoaderMod(loader.Module):
         while not (settings := self.lookup("settings")):
             await asyncio.sleep(0.5)
 
-        self._storage = RemoteStorage(self._client)
+        self._storage = RemoteStorage(
+            self._client,
+            offline=bool(main.get_config_key("offline_modules")),
+        )
 
         self.allmodules.add_aliases(settings.get("aliases", {}))
 
@@ -202,6 +207,16 @@ class LoaderMod(loader.Module):
         if self._links_cache.get(repo, {}).get("exp", 0) >= time.time():
             return self._links_cache[repo]["data"]
 
+        if (fetch := self._repo_fetches.get(repo)) is None:
+            fetch = self._repo_fetches[repo] = asyncio.ensure_future(
+                self._fetch_repo(repo)
+            )
+            fetch.add_done_callback(lambda _: self._repo_fetches.pop(repo, None))
+
+        # Cancellation of one waiter must not cancel the request for others
+        return await asyncio.shield(fetch)
+
+    async def _fetch_repo(self, repo: str) -> typing.List[str]:
         res = await utils.run_sync(
             requests.get,
             f"{repo}/full.txt",
@@ -257,6 +272,27 @@ class LoaderMod(loader.Module):
             False,
         )
 
+    async def _resolve_link(
+        self,
+        module_name: str,
+    ) -> typing.Tuple[typing.Union[str, bool], bool]:
+        """
+        Get link to module source
+        :param module_name: Module name or link
+        :return: Link (`False` if not found) and whether it was a blob link
+        """
+        if not urlparse(module_name).netloc:
+            return await self._find_link(module_name), False
+
+        if re.match(
+            r"^(https:\/\/github\.com\/.*?\/.*?\/blob\/.*\.py)|"
+            r"(https:\/\/gitlab\.com\/.*?\/.*?\/-\/blob\/.*\.py)$",
+            module_name,
+        ):
+            return module_name.replace("/blob/", "/raw/"), True
+
+        return module_name, False
+
     async def download_and_install(
         self,
         module_names: list,
@@ -265,28 +301,34 @@ class LoaderMod(loader.Module):
     ) -> list:
         buff = []
         output = []
-        for module_name in module_names:
+        if isinstance(module_names, str):
+            module_names = [module_names]
+
+        module_names = [module_name.strip() for module_name in module_names]
+
+        # Sources are downloaded simultaneously, but modules are still loaded
+        # one by one in the given order, so dependent modules load as before
+        links = await asyncio.gather(
+            *map(self._resolve_link, module_names),
+            return_exceptions=True,
+        )
+        sources = await self._storage.fetch_many(
+            (link[0] for link in links if isinstance(link, tuple) and link[0]),
+            auth=self.config["basic_auth"],
+        )
+
+        for module_name, link in zip(module_names, links):
             try:
-                blob_link = False
-                module_name = module_name.strip()
-                if urlparse(module_name).netloc:
-                    url = module_name
-                    if re.match(
-                        r"^(https:\/\/github\.com\/.*?\/.*?\/blob\/.*\.py)|"
-                        r"(https:\/\/gitlab\.com\/.*?\/.*?\/-\/blob\/.*\.py)$",
-                        url,
-                    ):
-                        url = url.replace("/blob/", "/raw/")
-                        blob_link = True
-                else:
-                    url = await self._find_link(module_name)
-
-                    if not url:
-                        if message is not None:
-                            output.append(self.strings("no_module").format(module_name, f'{self.get_prefix()}dlm'))
-
-                        buff.append(MODULE_LOADING_FAILED)
-                        continue
+                if isinstance(link, Exception):
+                    raise link
+
+                url, blob_link = link
+                if not url:
+                    if message is not None:
+                        output.append(self.strings("no_module").format(module_name, f'{self.get_prefix()}dlm'))
+
+                    buff.append(MODULE_LOADING_FAILED)
+                    continue
 
                 if message:
                     message = await utils.answer(
@@ -294,15 +336,17 @@ class LoaderMod(loader.Module):
                         self.strings("installing").format(module_name),
                     )
 
-                try:
-                    r = await self._storage.fetch(url, auth=self.config["basic_auth"])
-                except requests.exceptions.HTTPError:
+                r = sources[url]
+                if isinstance(r, requests.exceptions.HTTPError):
                     if message is not None:
                         output.append(self.strings("no_module").format(module_name, f'{self.get_prefix()}dlm'))
 
                     buff.append(MODULE_LOADING_FAILED)
                     continue
 
+                if isinstance(r, Exception):
+                    raise r
+
                 result = await self.load_module(
                     r,
                     message,
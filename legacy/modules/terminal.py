@@ -23,6 +23,8 @@
 # meta developer: @bsolute
 
 import asyncio
+import codecs
+import collections
 import contextlib
 import logging
 import os
@@ -36,37 +38,87 @@ from .. import loader, utils
 
 logger = logging.getLogger(__name__)
 
+STREAM_CHUNK_SIZE = 64 * 1024
+# Editors show at most last 2048 characters of output
+STREAM_TAIL_SIZE = 4096
+
 
 def hash_msg(message):
     return f"{str(utils.get_chat_id(message))}/{str(message.id)}"
 
 
-async def read_stream(func: callable, stream, delay: float):
-    last_task = None
-    data = b""
-    while True:
-        dat = await stream.read(1)
+class StreamTail:
+    """Decodes the stream and keeps only its last `size` characters"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.version = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._chunks: typing.Deque[str] = collections.deque()
+        self._length = 0
+
+    def feed(self, data: bytes, final: bool = False):
+        # Decoder keeps incomplete characters until the next chunk arrives
+        if not (text := self._decoder.decode(data, final)):
+            return
 
-        if not dat:
-            # EOF
-            if last_task:
-                # Send all pending data
-                last_task.cancel()
-                await func(data.decode())
-                # If there is no last task there is inherently no data, so theres no point sending a blank string
-            break
+        text = text[-self.size :]
+        self._chunks.append(text)
+        self._length += len(text)
+        while self._length - len(self._chunks[0]) >= self.size:
+            self._length -= len(self._chunks.popleft())
 
-        data += dat
+        self.version += 1
 
-        if last_task:
-            last_task.cancel()
+    def __str__(self) -> str:
+        return "".join(self._chunks)[-self.size :]
 
-        last_task = asyncio.ensure_future(sleep_for_task(func, data, delay))
 
+async def _read_into(tail: StreamTail, stream, changed: asyncio.Event):
+    try:
+        while data := await stream.read(STREAM_CHUNK_SIZE):
+            tail.feed(data)
+            changed.set()
 
-async def sleep_for_task(func: callable, data: bytes, delay: float):
-    await asyncio.sleep(delay)
-    await func(data.decode())
+        tail.feed(b"", final=True)
+    finally:
+        changed.set()
+
+
+async def read_stream(func: callable, stream, delay: float):
+    """
+    Read the stream and pass its tail to `func`, calling it
+    at most once per `delay` seconds and once more on EOF
+    :param func: Coroutine function, which receives decoded tail of the stream
+    :param stream: Stream to read
+    :param delay: Minimal interval between calls of `func`
+    """
+    tail = StreamTail(STREAM_TAIL_SIZE)
+    changed = asyncio.Event()
+    reading = asyncio.ensure_future(_read_into(tail, stream, changed))
+    sent = 0
+
+    try:
+        while True:
+            await changed.wait()
+            changed.clear()
+            final = reading.done()
+
+            # If there is no new data, theres no point sending the same string
+            if tail.version != sent:
+                sent = tail.version
+                await func(str(tail))
+
+            if final:
+                break
+
+            # Output, which arrives meanwhile, is coalesced into one call.
+            # EOF interrupts the pause, so the final output is not delayed
+            await asyncio.wait({reading}, timeout=delay)
+    finally:
+        reading.cancel()
+
+    reading.result()
 
 
 class MessageEditor:
@@ -87,6 +139,8 @@ class MessageEditor:
         self.config = config
         self.strings = strings
         self.request_message = request_message
+        # stdout and stderr are redrawn independently, but edit the same message
+        self._redraw_lock = asyncio.Lock()
 
     async def update_stdout(self, stdout):
         self.stdout = stdout
@@ -97,6 +151,10 @@ class MessageEditor:
         await self.redraw()
 
     async def redraw(self):
+        async with self._redraw_lock:
+            await self._redraw()
+
+    async def _redraw(self):
         text = self.strings("running").format(utils.escape_html(self.command))  # fmt: skip
 
         if self.rc is not None:
@@ -114,6 +172,13 @@ class MessageEditor:
             except legacytl.errors.rpcerrorlist.MessageTooLongError as e:
                 logger.error(e)
                 logger.error(text)
+            except legacytl.errors.FloodWaitError as e:
+                # Output, which arrives meanwhile, will be shown by the next
+                # redraw, so only the final one is retried
+                logger.debug("Sleeping %ss on terminal redraw", e.seconds)
+                await asyncio.sleep(e.seconds)
+                if self.rc is not None:
+                    self.message = await utils.answer(self.message, text)
         # The message is never empty due to the template header
 
     async def cmd_ended(self, rc):
@@ -6,6 +6,7 @@
 
 import getpass
 import inspect
+import io
 import logging
 import os
 import platform as lib_platform
@@ -18,6 +19,7 @@ from legacytl.tl.types import InputMediaWebPage, Message
 
 from .. import loader, main, utils
 from ..inline.types import InlineCall
+from ..log import TelegramLogsHandler
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +32,43 @@ for mod in os.scandir(DEBUG_MODS_DIR):
     os.remove(mod.path)
 
 
+class _CensoredWriter:
+    """
+    Text file wrapper, which censors entries in batches before writing them
+    :param file: Text file to write to. It is detached, not closed, by `close`
+    :param censor: Function, which hides private data in text
+    """
+
+    BATCH_SIZE = 64 * 1024
+
+    def __init__(self, file: io.TextIOWrapper, censor: typing.Callable[[str], str]):
+        self._file = file
+        self._censor = censor
+        self._batch = []
+        self._size = 0
+
+    def write(self, text: str) -> int:
+        self._batch.append(text)
+        self._size += len(text)
+
+        # Entries are flushed only as a whole, so secrets are never split
+        if self._size >= self.BATCH_SIZE and text.endswith("\n"):
+            self.flush()
+
+        return len(text)
+
+    def flush(self):
+        if self._batch:
+            self._file.write(self._censor("".join(self._batch)))
+            self._batch.clear()
+            self._size = 0
+
+    def close(self):
+        self.flush()
+        self._file.flush()
+        self._file.detach()
+
+
 @loader.tds
 class TestMod(loader.Module):
     strings = {"name": "Tester"}
@@ -118,9 +157,13 @@ class TestMod(loader.Module):
     @loader.command()
     async def clearlogs(self, message: Message):
         for handler in logging.getLogger().handlers:
-            handler.buffer = []
-            handler.handledbuffer = []
-            handler.tg_buff = ""
+            # Handlers, added by modules and libraries, are left as is
+            if not isinstance(handler, TelegramLogsHandler):
+                continue
+
+            handler.buffer.clear()
+            handler.history.clear()
+            handler.tg_buff.clear()
 
         await utils.answer(message, self.strings("logs_cleared"))
 
@@ -286,17 +329,6 @@ class TestMod(loader.Module):
 
             return
 
-        logs = "\n\n".join(
-            [
-                "\n".join(
-                    handler.dumps(lvl, client_id=self._client.tg_id)
-                    if "client_id" in inspect.signature(handler.dumps).parameters
-                    else handler.dumps(lvl)
-                )
-                for handler in logging.getLogger().handlers
-            ]
-        )
-
         named_lvl = (
             lvl
             if lvl not in logging._levelToName
@@ -343,7 +375,9 @@ class TestMod(loader.Module):
 
             return
 
-        if len(logs) <= 2:
+        logs = self._export_logs(lvl)
+
+        if logs is None:
             if isinstance(message, Message):
                 await utils.answer(
                     message,
@@ -369,11 +403,6 @@ class TestMod(loader.Module):
 
             return
 
-        logs = self.lookup("evaluator").censor(logs)
-
-        logs = BytesIO(logs.encode("utf-16"))
-        logs.name = "legacy-logs.txt"
-
         ghash = utils.get_git_hash()
 
         other = (
@@ -402,6 +431,43 @@ class TestMod(loader.Module):
                 reply_to=message.form["top_msg_id"],
             )
 
+    def _export_logs(self, lvl: int) -> typing.Optional[BytesIO]:
+        """
+        Write censored entries of all log handlers to in-memory file
+        :param lvl: Minimum level of entries
+        :return: File to send or `None` if there are no entries
+        """
+        file = BytesIO()
+        file.name = "legacy-logs.txt"
+        writer = _CensoredWriter(
+            io.TextIOWrapper(file, encoding="utf-16"),
+            self.lookup("evaluator").censor,
+        )
+        count = 0
+
+        for handler in logging.getLogger().handlers:
+            if count:
+                writer.write("\n")
+
+            if hasattr(handler, "write_logs"):
+                count += handler.write_logs(
+                    writer,
+                    lvl,
+                    client_id=self._client.tg_id,
+                )
+            elif hasattr(handler, "dumps"):
+                for count, entry in enumerate(handler.dumps(lvl), count + 1):
+                    writer.write(entry)
+                    writer.write("\n")
+
+        writer.close()
+
+        if not count:
+            return None
+
+        file.seek(0)
+        return file
+
     @loader.command()
     async def suspend(self, message: Message):
         try:
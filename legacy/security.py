@@ -22,16 +22,31 @@
 # You can redistribute it and/or modify it under the terms of the GNU AGPLv3
 # 🔑 https://www.gnu.org/licenses/agpl-3.0.html
 
+import asyncio
+import functools
 import logging
 import time
 import typing
 
 from legacytl.hints import EntityLike
 from legacytl.tl.functions.messages import GetFullChatRequest
-from legacytl.tl.types import ChatParticipantAdmin, ChatParticipantCreator, Message
+from legacytl.tl.types import (
+    ChatParticipantAdmin,
+    ChatParticipantCreator,
+    ChatParticipants,
+    Message,
+    UpdateChannel,
+    UpdateChannelParticipant,
+    UpdateChatParticipant,
+    UpdateChatParticipantAdd,
+    UpdateChatParticipantAdmin,
+    UpdateChatParticipantDelete,
+    UpdateChatParticipants,
+)
 from legacytl.utils import get_display_name
 
 from . import main, utils
+from ._cache import BoundedCache
 from .database import Database
 from .tl_cache import CustomTelegramClient
 from .types import Command
@@ -83,6 +98,11 @@ PUBLIC_PERMISSIONS = GROUP_OWNER | GROUP_ADMIN_ANY | GROUP_MEMBER | PM
 
 ALL = (1 << 13) - 1
 
+PERMISSIONS_CACHE_SIZE = 4096
+PERMISSIONS_CACHE_TTL = 5 * 60
+
+_MISSING = object()
+
 
 class SecurityGroup(typing.NamedTuple):
     """Represents a security group"""
@@ -162,15 +182,34 @@ def _sec(func: Command, flags: int) -> Command:
     return func
 
 
+class _CheckContext(typing.NamedTuple):
+    """Part of security check, which is shared by all checked functions"""
+
+    user_id: int
+    is_channel: bool
+    chat: typing.Optional[int]
+    command: typing.Optional[str]
+
+
 class SecurityManager:
     """Manages command execution security policy"""
 
     def __init__(self, client: CustomTelegramClient, db: Database):
         self._client = client
         self._db = db
-        self._cache: typing.Dict[int, dict] = {}
+        # (chat_id, user_id) -> participant. For broadcast channels the entry of
+        # the current account holds the channel itself, for basic groups
+        # (chat_id, None) holds all participants, fetched by single request
+        self._cache = BoundedCache(PERMISSIONS_CACHE_SIZE)
+        self._inflight: typing.Dict[typing.Hashable, asyncio.Future] = {}
+        self._sweep_handle: typing.Optional[asyncio.TimerHandle] = None
         self._last_warning: int = 0
         self._sgroups: typing.Dict[str, SecurityGroup] = {}
+        # (kind, target, rule_type, rule) -> expiration time or 0. Kind is
+        # "sgroup", "user" or "chat". Rebuilt on every change of the rules
+        self._rules: typing.Dict[typing.Tuple[str, int, str, str], int] = {}
+        # Bumped whenever rules change or cached permissions are dropped
+        self.version = 0
 
         self._any_admin = self.any_admin = db.get(__name__, "any_admin", False)
         self._default = self.default = db.get(__name__, "default", DEFAULT_PERMISSIONS)
@@ -183,23 +222,206 @@ class SecurityManager:
     def apply_sgroups(self, sgroups: typing.Dict[str, SecurityGroup]):
         """Apply security groups"""
         self._sgroups = sgroups
+        self._rebuild_rules()
+
+    def _rebuild_rules(self):
+        rules = {}
+        for group in self._sgroups.values():
+            for permission in group.permissions:
+                for user_id in group.users:
+                    # Security groups' rules don't expire
+                    rules[
+                        ("sgroup", user_id, permission["rule_type"], permission["rule"])
+                    ] = 0
+
+        for kind, infos in (("user", self._tsec_user), ("chat", self._tsec_chat)):
+            for info in infos:
+                key = (kind, info["target"], info["rule_type"], info["rule"])
+                expires = rules.get(key, info["expires"])
+                # If the same rule is added several times, the longest one wins
+                rules[key] = (
+                    max(expires, info["expires"]) if expires and info["expires"] else 0
+                )
+
+        self._rules = rules
+        self.version += 1
+
+    def _has_rule(self, kind: str, target: int, rule_type: str, rule: str) -> bool:
+        """
+        Checks if there is an active rule
+
+        :param kind: "sgroup", "user" or "chat"
+        :param target: user or chat ID
+        :param rule_type: "command", "module" or "inline"
+        :param rule: command or module name
+        :return: True if rule exists and is not expired
+        """
+
+        expires = self._rules.get((kind, target, rule_type, rule))
+        # Rules are swept by timer, but it can fire a bit later
+        return expires is not None and (not expires or expires > time.time())
 
     def _reload_rights(self):
         """
         Internal method to ensure that account owner is always in the owner list
-        and to clear out outdated tsec rules
+        and to clear out outdated tsec rules. Schedules itself to the moment,
+        when the next rule expires
         """
 
         if self._client.tg_id not in self._owner:
             self._owner.append(self._client.tg_id)
 
-        for info in self._tsec_user.copy():
-            if info["expires"] and info["expires"] < time.time():
-                self._tsec_user.remove(info)
+        now = time.time()
+        for rules in (self._tsec_user, self._tsec_chat):
+            for info in rules.copy():
+                if info["expires"] and info["expires"] <= now:
+                    rules.remove(info)
+
+        self._rebuild_rules()
+        self._schedule_sweep()
+
+    def _schedule_sweep(self):
+        if self._sweep_handle:
+            self._sweep_handle.cancel()
+            self._sweep_handle = None
+
+        if not (
+            expires := [
+                info["expires"]
+                for info in (*self._tsec_user, *self._tsec_chat)
+                if info["expires"]
+            ]
+        ):
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No loop yet, so rules will be cleaned up on next `add_rule`
+            return
+
+        self._sweep_handle = loop.call_later(
+            max(min(expires) - time.time(), 0),
+            self._reload_rights,
+        )
+
+    def invalidate(self, chat_id: int, user_id: typing.Optional[int] = None):
+        """
+        Drop cached permissions, so they are fetched again on next check
+        :param chat_id: Chat ID without -100
+        :param user_id: User, whose permissions have changed. If not passed,
+            only the participants of basic group are dropped
+        """
+        keys = [(chat_id, None)]
+        if user_id is not None:
+            keys.append((chat_id, user_id))
+
+        dropped = False
+        for key in keys:
+            dropped |= self._cache.pop(key, _MISSING) is not _MISSING
+            # Result of the request, which is in flight, can be already outdated
+            dropped |= self._inflight.pop(key, None) is not None
 
-        for info in self._tsec_chat.copy():
-            if info["expires"] and info["expires"] < time.time():
-                self._tsec_chat.remove(info)
+        # Updates of chats, which were never checked, don't affect anything
+        if dropped:
+            self.version += 1
+
+    def process_update(self, update: typing.Any):
+        """
+        Invalidate cached permissions on participant and admin rights changes
+        :param update: Raw update
+        """
+        if isinstance(update, UpdateChatParticipants):
+            participants = update.participants
+            self.invalidate(participants.chat_id)
+            if isinstance(participants, ChatParticipants):
+                self._cache.set(
+                    (participants.chat_id, None),
+                    self._map_participants(participants.participants),
+                    PERMISSIONS_CACHE_TTL,
+                )
+        elif isinstance(
+            update,
+            (
+                UpdateChatParticipant,
+                UpdateChatParticipantAdd,
+                UpdateChatParticipantAdmin,
+                UpdateChatParticipantDelete,
+            ),
+        ):
+            self.invalidate(update.chat_id, update.user_id)
+        elif isinstance(update, UpdateChannelParticipant):
+            self.invalidate(update.channel_id, update.user_id)
+        elif isinstance(update, UpdateChannel):
+            self.invalidate(update.channel_id, self._client.tg_id)
+
+    @staticmethod
+    def _map_participants(participants: list) -> typing.Dict[int, typing.Any]:
+        return {participant.user_id: participant for participant in participants}
+
+    async def _cached(
+        self,
+        key: typing.Hashable,
+        getter: typing.Callable[[], typing.Awaitable[typing.Any]],
+        *,
+        store: bool = True,
+    ) -> typing.Any:
+        """
+        Get value from cache or fetch it. Concurrent lookups of the same key
+        share one request
+        :param key: Cache key
+        :param getter: Coroutine function, which fetches the value
+        :param store: Whether to save fetched value to cache
+        :return: Value
+        """
+        if (value := self._cache.get(key, default=_MISSING)) is not _MISSING:
+            return value
+
+        if (future := self._inflight.get(key)) is None:
+            future = self._inflight[key] = asyncio.ensure_future(getter())
+            future.add_done_callback(functools.partial(self._fetched, key, store))
+
+        # Cancellation of one waiter must not cancel the request for others
+        return await asyncio.shield(future)
+
+    def _fetched(self, key: typing.Hashable, store: bool, future: asyncio.Future):
+        if self._inflight.get(key) is not future:
+            # Invalidated while in flight
+            return
+
+        del self._inflight[key]
+        if store and not future.cancelled() and future.exception() is None:
+            self._cache.set(key, future.result(), PERMISSIONS_CACHE_TTL)
+
+    async def _get_editor(self, message: Message) -> typing.Optional[int]:
+        """
+        Get ID of admin, who made the latest edit of channel post
+        :param message: Edited channel post
+        :return: User ID or `None`, if edit is not found in admin log
+        """
+        chat_id = utils.get_chat_id(message)
+        key = ("editor", chat_id, message.id, message.edit_date)
+        if (editor := self._cache.get(key, default=_MISSING)) is not _MISSING:
+            return editor
+
+        # One admin log request resolves all recent edits in the channel.
+        # The request itself is not cached, so edit, which is not seen yet,
+        # causes a new one
+        await self._cached(
+            ("admin_log", chat_id),
+            functools.partial(self._fetch_editors, chat_id),
+            store=False,
+        )
+        return self._cache.get(key)
+
+    async def _fetch_editors(self, chat_id: int):
+        async for event in self._client.iter_admin_log(chat_id, limit=10, edit=True):
+            new_message = event.action.new_message
+            self._cache.set(
+                ("editor", chat_id, new_message.id, new_message.edit_date),
+                event.user_id,
+                PERMISSIONS_CACHE_TTL,
+            )
 
     def add_rule(
         self,
@@ -240,6 +462,8 @@ class SecurityManager:
                 "entity_url": utils.get_entity_url(target),
             }
         )
+        self._rebuild_rules()
+        self._schedule_sweep()
 
     def remove_rules(self, target_type: str, target_id: int) -> bool:
         """
@@ -263,6 +487,9 @@ class SecurityManager:
                     self.tsec_chat.remove(rule)
                     any_ = True
 
+        if any_:
+            self._rebuild_rules()
+
         return any_
 
     def remove_rule(self, target_type: str, target_id: int, rule_cont: str) -> bool:
@@ -288,6 +515,9 @@ class SecurityManager:
                     self.tsec_chat.remove(rule)
                     any_ = True
 
+        if any_:
+            self._rebuild_rules()
+
         return any_
 
     def get_flags(self, func: typing.Union[Command, int]) -> int:
@@ -325,39 +555,76 @@ class SecurityManager:
         :return: True if permitted, False otherwise
         """
 
-        return command and any(
-            (
-                rule["target"] == user_id
-                and rule["rule_type"] == "inline"
-                and rule["rule"] == command
-            )
-            for rule in self._tsec_user
-        )
+        return command and self._has_rule("user", user_id, "inline", command)
 
     def check_tsec(self, user_id: int, command: str) -> bool:
-        for info in self._sgroups.copy().values():
-            if user_id in info.users:
-                for permission in info.permissions:
-                    if (
-                        permission["rule_type"] == "command"
-                        and permission["rule"] == command
-                        or permission["rule_type"] == "module"
-                        and permission["rule"] == command
-                    ):
-                        return True
+        if self._has_rule("sgroup", user_id, "command", command) or self._has_rule(
+            "sgroup", user_id, "module", command
+        ):
+            return True
 
-        for info in self._tsec_user.copy():
-            if info["target"] == user_id and (
-                info["rule_type"] == "command"
-                and info["rule"] == command
-                or info["rule_type"] == "module"
-                and command in self._client.loader.commands
-                and info["rule"]
-                == self._client.loader.commands[command].__qualname__.split(".")[0]
-            ):
-                return True
+        if self._has_rule("user", user_id, "command", command):
+            return True
 
-        return False
+        return command in self._client.loader.commands and self._has_rule(
+            "user",
+            user_id,
+            "module",
+            self._client.loader.commands[command].__qualname__.split(".")[0],
+        )
+
+    async def _get_context(
+        self,
+        message: typing.Optional[Message],
+        user_id: typing.Optional[int] = None,
+        usernames: typing.Optional[typing.List[str]] = None,
+    ) -> _CheckContext:
+        """
+        Resolves everything, which doesn't depend on the checked function
+
+        :param message: Message to check or None if you manually pass user_id
+        :param user_id: user ID
+        :param usernames: usernames of the account to strip from the command
+        :return: check context
+        """
+
+        if not user_id:
+            user_id = message.sender_id
+
+        is_channel = False
+
+        if (
+            message
+            and message.is_channel
+            and not message.is_group
+            and message.edit_date
+            and (editor := await self._get_editor(message))
+        ):
+            user_id = editor
+            is_channel = True
+
+        if message is None:
+            return _CheckContext(user_id, is_channel, None, None)
+
+        try:
+            chat = utils.get_chat_id(message)
+        except Exception:
+            chat = None
+
+        try:
+            cmd = message.raw_text[1:].split()[0].strip()
+            if usernames:
+                for username in usernames:
+                    cmd = cmd.replace(f"@{username}", "")
+        except Exception:
+            cmd = None
+
+        return _CheckContext(
+            user_id,
+            is_channel,
+            chat,
+            self._client.loader.find_alias(cmd, include_legacytl=True) or cmd,
+        )
 
     async def check(
         self,
@@ -378,35 +645,75 @@ class SecurityManager:
         :return: True if permitted, False otherwise
         """
 
-        self._reload_rights()
-
         if not (config := self.get_flags(func)):
             return False
 
-        if not user_id:
-            user_id = message.sender_id
+        return await self._check_config(
+            await self._get_context(message, user_id, usernames),
+            message,
+            func,
+            config,
+            inline_cmd,
+        )
 
-        is_channel = False
+    async def check_many(
+        self,
+        message: typing.Optional[Message],
+        funcs: typing.Iterable[typing.Union[Command, int]],
+        user_id: typing.Optional[int] = None,
+        *,
+        inline_cmds: typing.Optional[typing.Mapping[Command, str]] = None,
+        usernames: typing.Optional[typing.List[str]] = None,
+    ) -> typing.Dict[typing.Union[Command, int], bool]:
+        """
+        Checks if message sender is permitted to execute each of the functions.
+        Sender, chat and participant are resolved once for all of them
 
-        if (
-            message
-            and message.is_channel
-            and not message.is_group
-            and message.edit_date
-        ):
-            async for event in self._client.iter_admin_log(
-                utils.get_chat_id(message),
-                limit=10,
-                edit=True,
-            ):
-                if event.action.prev_message.id == message.id:
-                    user_id = event.user_id
-                    is_channel = True
+        :param message: Message to check or None if you manually pass user_id
+        :param funcs: functions or flags
+        :param user_id: user ID
+        :param inline_cmds: Inline command names of functions if it's inline query
+        :return: Mapping of function to True if permitted, False otherwise
+        """
+
+        context = None
+        result = {}
+        for func in funcs:
+            if not (config := self.get_flags(func)):
+                result[func] = False
+                continue
+
+            if context is None:
+                context = await self._get_context(message, user_id, usernames)
+
+            # Expensive lookups are cached, so only the first function,
+            # which needs them, waits for the request
+            result[func] = bool(
+                await self._check_config(
+                    context,
+                    message,
+                    func,
+                    config,
+                    (inline_cmds or {}).get(func),
+                )
+            )
+
+        return result
+
+    async def _check_config(
+        self,
+        context: _CheckContext,
+        message: typing.Optional[Message],
+        func: typing.Union[Command, int],
+        config: int,
+        inline_cmd: typing.Optional[str] = None,
+    ) -> bool:
+        user_id = context.user_id
 
         if (
             user_id == self._client.tg_id
             or getattr(message, "out", False)
-            and not is_channel
+            and not context.is_channel
         ):
             return True
 
@@ -457,88 +764,34 @@ class SecurityManager:
                 config & EVERYONE
             )
 
-        try:
-            chat = utils.get_chat_id(message)
-        except Exception:
-            chat = None
-
-        try:
-            cmd = message.raw_text[1:].split()[0].strip()
-            if usernames:
-                for username in usernames:
-                    cmd = cmd.replace(f"@{username}", "")
-        except Exception:
-            cmd = None
-
         if callable(func):
-            command = self._client.loader.find_alias(cmd, include_legacytl=True) or cmd
-
-            for info in self._sgroups.copy().values():
-                if user_id in info.users:
-                    for permission in info.permissions:
-                        if (
-                            permission["rule_type"] == "command"
-                            and permission["rule"] == command
-                        ):
-                            logger.debug("sgroup match for %s", command)
-                            return True
-
-                        if (
-                            permission["rule_type"] == "module"
-                            and permission["rule"] == func.__self__.__class__.__name__
-                        ):
-                            logger.debug(
-                                "sgroup match for %s", func.__self__.__class__.__name__
-                            )
-                            return True
-
-            for info in self._tsec_user.copy():
-                if info["target"] == user_id:
-                    if info["rule_type"] == "command" and info["rule"] == command:
-                        logger.debug("tsec match for user %s", command)
-                        return True
+            module = func.__self__.__class__.__name__
 
-                    if (
-                        info["rule_type"] == "module"
-                        and info["rule"] == func.__self__.__class__.__name__
-                    ):
-                        logger.debug(
-                            "tsec match for user %s",
-                            func.__self__.__class__.__name__,
-                        )
-                        return True
+            for kind, target, log_message in (
+                ("sgroup", user_id, "sgroup match for %s"),
+                ("user", user_id, "tsec match for user %s"),
+                ("chat", context.chat, "tsec match for %s"),
+            ):
+                if not target:
+                    continue
 
-            if chat:
-                for info in self._tsec_chat.copy():
-                    if info["target"] == chat:
-                        if info["rule_type"] == "command" and info["rule"] == command:
-                            logger.debug("tsec match for %s", command)
-                            return True
-
-                        if (
-                            info["rule_type"] == "module"
-                            and info["rule"] == func.__self__.__class__.__name__
-                        ):
-                            logger.debug(
-                                "tsec match for %s",
-                                func.__self__.__class__.__name__,
-                            )
-                            return True
+                for rule_type, rule in (
+                    ("command", context.command),
+                    ("module", module),
+                ):
+                    if self._has_rule(kind, target, rule_type, rule):
+                        logger.debug(log_message, rule)
+                        return True
 
         if f_group_member and message.is_group or f_pm and message.is_private:
             return True
 
         if message.is_channel:
             if not message.is_group:
-                chat_id = utils.get_chat_id(message)
-                if (
-                    chat_id in self._cache
-                    and self._cache[chat_id]["exp"] >= time.time()
-                ):
-                    chat = self._cache[chat_id]["chat"]
-                else:
-                    chat = await message.get_chat()
-                    self._cache[chat_id] = {"chat": chat, "exp": time.time() + 5 * 60}
+                chat = await self._cached(
+                    (utils.get_chat_id(message), self._client.tg_id),
+                    message.get_chat,
+                )
 
                 if (
                     not chat.creator
@@ -551,22 +804,14 @@ class SecurityManager:
                 if self._any_admin and f_group_admin_any or f_group_admin:
                     return True
             elif f_group_admin_any or f_group_owner:
-                chat_id = utils.get_chat_id(message)
-                cache_obj = f"{chat_id}/{user_id}"
-                if (
-                    cache_obj in self._cache
-                    and self._cache[cache_obj]["exp"] >= time.time()
-                ):
-                    participant = self._cache[cache_obj]["user"]
-                else:
-                    participant = await message.client.get_permissions(
+                participant = await self._cached(
+                    (utils.get_chat_id(message), user_id),
+                    functools.partial(
+                        message.client.get_permissions,
                         message.peer_id,
                         user_id,
-                    )
-                    self._cache[cache_obj] = {
-                        "user": participant,
-                        "exp": time.time() + 5 * 60,
-                    }
+                    ),
+                )
 
                 if (
                     participant.is_creator
@@ -593,31 +838,12 @@ class SecurityManager:
             return False
 
         if message.is_group and (f_group_admin_any or f_group_owner):
-            chat_id = utils.get_chat_id(message)
-            cache_obj = f"{chat_id}/{user_id}"
-
-            if (
-                cache_obj in self._cache
-                and self._cache[cache_obj]["exp"] >= time.time()
-            ):
-                participant = self._cache[cache_obj]["user"]
-            else:
-                full_chat = await message.client(GetFullChatRequest(message.chat_id))
-                participants = full_chat.full_chat.participants.participants
-                participant = next(
-                    (
-                        possible_participant
-                        for possible_participant in participants
-                        if possible_participant.user_id == message.sender_id
-                    ),
-                    None,
-                )
-                self._cache[cache_obj] = {
-                    "user": participant,
-                    "exp": time.time() + 5 * 60,
-                }
+            participants = await self._cached(
+                (utils.get_chat_id(message), None),
+                functools.partial(self._fetch_participants, message),
+            )
 
-            if not participant:
+            if not (participant := participants.get(user_id)):
                 return
 
             if (
@@ -629,4 +855,13 @@ class SecurityManager:
 
         return False
 
+    async def _fetch_participants(
+        self,
+        message: Message,
+    ) -> typing.Dict[int, typing.Any]:
+        full_chat = await message.client(GetFullChatRequest(message.chat_id))
+        return self._map_participants(
+            getattr(full_chat.full_chat.participants, "participants", [])
+        )
+
     _check = check  # Legacy
@@ -5,9 +5,8 @@
 # 🔑 https://www.gnu.org/licenses/agpl-3.0.html
 
 import copy
-import inspect
 import logging
-import time
+import sys
 import typing
 
 from legacytl import TelegramClient
@@ -29,6 +28,8 @@ from legacytl.tl.types import (
 )
 from legacytl.utils import is_list_like
 
+from ._cache import BoundedCache, NegativeRecord
+from ._context import get_current_module, tag_client
 from .types import (
     CacheRecordEntity,
     CacheRecordFullChannel,
@@ -39,6 +40,10 @@ from .types import (
 
 logger = logging.getLogger(__name__)
 
+ENTITY_CACHE_SIZE = 10000
+PERMS_CACHE_SIZE = 10000
+FULL_CACHE_SIZE = 1000
+
 
 def hashable(value: typing.Any) -> bool:
     """
@@ -59,27 +64,13 @@ class CustomTelegramClient(TelegramClient):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self._legacy_entity_cache: typing.Dict[
-            typing.Union[str, int],
-            CacheRecordEntity,
-        ] = {}
-
-        self._legacy_perms_cache: typing.Dict[
-            typing.Union[str, int],
-            CacheRecordPerms,
-        ] = {}
-
-        self._legacy_fullchannel_cache: typing.Dict[
-            typing.Union[str, int],
-            CacheRecordFullChannel,
-        ] = {}
+        self._legacy_entity_cache = BoundedCache(ENTITY_CACHE_SIZE)
+        # Keyed by `(entity, user)` pairs
+        self._legacy_perms_cache = BoundedCache(PERMS_CACHE_SIZE)
+        self._legacy_fullchannel_cache = BoundedCache(FULL_CACHE_SIZE)
+        self._legacy_fulluser_cache = BoundedCache(FULL_CACHE_SIZE)
 
-        self._legacy_fulluser_cache: typing.Dict[
-            typing.Union[str, int],
-            CacheRecordFullUser,
-        ] = {}
-
-        self._forbidden_constructors: typing.List[int] = []
+        self._forbidden_constructors: typing.FrozenSet[int] = frozenset()
 
         self._raw_updates_processor: typing.Optional[
             typing.Callable[
@@ -103,34 +94,48 @@ class CustomTelegramClient(TelegramClient):
         self._raw_updates_processor = value
 
     @property
-    def legacy_entity_cache(self) -> typing.Dict[int, CacheRecordEntity]:
+    def legacy_entity_cache(self) -> BoundedCache:
         return self._legacy_entity_cache
 
     @property
-    def legacy_perms_cache(self) -> typing.Dict[int, CacheRecordPerms]:
+    def legacy_perms_cache(self) -> BoundedCache:
         return self._legacy_perms_cache
 
     @property
-    def legacy_fullchannel_cache(self) -> typing.Dict[int, CacheRecordFullChannel]:
+    def legacy_fullchannel_cache(self) -> BoundedCache:
         return self._legacy_fullchannel_cache
 
     @property
-    def legacy_fulluser_cache(self) -> typing.Dict[int, CacheRecordFullUser]:
+    def legacy_fulluser_cache(self) -> BoundedCache:
         return self._legacy_fulluser_cache
 
+    def cache_stats(self) -> typing.Dict[str, typing.Dict[str, int]]:
+        """
+        Get statistics of entity caches
+        :return: Hits, misses, evictions and size of each cache
+        """
+        return {
+            "entity": self._legacy_entity_cache.stats(),
+            "perms": self._legacy_perms_cache.stats(),
+            "fullchannel": self._legacy_fullchannel_cache.stats(),
+            "fulluser": self._legacy_fulluser_cache.stats(),
+        }
+
     @property
-    def forbidden_constructors(self) -> typing.List[str]:
+    def forbidden_constructors(self) -> typing.FrozenSet[int]:
         return self._forbidden_constructors
 
     async def force_get_entity(self, *args, **kwargs):
         """Forcefully makes a request to Telegram to get the entity."""
         return await self.get_entity(*args, force=True, **kwargs)
 
+    @tag_client(lambda self: self.tg_id)
     async def get_entity(
         self,
         entity: EntityLike,
         exp: int = 5 * 60,
         force: bool = False,
+        negative_exp: int = 0,
     ):
         """
         Gets the entity and cache it
@@ -138,13 +143,10 @@ class CustomTelegramClient(TelegramClient):
         :param entity: Entity to fetch
         :param exp: Expiration time of the cache record and maximum time of already cached record
         :param force: Whether to force refresh the cache (make API request)
+        :param negative_exp: If set, failed lookup is cached for this amount of seconds,
+            and cached failure is raised instead of making API request. Ignored if `exp` is 0
         :return: :obj:`Entity`
         """
-
-        # Will be used to determine, which client caused logging messages
-        # parsed via inspect.stack()
-        _legacy_client_id_logging_tag = copy.copy(self.tg_id)  # noqa: F841
-
         if not hashable(entity):
             try:
                 hashable_entity = next(
@@ -164,43 +166,58 @@ class CustomTelegramClient(TelegramClient):
         if str(hashable_entity).isdigit() and int(hashable_entity) < 0:
             hashable_entity = int(str(hashable_entity)[4:])
 
-        if (
-            not force
-            and hashable_entity
-            and hashable_entity in self._legacy_entity_cache
-            and (
-                not exp
-                or self._legacy_entity_cache[hashable_entity].ts + exp > time.time()
-            )
-        ):
-            logger.debug(
-                "Using cached entity %s (%s)",
-                entity,
-                type(self._legacy_entity_cache[hashable_entity].entity).__name__,
-            )
-            return copy.deepcopy(self._legacy_entity_cache[hashable_entity].entity)
+        negative_exp = negative_exp if exp else 0
+        if not force and hashable_entity:
+            cache_record = self._legacy_entity_cache.get(hashable_entity, exp)
+            if isinstance(cache_record, NegativeRecord):
+                if negative_exp:
+                    logger.debug("Entity %s is cached as unresolvable", entity)
+                    raise cache_record.exception
 
-        resolved_entity = await super().get_entity(entity)
+                # Caller didn't opt in, so entity is requested again
+                cache_record = None
+
+            if cache_record:
+                logger.debug(
+                    "Using cached entity %s (%s)",
+                    entity,
+                    type(cache_record.entity).__name__,
+                )
+                # Cached object is shared, so caller gets its own shallow copy
+                return copy.copy(cache_record.entity)
+
+        try:
+            resolved_entity = await super().get_entity(entity)
+        except ValueError as e:
+            if hashable_entity and negative_exp:
+                self._legacy_entity_cache.set_negative(hashable_entity, e, negative_exp)
+
+            raise
 
         if resolved_entity:
             cache_record = CacheRecordEntity(hashable_entity, resolved_entity, exp)
-            self._legacy_entity_cache[hashable_entity] = cache_record
+            self._legacy_entity_cache.set(hashable_entity, cache_record, exp)
             logger.debug("Saved hashable_entity %s to cache", hashable_entity)
 
             if getattr(resolved_entity, "id", None):
                 logger.debug("Saved resolved_entity id %s to cache", resolved_entity.id)
-                self._legacy_entity_cache[resolved_entity.id] = cache_record
+                self._legacy_entity_cache.set(resolved_entity.id, cache_record, exp)
 
             if getattr(resolved_entity, "username", None):
                 logger.debug(
                     "Saved resolved_entity username @%s to cache",
                     resolved_entity.username,
                 )
-                self._legacy_entity_cache[f"@{resolved_entity.username}"] = cache_record
-                self._legacy_entity_cache[resolved_entity.username] = cache_record
+                self._legacy_entity_cache.set(
+                    f"@{resolved_entity.username}", cache_record, exp
+                )
+                self._legacy_entity_cache.set(
+                    resolved_entity.username, cache_record, exp
+                )
 
-        return copy.deepcopy(resolved_entity)
+        return copy.copy(resolved_entity)
 
+    @tag_client(lambda self: self.tg_id)
     async def get_perms_cached(
         self,
         entity: EntityLike,
@@ -217,11 +234,6 @@ class CustomTelegramClient(TelegramClient):
         :param force: Whether to force refresh the cache (make API request)
         :return: :obj:`ChatPermissions`
         """
-
-        # Will be used to determine, which client caused logging messages
-        # parsed via inspect.stack()
-        _legacy_client_id_logging_tag = copy.copy(self.tg_id)  # noqa: F841
-
         entity = await self.get_entity(entity)
         user = await self.get_entity(user) if user else None
 
@@ -265,17 +277,15 @@ class CustomTelegramClient(TelegramClient):
             not force
             and hashable_entity
             and hashable_user
-            and hashable_user in self._legacy_perms_cache.get(hashable_entity, {})
             and (
-                not exp
-                or self._legacy_perms_cache[hashable_entity][hashable_user].ts + exp
-                > time.time()
+                cache_record := self._legacy_perms_cache.get(
+                    (hashable_entity, hashable_user),
+                    exp,
+                )
             )
         ):
             logger.debug("Using cached perms %s (%s)", hashable_entity, hashable_user)
-            return copy.deepcopy(
-                self._legacy_perms_cache[hashable_entity][hashable_user].perms
-            )
+            return copy.copy(cache_record.perms)
 
         resolved_perms = await self.get_permissions(entity, user)
 
@@ -286,23 +296,28 @@ class CustomTelegramClient(TelegramClient):
                 resolved_perms,
                 exp,
             )
-            self._legacy_perms_cache.setdefault(hashable_entity, {})[
-                hashable_user
-            ] = cache_record
+            self._legacy_perms_cache.set(
+                (hashable_entity, hashable_user),
+                cache_record,
+                exp,
+            )
             logger.debug("Saved hashable_entity %s perms to cache", hashable_entity)
 
             def save_user(key: typing.Union[str, int]):
-                nonlocal self, cache_record, user, hashable_user
                 if getattr(user, "id", None):
-                    self._legacy_perms_cache.setdefault(key, {})[user.id] = cache_record
+                    self._legacy_perms_cache.set((key, user.id), cache_record, exp)
 
                 if getattr(user, "username", None):
-                    self._legacy_perms_cache.setdefault(key, {})[
-                        f"@{user.username}"
-                    ] = cache_record
-                    self._legacy_perms_cache.setdefault(key, {})[
-                        user.username
-                    ] = cache_record
+                    self._legacy_perms_cache.set(
+                        (key, f"@{user.username}"),
+                        cache_record,
+                        exp,
+                    )
+                    self._legacy_perms_cache.set(
+                        (key, user.username),
+                        cache_record,
+                        exp,
+                    )
 
             if getattr(entity, "id", None):
                 logger.debug("Saved resolved_entity id %s perms to cache", entity.id)
@@ -316,7 +331,7 @@ class CustomTelegramClient(TelegramClient):
                 save_user(f"@{entity.username}")
                 save_user(entity.username)
 
-        return copy.deepcopy(resolved_perms)
+        return copy.copy(resolved_perms)
 
     async def get_fullchannel(
         self,
@@ -354,18 +369,15 @@ class CustomTelegramClient(TelegramClient):
         if str(hashable_entity).isdigit() and int(hashable_entity) < 0:
             hashable_entity = int(str(hashable_entity)[4:])
 
-        if (
-            not force
-            and self._legacy_fullchannel_cache.get(hashable_entity)
-            and not self._legacy_fullchannel_cache[hashable_entity].expired
-            and self._legacy_fullchannel_cache[hashable_entity].ts + exp > time.time()
+        if not force and (
+            cache_record := self._legacy_fullchannel_cache.get(hashable_entity, exp)
         ):
-            return self._legacy_fullchannel_cache[hashable_entity].full_channel
+            return cache_record.full_channel
 
         result = await self._call(self._sender, GetFullChannelRequest(channel=entity))
-        self._legacy_fullchannel_cache[hashable_entity] = CacheRecordFullChannel(
+        self._legacy_fullchannel_cache.set(
             hashable_entity,
-            result,
+            CacheRecordFullChannel(hashable_entity, result, exp),
             exp,
         )
         return result
@@ -406,18 +418,15 @@ class CustomTelegramClient(TelegramClient):
         if str(hashable_entity).isdigit() and int(hashable_entity) < 0:
             hashable_entity = int(str(hashable_entity)[4:])
 
-        if (
-            not force
-            and self._legacy_fulluser_cache.get(hashable_entity)
-            and not self._legacy_fulluser_cache[hashable_entity].expired
-            and self._legacy_fulluser_cache[hashable_entity].ts + exp > time.time()
+        if not force and (
+            cache_record := self._legacy_fulluser_cache.get(hashable_entity, exp)
         ):
-            return self._legacy_fulluser_cache[hashable_entity].full_user
+            return cache_record.full_user
 
         result = await self._call(self._sender, GetFullUserRequest(entity))
-        self._legacy_fulluser_cache[hashable_entity] = CacheRecordFullUser(
+        self._legacy_fulluser_cache.set(
             hashable_entity,
-            result,
+            CacheRecordFullUser(hashable_entity, result, exp),
             exp,
         )
         return result
@@ -447,34 +456,19 @@ class CustomTelegramClient(TelegramClient):
         # I hope, you understood me.
         # Thank you
 
-        not_tuple = False
+        forbidden = self._forbidden_constructors
         if not is_list_like(request):
-            not_tuple = True
-            request = (request,)
+            if request.CONSTRUCTOR_ID in forbidden and self._is_external_call():
+                self._log_protected(request)
+                return
+
+            return await super()._call(sender, request, ordered, flood_sleep_threshold)
 
         new_request = []
 
         for item in request:
-            if item.CONSTRUCTOR_ID in self._forbidden_constructors and next(
-                (
-                    frame_info.frame.f_locals["self"]
-                    for frame_info in inspect.stack()
-                    if hasattr(frame_info, "frame")
-                    and hasattr(frame_info.frame, "f_locals")
-                    and isinstance(frame_info.frame.f_locals, dict)
-                    and "self" in frame_info.frame.f_locals
-                    and isinstance(frame_info.frame.f_locals["self"], Module)
-                    and not getattr(
-                        frame_info.frame.f_locals["self"], "__origin__", ""
-                    ).startswith("<core")
-                ),
-                None,
-            ):
-                logger.debug(
-                    "🎉 I protected you from unintented %s (%s)!",
-                    item.__class__.__name__,
-                    item,
-                )
+            if item.CONSTRUCTOR_ID in forbidden and self._is_external_call():
+                self._log_protected(item)
                 continue
 
             new_request += [item]
@@ -484,19 +478,50 @@ class CustomTelegramClient(TelegramClient):
 
         return await super()._call(
             sender,
-            new_request[0] if not_tuple else tuple(new_request),
+            tuple(new_request),
             ordered,
             flood_sleep_threshold,
         )
 
+    @staticmethod
+    def _is_external_module(module: typing.Any) -> bool:
+        return isinstance(module, Module) and not getattr(
+            module, "__origin__", ""
+        ).startswith("<core")
+
+    def _is_external_call(self) -> bool:
+        """Whether the current code is run by non-core module"""
+        if self._is_external_module(get_current_module()):
+            return True
+
+        # Core modules call external code too (e.g. `on_unload`, config
+        # validators, watchers), and some code is not attributed to any
+        # module (e.g. form buttons callbacks), so it's checked by walking
+        # the stack
+        frame = sys._getframe(1)
+        while frame:
+            if self._is_external_module(frame.f_locals.get("self")):
+                return True
+
+            frame = frame.f_back
+
+        return False
+
+    @staticmethod
+    def _log_protected(request: TLRequest):
+        logger.debug(
+            "🎉 I protected you from unintented %s (%s)!",
+            request.__class__.__name__,
+            request,
+        )
+
     def forbid_constructor(self, constructor: int):
         """
         Forbids the given constructor to be called
 
         :param constructor: Constructor id to forbid
         """
-        self._forbidden_constructors.extend([constructor])
-        self._forbidden_constructors = list(set(self._forbidden_constructors))
+        self._forbidden_constructors = self._forbidden_constructors | {constructor}
 
     def forbid_constructors(self, constructors: list):
         """
@@ -505,7 +530,7 @@ class CustomTelegramClient(TelegramClient):
 
         :param constructors: Constructor ids to forbid
         """
-        self._forbidden_constructors = list(set(constructors))
+        self._forbidden_constructors = frozenset(constructors)
 
     def _handle_update(
         self: "CustomTelegramClient",
@@ -6,8 +6,8 @@
 
 import ujson
 import logging
+import sys
 import typing
-import inspect
 from pathlib import Path
 
 import requests
@@ -38,6 +38,9 @@ def fmt(text: str, kwargs: dict) -> str:
 
 
 class BaseTranslator:
+    # Bumped whenever translations are reloaded
+    version = 0
+
     def _get_pack_content(
         self,
         pack: Path,
@@ -152,6 +155,7 @@ class Translator(BaseTranslator):
                     PACKS / f"{language}.yml"
                 )
 
+        self.version += 1
         return any_
 
 
@@ -180,53 +184,108 @@ class Strings:
             logger.debug("Module %s got empty translator %s", mod, translator)
 
         self._base_strings = mod.strings  # Back 'em up, bc they will get replaced
-        self.external_strings = {}
-
-    def get(self, key: str, lang: typing.Optional[str] = None) -> str:
-        try:
-            return self._translator.raw_data[lang][f"{self._mod.__module__}.{key}"]
-        except KeyError:
-            return self[key]
-
-    def __getitem__(self, key: str) -> str:
-
-        stack = inspect.stack()
-        caller_frame = stack[1]
-        if caller_frame.function == "__call__":
-            caller_frame = stack[2]
+        self._external_strings = {}
+        # language setting -> precompiled lookup table
+        self._tables: typing.Dict[str, typing.Dict[str, str]] = {}
+
+    @property
+    def external_strings(self) -> dict:
+        return self._external_strings
+
+    @external_strings.setter
+    def external_strings(self, value: dict):
+        self._external_strings = value
+        self.invalidate()
+
+    def invalidate(self):
+        """Drop precompiled tables, e.g. when translations are reloaded"""
+        self._tables = {}
+        if self._translator is not None:
+            self._translator.version += 1
+
+    def _get_langs(self) -> str:
+        return (
+            self._translator.db.get(__name__, "lang", "en")
+            if self._translator is not None
+            else ""
+        )
 
+    def _resolve(self, key: str, langs: typing.List[str]) -> typing.Optional[str]:
         return (
-            self.external_strings.get(key, None)
+            self._external_strings.get(key, None)
             or (
                 self._translator.getkey(f"{self._mod.__module__}.{key}")
                 if self._translator is not None
                 else False
             )
             or (
-                getattr(
-                    self._mod,
-                    next(
-                        (
-                            f"strings_{lang}"
-                            for lang in self._translator.db.get(
-                                __name__,
-                                "lang",
-                                "en",
-                            ).split(" ")
-                            if hasattr(self._mod, f"strings_{lang}")
-                            and isinstance(getattr(self._mod, f"strings_{lang}"), dict)
-                            and key in getattr(self._mod, f"strings_{lang}")
-                        ),
-                        utils.rand(32),
+                next(
+                    (
+                        getattr(self._mod, f"strings_{lang}")
+                        for lang in langs
+                        if isinstance(getattr(self._mod, f"strings_{lang}", None), dict)
+                        and key in getattr(self._mod, f"strings_{lang}")
                     ),
                     self._base_strings,
                 )
                 if self._translator is not None
                 else self._base_strings
-            ).get(
-                key,
-                self._base_strings.get(key, f"Unknown string: \"{key}\" at ({caller_frame.function}:{caller_frame.lineno})"),
+            ).get(key, self._base_strings.get(key))
+        )
+
+    def build(self) -> typing.Dict[str, str]:
+        """
+        Precompile lookup table for the current language setting
+        :return: Table of all known strings of the module
+        """
+        langs = self._get_langs()
+        split = langs.split(" ")
+        keys = {*self._base_strings, *self._external_strings}
+        for lang in split:
+            if isinstance(strings := getattr(self._mod, f"strings_{lang}", None), dict):
+                keys.update(strings)
+
+        if self._translator is not None:
+            prefix = f"{self._mod.__module__}."
+            keys.update(
+                key[len(prefix) :]
+                for key in self._translator._data
+                if key.startswith(prefix)
             )
+
+        self._tables[langs] = table = {
+            key: value
+            for key in keys
+            if (value := self._resolve(key, split)) is not None
+        }
+        return table
+
+    def get(self, key: str, lang: typing.Optional[str] = None) -> str:
+        try:
+            return self._translator.raw_data[lang][f"{self._mod.__module__}.{key}"]
+        except KeyError:
+            return self[key]
+
+    def __getitem__(self, key: str) -> str:
+        if (table := self._tables.get(self._get_langs())) is None:
+            table = self.build()
+
+        if (value := table.get(key)) is not None:
+            return value
+
+        # Strings could have been added after the table was built
+        if (value := self._resolve(key, self._get_langs().split(" "))) is not None:
+            table[key] = value
+            return value
+
+        # Caller location is only needed to report the missing string
+        caller_frame = sys._getframe(1)
+        if caller_frame.f_code.co_name == "__call__":
+            caller_frame = caller_frame.f_back
+
+        return (
+            f'Unknown string: "{key}" at'
+            f" ({caller_frame.f_code.co_name}:{caller_frame.f_lineno})"
         )
 
     def __call__(
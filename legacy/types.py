@@ -8,7 +8,6 @@
 import ast
 import asyncio
 import contextlib
-import copy
 import importlib
 import importlib.machinery
 import importlib.util
@@ -18,6 +17,7 @@ import os
 import sys
 import time
 import typing
+import weakref
 from dataclasses import dataclass, field
 from importlib.abc import SourceLoader
 
@@ -33,6 +33,8 @@ from legacytl.tl.types import (
     UserFull,
 )
 
+from ._bytecode_cache import compile_cached
+from ._context import tag_client
 from ._reference_finder import replace_all_refs
 from .inline.types import (
     BotInlineCall,
@@ -54,6 +56,8 @@ __all__ = [
     "get_commands",
     "get_inline_handlers",
     "get_callback_handlers",
+    "scan_members",
+    "clear_handlers_cache",
     "BotInlineCall",
     "BotMessage",
     "InlineCall",
@@ -75,6 +79,11 @@ LegacyReplyMarkup = typing.Union[
 ListLike = typing.Union[list, set, tuple]
 Command = typing.Callable[..., typing.Awaitable[typing.Any]]
 
+# class -> predicate key -> names of matching class attributes
+_members_cache: typing.MutableMapping[
+    type, typing.Dict[typing.Hashable, typing.Tuple[str, ...]]
+] = weakref.WeakKeyDictionary()
+
 
 class StringLoader(SourceLoader):
     """Load a python module/file from a string"""
@@ -88,7 +97,7 @@ class StringLoader(SourceLoader):
 
     def get_code(self, fullname: str) -> bytes:
         return (
-            compile(source, self.origin, "exec", dont_inherit=True)
+            compile_cached(source, self.origin)
             if (source := self.get_data(fullname))
             else None
         )
@@ -178,27 +187,27 @@ class Module:
     @property
     def commands(self) -> typing.Dict[str, Command]:
         """List of commands that module supports"""
-        return get_commands(self)
+        return _get_cached_handlers(self, get_commands)
 
     @property
     def inline_handlers(self) -> typing.Dict[str, Command]:
         """List of inline handlers that module supports"""
-        return get_inline_handlers(self)
+        return _get_cached_handlers(self, get_inline_handlers)
 
     @property
     def callback_handlers(self) -> typing.Dict[str, Command]:
         """List of callback handlers that module supports"""
-        return get_callback_handlers(self)
+        return _get_cached_handlers(self, get_callback_handlers)
 
     @property
     def watchers(self) -> typing.Dict[str, Command]:
         """List of watchers that module supports"""
-        return get_watchers(self)
+        return _get_cached_handlers(self, get_watchers)
 
     @property
     def legacy_watchers(self) -> typing.Dict[str, Command]:
         """List of watchers that module supports"""
-        return get_watchers(self)
+        return _get_cached_handlers(self, get_watchers)
 
     @commands.setter
     def commands(self, _):
@@ -220,6 +229,28 @@ class Module:
     def legacy_watchers(self, _):
         pass
 
+    def _get_raw_attribute(self, name: str) -> typing.Any:
+        # Properties are not evaluated, they are never handlers
+        return (
+            self.__dict__[name]
+            if name in self.__dict__
+            else getattr(type(self), name, None)
+        )
+
+    def __setattr__(self, name: str, value: typing.Any):
+        # Handlers can be added, replaced or shadowed at runtime
+        if callable(value) or callable(self._get_raw_attribute(name)):
+            clear_handlers_cache(self)
+
+        super().__setattr__(name, value)
+
+    def __delattr__(self, name: str):
+        if callable(self._get_raw_attribute(name)):
+            clear_handlers_cache(self)
+
+        super().__delattr__(name)
+
+    @tag_client(lambda self: self.client.tg_id)
     async def animate(
         self,
         message: typing.Union[Message, InlineMessage],
@@ -235,15 +266,11 @@ class Module:
         :param interval: Animation delay
         :param inline: Whether to use inline bot for animation
         :returns message:
-
         Please, note that if you set `inline=True`, first frame will be shown with an empty
         button due to the limitations of Telegram API
         """
         from . import utils
 
-        with contextlib.suppress(AttributeError):
-            _legacy_client_id_logging_tag = copy.copy(self.client.tg_id)  # noqa: F841
-
         if interval < 0.1:
             logger.warning(
                 "Resetting animation interval to 0.1s, because it may get you in"
@@ -899,6 +926,47 @@ class ConfigValue:
                 syncwrap(self.on_change)
 
 
+def scan_members(
+    obj: typing.Any,
+    key: typing.Hashable,
+    predicate: typing.Callable[[str, typing.Any], bool],
+) -> typing.Dict[str, typing.Any]:
+    """
+    Get attributes of object, which satisfy predicate. Class attributes are
+    scanned once per class, so only their values on the instance and instance
+    attributes are checked each time
+    :param obj: Object or class to scan
+    :param key: Unique key of predicate, used to cache the scan results
+    :param predicate: Receives attribute name and value
+    :return: Mapping of attribute name to its value, taken from `obj`
+    """
+    cls = obj if isinstance(obj, type) else type(obj)
+    cache = _members_cache.setdefault(cls, {})
+    if (names := cache.get(key)) is None:
+        names = cache[key] = tuple(
+            name
+            for name in dir(cls)
+            if not isinstance(value := getattr(cls, name, None), property)
+            and predicate(name, value)
+        )
+
+    if isinstance(obj, type):
+        return {name: getattr(obj, name) for name in names}
+
+    # Instance attribute can shadow class one with something, which doesn't
+    # match anymore (e.g. `None`)
+    members = {
+        name: value
+        for name in names
+        if predicate(name, value := getattr(obj, name, None))
+    }
+    members.update(
+        {name: value for name, value in vars(obj).items() if predicate(name, value)}
+    )
+
+    return members
+
+
 def _get_members(
     mod: Module,
     ending: str,
@@ -906,23 +974,41 @@ def _get_members(
     strict: bool = False,
 ) -> dict:
     """Get method of module, which end with ending"""
+
+    def matches(method_name: str) -> bool:
+        return method_name == ending if strict else method_name.endswith(ending)
+
     return {
         (
             method_name.rsplit(ending, maxsplit=1)[0]
-            if (method_name == ending if strict else method_name.endswith(ending))
+            if matches(method_name)
             else method_name
-        ).lower(): getattr(mod, method_name)
-        for method_name in dir(mod)
-        if not isinstance(getattr(type(mod), method_name, None), property)
-        and callable(getattr(mod, method_name))
-        and (
-            (method_name == ending if strict else method_name.endswith(ending))
-            or attribute
-            and getattr(getattr(mod, method_name), attribute, False)
-        )
+        ).lower(): method
+        for method_name, method in scan_members(
+            mod,
+            ("handlers", ending, attribute, strict),
+            lambda name, value: callable(value)
+            and (matches(name) or attribute and getattr(value, attribute, False)),
+        ).items()
     }
 
 
+def _get_cached_handlers(
+    mod: Module,
+    getter: typing.Callable[[Module], dict],
+) -> dict:
+    cache = mod.__dict__.setdefault("_legacy_handlers_cache", {})
+    if getter not in cache:
+        cache[getter] = getter(mod)
+
+    return cache[getter]
+
+
+def clear_handlers_cache(mod: Module):
+    """Make module handlers to be looked up again on the next access"""
+    mod.__dict__.pop("_legacy_handlers_cache", None)
+
+
 class CacheRecordEntity:
     def __init__(
         self,
@@ -930,8 +1016,8 @@ class CacheRecordEntity:
         resolved_entity: EntityLike,
         exp: int,
     ):
-        self.entity = copy.deepcopy(resolved_entity)
-        self._hashable_entity = copy.deepcopy(hashable_entity)
+        self.entity = resolved_entity
+        self._hashable_entity = hashable_entity
         self._exp = round(time.time() + exp)
         self.ts = time.time()
 
@@ -963,9 +1049,9 @@ class CacheRecordPerms:
         resolved_perms: EntityLike,
         exp: int,
     ):
-        self.perms = copy.deepcopy(resolved_perms)
-        self._hashable_entity = copy.deepcopy(hashable_entity)
-        self._hashable_user = copy.deepcopy(hashable_user)
+        self.perms = resolved_perms
+        self._hashable_entity = hashable_entity
+        self._hashable_user = hashable_user
         self._exp = round(time.time() + exp)
         self.ts = time.time()
 
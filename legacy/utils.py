@@ -55,6 +55,7 @@ from legacytl.tl.functions.channels import (
     CreateChannelRequest,
     EditAdminRequest,
     EditPhotoRequest,
+    GetChannelsRequest,
     InviteToChannelRequest,
     GetForumTopicsByIDRequest,
     CreateForumTopicRequest,
@@ -68,8 +69,10 @@ from legacytl.tl.functions.messages import (
 )
 from legacytl.tl.types import (
     Channel,
+    ChannelForbidden,
     Chat,
     ChatAdminRights,
+    InputChannel,
     InputDocument,
     InputMediaWebPage,
     InputPeerNotifySettings,
@@ -785,6 +788,136 @@ async def invite_inline_bot(
         )
 
 
+# Resolved service chats are kept in memory for this amount of seconds.
+# After that, they are checked again by their saved ID and access hash
+ASSET_CHANNEL_TTL = 60 * 60
+ASSET_CHANNEL_PREFIX = "legacy-"
+_ASSET_CHANNELS_OWNER = "legacy.asset_channels"
+
+
+def _get_saved_asset_channels(client: CustomTelegramClient) -> dict:
+    db = getattr(client, "legacy_db", None)
+    return db.get(_ASSET_CHANNELS_OWNER, "channels", {}) if db is not None else {}
+
+
+def _save_asset_channels(
+    client: CustomTelegramClient,
+    peers: typing.Dict[str, typing.Optional[Channel]],
+):
+    """Save IDs and access hashes of service chats. `None` removes the chat"""
+    for title, peer in peers.items():
+        if peer is None:
+            client._channels_cache.pop(title, None)
+        else:
+            client._channels_cache[title] = {
+                "peer": peer,
+                "exp": time.time() + ASSET_CHANNEL_TTL,
+            }
+
+    if (db := getattr(client, "legacy_db", None)) is None:
+        return
+
+    saved = dict(_get_saved_asset_channels(client))
+    for title, peer in peers.items():
+        if peer is None or getattr(peer, "access_hash", None) is None:
+            saved.pop(title, None)
+        else:
+            saved[title] = {"id": peer.id, "access_hash": peer.access_hash}
+
+    db.set(_ASSET_CHANNELS_OWNER, "channels", saved)
+
+
+def _is_asset_channel(peer: typing.Any, channel: typing.Optional[bool]) -> bool:
+    """
+    Whether the chat can be used as service chat. Only chats, created by
+    the user, are used, so a joined chat with the same title is ignored
+    :param channel: Whether broadcast channel or supergroup is expected.
+        If `None`, any of them is accepted
+    """
+    return (
+        isinstance(peer, Channel)
+        and bool(peer.creator)
+        and (channel is None or bool(peer.broadcast) == channel)
+    )
+
+
+async def _restore_asset_channel(
+    client: CustomTelegramClient,
+    title: str,
+    channel: bool,
+) -> typing.Optional[Channel]:
+    """Get saved service chat, if it's still accessible"""
+    if not (saved := _get_saved_asset_channels(client).get(title)):
+        return None
+
+    try:
+        peer = (
+            await client(
+                GetChannelsRequest([InputChannel(saved["id"], saved["access_hash"])])
+            )
+        ).chats[0]
+    except Exception:
+        logger.debug("Saved chat %s is not accessible", title, exc_info=True)
+        peer = None
+
+    if (
+        isinstance(peer, ChannelForbidden)
+        or getattr(peer, "left", True)
+        or not _is_asset_channel(peer, channel)
+    ):
+        _save_asset_channels(client, {title: None})
+        return None
+
+    _save_asset_channels(client, {title: peer})
+    return peer
+
+
+async def _discover_asset_channels(
+    client: CustomTelegramClient,
+    title: str,
+    channel: bool,
+) -> typing.Optional[Channel]:
+    """
+    Find service chat in dialogs. All other service chats, found on the way,
+    are saved too, so they don't need dialogs to be iterated again
+    """
+    found = {}
+    async for d in client.iter_dialogs():
+        if d.title in found:
+            continue
+
+        if d.title == title:
+            if _is_asset_channel(d.entity, channel):
+                found[d.title] = d.entity
+        elif d.title.startswith(ASSET_CHANNEL_PREFIX) and _is_asset_channel(
+            d.entity,
+            None,
+        ):
+            # Expected type is checked when the chat is restored
+            found[d.title] = d.entity
+
+    if found:
+        _save_asset_channels(client, found)
+
+    return found.get(title)
+
+
+def _get_cached_asset_channel(
+    client: CustomTelegramClient,
+    title: str,
+    channel: bool,
+) -> typing.Optional[Channel]:
+    if (
+        (record := client._channels_cache.get(title))
+        and record["exp"] > time.time()
+        # Chats, found in dialogs, are cached regardless of their type
+        and _is_asset_channel(record["peer"], channel)
+    ):
+        return record["peer"]
+
+    return None
+
+
 async def asset_channel(
     client: CustomTelegramClient,
     title: str,
@@ -817,12 +950,7 @@ async def asset_channel(
     """
     if not hasattr(client, "_channels_cache"):
         client._channels_cache = {}
-
-    if (
-        title in client._channels_cache
-        and client._channels_cache[title]["exp"] > time.time()
-    ):
-        return client._channels_cache[title]["peer"], False
+        client._channels_lock = asyncio.Lock()
 
     # legacytl heroku / hikka chats conversion to legacy
     if title.startswith("hikka-"):
@@ -830,21 +958,62 @@ async def asset_channel(
     if title.startswith("heroku-"):
         title = title.replace("heroku-", "legacy-")
 
-    async for d in client.iter_dialogs():
-        if d.title == title:
-            client._channels_cache[title] = {"peer": d.entity, "exp": int(time.time())}
-            if invite_bot:
-                if all(
-                    participant.id != client.loader.inline.bot_id
-                    for participant in await client.get_participants(
-                        d.entity, limit=100
-                    )
-                ):
-                    await fw_protect()
-                    await invite_inline_bot(client, d.entity)
+    if (peer := _get_cached_asset_channel(client, title, channel)) is not None:
+        return peer, False
+
+    # Concurrent calls wait for the running lookup or creation, so neither
+    # dialogs are iterated twice, nor the same chat is created twice
+    async with client._channels_lock:
+        if (peer := _get_cached_asset_channel(client, title, channel)) is not None:
+            return peer, False
 
-            return d.entity, False
+        peer = await _restore_asset_channel(client, title, channel)
+        if peer is None:
+            peer = await _discover_asset_channels(client, title, channel)
+
+        if peer is None:
+            peer = await _create_asset_channel(
+                client,
+                title,
+                description,
+                channel=channel,
+                silent=silent,
+                archive=archive,
+                invite_bot=invite_bot,
+                avatar=avatar,
+                ttl=ttl,
+                forum=forum,
+                hide_general=hide_general,
+                _folder=_folder,
+            )
+            return peer, True
 
+    if invite_bot:
+        if all(
+            participant.id != client.loader.inline.bot_id
+            for participant in await client.get_participants(peer, limit=100)
+        ):
+            await fw_protect()
+            await invite_inline_bot(client, peer)
+
+    return peer, False
+
+
+async def _create_asset_channel(
+    client: CustomTelegramClient,
+    title: str,
+    description: str,
+    *,
+    channel: bool,
+    silent: bool,
+    archive: bool,
+    invite_bot: bool,
+    avatar: typing.Optional[str],
+    ttl: typing.Optional[int],
+    forum: bool,
+    hide_general: bool,
+    _folder: typing.Optional[str],
+) -> Channel:
     await fw_protect()
 
     peer = (
@@ -909,8 +1078,8 @@ async def asset_channel(
                 )
             )
 
-    client._channels_cache[title] = {"peer": peer, "exp": int(time.time())}
-    return peer, True
+    _save_asset_channels(client, {title: peer})
+    return peer
 
 
 if typing.TYPE_CHECKING:
@@ -0,0 +1,23 @@
+from legacy import _bytecode_cache
+
+
+def test_directory_is_scanned_only_over_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(_bytecode_cache, "_cache_dir", lambda: tmp_path)
+    monkeypatch.setattr(_bytecode_cache, "_cache_size", None)
+    monkeypatch.setattr(_bytecode_cache, "MAX_CACHE_SIZE", 20000)
+    scans = []
+    evict = _bytecode_cache._evict
+    monkeypatch.setattr(
+        _bytecode_cache,
+        "_evict",
+        lambda cache_dir: scans.append(cache_dir) or evict(cache_dir),
+    )
+
+    for i in range(200):
+        code = _bytecode_cache.compile_cached(f"x = {i}\n".encode() * 50, "<test>")
+        assert code.co_filename == "<test>"
+
+    size = sum(file.stat().st_size for file in tmp_path.glob("*.pyc"))
+    assert size <= 20000
+    assert _bytecode_cache._cache_size == size
+    assert len(scans) < 200 // 5
@@ -0,0 +1,65 @@
+import os
+
+import ujson
+
+from legacy._db_backends import JournalBackend, JSONBackend, SQLiteBackend, migrate
+
+
+def _blobs(db: dict) -> dict:
+    return {
+        owner: {key: ujson.dumps(value) for key, value in keys.items()}
+        for owner, keys in db.items()
+    }
+
+
+def _save(backend, db: dict):
+    backend.write(backend.prepare([], _blobs(db), True))
+
+
+def test_journal_to_json_keeps_uncompacted_entries(tmp_path):
+    journal = JournalBackend(tmp_path, 1)
+    _save(journal, {"mod": {"a": 1}})
+    journal.write(
+        journal.prepare([("mod", "b", "2")], _blobs({"mod": {"a": 1}}), False)
+    )
+    assert journal.load() == {"mod": {"a": 1, "b": 2}}
+
+    json = JSONBackend(tmp_path, 1)
+    assert migrate(json) == {"mod": {"a": 1, "b": 2}}
+    assert json.load() == {"mod": {"a": 1, "b": 2}}
+    assert not (tmp_path / "config-1.journal").exists()
+    assert (tmp_path / "config-1.journal.migrated").exists()
+
+    assert migrate(JSONBackend(tmp_path, 1)) is None
+
+
+def test_json_sqlite_json_round_trip(tmp_path):
+    _save(JSONBackend(tmp_path, 1), {"mod": {"a": 1}})
+
+    sqlite = SQLiteBackend(tmp_path, 1)
+    assert migrate(sqlite) == {"mod": {"a": 1}}
+    assert not (tmp_path / "config-1.json").exists()
+    assert (tmp_path / "config-1.json.migrated").exists()
+
+    sqlite.write(sqlite.prepare([("mod", "a", "2")], {}, False))
+    sqlite.close()
+
+    json = JSONBackend(tmp_path, 1)
+    assert migrate(json) == {"mod": {"a": 2}}
+    assert json.load() == {"mod": {"a": 2}}
+    assert not (tmp_path / "config-1.db").exists()
+    assert (tmp_path / "config-1.db.migrated").exists()
+
+    assert migrate(JSONBackend(tmp_path, 1)) is None
+
+
+def test_newest_source_wins(tmp_path):
+    _save(JSONBackend(tmp_path, 1), {"mod": {"a": "json"}})
+    os.utime(tmp_path / "config-1.json", (1, 1))
+
+    sqlite = SQLiteBackend(tmp_path, 1)
+    _save(sqlite, {"mod": {"a": "sqlite"}})
+    sqlite.close()
+
+    # Leftover json file is older than the sqlite database
+    assert migrate(JSONBackend(tmp_path, 1)) == {"mod": {"a": "sqlite"}}
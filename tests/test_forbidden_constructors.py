@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("legacytl")
+
+from legacytl.tl.functions.channels import JoinChannelRequest  # noqa: E402
+from legacytl.tl.types import InputChannel  # noqa: E402
+
+from legacy._context import module_context  # noqa: E402
+from legacy.tl_cache import CustomTelegramClient  # noqa: E402
+from legacy.types import Module  # noqa: E402
+
+
+class CoreMod(Module):
+    __origin__ = "<core>"
+
+
+class ExternalMod(Module):
+    __origin__ = "<file>"
+
+    def __init__(self, client):
+        self._client = client
+
+    async def on_unload(self):
+        return await self._client._call(
+            None,
+            JoinChannelRequest(InputChannel(1, 1)),
+        )
+
+
+def _client() -> CustomTelegramClient:
+    client = CustomTelegramClient.__new__(CustomTelegramClient)
+    client._forbidden_constructors = frozenset({JoinChannelRequest.CONSTRUCTOR_ID})
+    return client
+
+
+def test_external_code_is_detected_in_core_context():
+    client = _client()
+    external = ExternalMod(client)
+
+    async def unload():
+        # Core module calls external one, e.g. in `Modules.unload_module`
+        with module_context(CoreMod.__new__(CoreMod)):
+            return await external.on_unload()
+
+    # Request is dropped instead of being sent through the missing sender
+    assert asyncio.run(unload()) is None
+
+
+def test_external_context_is_trusted_without_stack():
+    client = _client()
+
+    async def check():
+        with module_context(ExternalMod(client)):
+            return client._is_external_call()
+
+    assert asyncio.run(check())
@@ -0,0 +1,103 @@
+import types
+
+import pytest
+
+help_module = pytest.importorskip("legacy.modules.help")
+translations = pytest.importorskip("legacy.translations")
+
+
+class FakeDB(dict):
+    def __init__(self):
+        super().__init__()
+        self._versions = {}
+
+    def get(self, owner, key, default=None):
+        return super().get(owner, {}).get(key, default)
+
+    def set(self, owner, key, value):
+        self.setdefault(owner, {})[key] = value
+        self._versions[owner] = self._versions.get(owner, 0) + 1
+
+    def version(self, owner):
+        return 0, self._versions.get(owner, 0)
+
+
+def _help(db: FakeDB):
+    mod = help_module.Help.__new__(help_module.Help)
+    mod._db = db
+    mod.config = {
+        "core_emoji": "",
+        "plain_emoji": "",
+        "empty_emoji": "",
+        "desc_icon": "",
+        "expandable": True,
+        "show_cmds": True,
+    }
+    mod.translator = translations.ExternalTranslator()
+    mod.inline = types.SimpleNamespace(bot_username="bot")
+    mod.allmodules = types.SimpleNamespace(
+        handlers=types.SimpleNamespace(version=1),
+        modules=[],
+    )
+    mod._client = types.SimpleNamespace(
+        dispatcher=types.SimpleNamespace(
+            security=types.SimpleNamespace(owner=[1], version=0)
+        )
+    )
+    mod.lookup = lambda _: types.SimpleNamespace(fully_loaded=True)
+    return mod
+
+
+def _message(**kwargs):
+    return types.SimpleNamespace(
+        **{
+            "sender_id": 1,
+            "out": True,
+            "is_channel": False,
+            "chat_id": -100500,
+            **kwargs,
+        }
+    )
+
+
+def test_language_switch_changes_key():
+    db = FakeDB()
+    mod = _help(db)
+    key = mod._get_help_cache_key(_message(), [], False, False, False)
+    assert key == mod._get_help_cache_key(_message(), [], False, False, False)
+
+    db.set(translations.__name__, "lang", "ru")
+    switched = mod._get_help_cache_key(_message(), [], False, False, False)
+    assert switched != key
+
+    # Module translations were reloaded without changing the setting
+    mod.translator.version += 1
+    assert mod._get_help_cache_key(_message(), [], False, False, False) != switched
+
+
+def test_owner_scope_depends_on_chat_lists():
+    db = FakeDB()
+    mod = _help(db)
+    key = mod._get_help_cache_key(_message(), [], False, False, False)
+
+    db.set("legacy.main", "blacklist_chats", [500])
+    blacklisted = mod._get_help_cache_key(_message(), [], False, False, False)
+    assert blacklisted != key
+    assert blacklisted[0] == ("owner", 500)
+
+
+def test_owner_key_ignores_participant_changes():
+    mod = _help(FakeDB())
+    owner = mod._get_help_cache_key(_message(), [], False, False, False)
+    user = mod._get_help_cache_key(
+        _message(sender_id=2, out=False), [], False, False, False
+    )
+
+    mod._client.dispatcher.security.version += 1
+    assert mod._get_help_cache_key(_message(), [], False, False, False) == owner
+    assert (
+        mod._get_help_cache_key(
+            _message(sender_id=2, out=False), [], False, False, False
+        )
+        != user
+    )
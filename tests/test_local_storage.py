@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("legacytl")
+
+import ujson  # noqa: E402
+
+from legacy import _local_storage  # noqa: E402
+from legacy._local_storage import INDEX_FILE, LocalStorage  # noqa: E402
+
+
+def _index(path) -> dict:
+    return ujson.loads((path / INDEX_FILE).read_text())
+
+
+def test_storage_is_shared_per_directory(tmp_path):
+    assert LocalStorage.get(str(tmp_path)) is LocalStorage.get(str(tmp_path))
+
+
+def test_other_process_entries_are_kept(tmp_path):
+    first, second = LocalStorage(str(tmp_path)), LocalStorage(str(tmp_path))
+    first.save("repo", "a", "a = 1")
+    second.save("repo", "b", "b = 1")
+    first.save("repo", "c", "c = 1")
+
+    assert set(_index(tmp_path)) == {
+        first._get_name("repo", name) for name in ("a", "b", "c")
+    }
+
+
+def test_access_times_are_saved_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(_local_storage, "INDEX_SAVE_DELAY", 0)
+    storage = LocalStorage(str(tmp_path))
+    storage.save("repo", "a", "a = 1")
+    saves = []
+    monkeypatch.setattr(storage, "_save_index", lambda: saves.append(1))
+
+    async def main():
+        for _ in range(10):
+            assert storage.fetch("repo", "a") == "a = 1"
+
+        await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert saves == [1]
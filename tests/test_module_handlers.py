@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("legacytl")
+
+from legacy.types import Module  # noqa: E402
+
+
+class Mod(Module):
+    async def pingcmd(self, message):
+        pass
+
+    async def pongcmd(self, message):
+        pass
+
+
+def test_shadowed_handler_is_not_returned():
+    mod = Mod()
+    assert set(mod.commands) == {"ping", "pong"}
+
+    mod.pongcmd = None
+    assert set(mod.commands) == {"ping"}
+    assert set(Mod().commands) == {"ping", "pong"}
+
+
+def test_handlers_registered_at_runtime_are_found():
+    mod = Mod()
+    assert "dyn" not in mod.commands
+
+    async def dyncmd(message):
+        pass
+
+    mod.dyncmd = dyncmd
+    assert mod.commands["dyn"] is dyncmd
+
+    async def handler(message):
+        pass
+
+    handler.is_command = True
+    mod.extra = handler
+    assert mod.commands["extra"] is handler
+
+    del mod.dyncmd
+    assert "dyn" not in mod.commands
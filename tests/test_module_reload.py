@@ -0,0 +1,90 @@
+import asyncio
+import types
+
+import pytest
+
+pytest.importorskip("legacytl")
+
+from legacy._registry import HandlerRegistry  # noqa: E402
+from legacy.loader import Modules  # noqa: E402
+from legacy.types import Module, SelfSuspend  # noqa: E402
+
+
+class Mod(Module):
+    __origin__ = "<file>"
+    suspend = False
+
+    async def client_ready(self):
+        if self.suspend:
+            raise SelfSuspend()
+
+    async def pingcmd(self, message):
+        pass
+
+    async def watcher(self, message):
+        pass
+
+    async def ping_inline_handler(self, query):
+        pass
+
+    async def ping_callback_handler(self, call):
+        pass
+
+
+def _modules() -> Modules:
+    modules = Modules.__new__(Modules)
+    modules._registry = HandlerRegistry()
+    modules.commands_version = modules.watchers_version = 0
+    modules._core_commands = []
+    modules.modules = []
+    modules.aliases = {}
+    modules.allclients = []
+    modules.client = types.SimpleNamespace(
+        tg_id=1,
+        dispatcher=types.SimpleNamespace(raw_handlers=[]),
+    )
+    modules.db = modules._db = None
+    modules.inline = None
+    return modules
+
+
+def _bound_to(modules: Modules, instance: Module) -> list:
+    snapshot = modules.handlers
+    return [
+        handler
+        for handler in (
+            *snapshot.commands.values(),
+            *snapshot.inline_handlers.values(),
+            *snapshot.callback_handlers.values(),
+            *snapshot.watchers,
+        )
+        if getattr(handler, "__self__", None) is instance
+    ]
+
+
+async def _load(modules: Modules, instance: Module, **kwargs):
+    await modules.complete_registration(instance)
+    await modules.send_ready_one(instance, **kwargs)
+
+
+@pytest.mark.parametrize("suspend", [False, True])
+def test_reload_drops_handlers_of_old_instance(suspend):
+    modules = _modules()
+    old = Mod()
+    asyncio.run(_load(modules, old))
+    assert len(_bound_to(modules, old)) == 4
+
+    new = Mod()
+    new.suspend = suspend
+
+    async def reload():
+        try:
+            # Same as `.dlm`
+            await _load(modules, new, no_self_unload=True)
+        except SelfSuspend:
+            pass
+
+    asyncio.run(reload())
+    assert not _bound_to(modules, old)
+    assert modules.modules == [new]
+    assert len(_bound_to(modules, new)) == (0 if suspend else 4)
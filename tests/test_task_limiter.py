@@ -0,0 +1,61 @@
+import asyncio
+
+from legacy._task_limiter import TaskLimiter
+
+
+def test_command_runs_despite_watcher_flood():
+    async def main():
+        limiter = TaskLimiter(global_limit=4, module_limit=2, queue_size=8)
+        release = asyncio.Event()
+        command_ran = asyncio.Event()
+
+        async def watcher():
+            await release.wait()
+
+        async def command():
+            command_ran.set()
+
+        for _ in range(100):
+            limiter.submit("Mod", watcher)
+
+        assert limiter.stats()["Mod"]["dropped"] == 100 - 2 - 8
+        assert limiter.submit("Mod", command, priority=True)
+
+        await asyncio.wait_for(command_ran.wait(), 1)
+        release.set()
+
+    asyncio.run(main())
+
+
+def test_command_runs_when_global_limit_is_saturated():
+    async def main():
+        limiter = TaskLimiter(global_limit=4, module_limit=4, queue_size=8)
+        release = asyncio.Event()
+        order = []
+
+        async def watcher():
+            await release.wait()
+            order.append("watcher")
+
+        async def command():
+            order.append("command")
+
+        # Hung watchers of several modules take all global slots
+        for module in ("Mod", "Other"):
+            for _ in range(6):
+                limiter.submit(module, watcher)
+
+        assert sum(stats["running"] for stats in limiter.stats().values()) == 4
+        assert limiter.submit("Loader", command, priority=True)
+        await asyncio.sleep(0)
+        assert order == ["command"]
+
+        # Command didn't take a slot of the watchers
+        assert limiter.stats()["Loader"]["running"] == 0
+        release.set()
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+        assert order.count("watcher") == 12
+
+    asyncio.run(main())